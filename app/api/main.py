@@ -1,19 +1,187 @@
-from fastapi import FastAPI, HTTPException, Depends
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from datetime import datetime
-from typing import Dict
+from typing import Dict, List, Optional
 import uuid
-import json
-import redis
 
+from app.chatbot.analytics import AnalyticsStore, SessionAnalytics
+from app.chatbot.backend.workers import close_model_workers
+from app.chatbot.chatbot_local import NegotiationBot
+from app.chatbot.http_client import create_async_client
+from app.chatbot.history import history_prompt, session_window
+from app.chatbot.llm_router import BackendPool, parse_endpoints
+from app.chatbot.streaming import TurnMetrics, sse_event
 from app.core.config import settings
-from app.db.redis_connection import get_redis
-from app.models.models import NegotiationParameters, NegotiationSession
+from app.db.codecs import get_codec
+from app.db.redis_connection import create_storage_backend, close_storage_backend
+from app.db.session_cache import SessionCache
+from app.db.session_store import SessionStore, SessionNotFoundError, VersionConflictError, get_session_store
+from app.models.models import (
+    NegotiationParameters, NegotiationParametersPatch, NegotiationSession, ChatTurn, SessionSummary,
+    BulkFetchRequest, BulkMessagesItem, BulkItemResult, SessionAnalyticsSummary
+)
 
-app = FastAPI(title=settings.app_name)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One connection pool per Redis node and worker process, shared by every request
+    app.state.storage = create_storage_backend(settings)
+    app.state.redis = app.state.storage.nodes[0]  # the only node unless REDIS_BACKEND=sharded
+    app.state.session_cache = None
+    if settings.session_cache != "off":
+        app.state.session_cache = SessionCache(
+            max_sessions=settings.session_cache_size,
+            max_messages=settings.session_cache_max_messages,
+            ttl=settings.session_cache_ttl,
+            mode=settings.session_cache
+        )
+        await app.state.session_cache.start(app.state.storage)
+    app.state.session_store = SessionStore(app.state.storage, settings.session_ttl, codec=get_codec(settings.session_codec), cache=app.state.session_cache)
+    app.state.analytics_store = AnalyticsStore(app.state.storage, settings.session_ttl)
+    app.state.backend_pool = None
+    if settings.ollama_hosts:
+        app.state.backend_pool = BackendPool(
+            parse_endpoints(settings.ollama_hosts, settings.ollama_port),
+            max_concurrency=settings.ollama_max_concurrency,
+            failure_threshold=settings.ollama_failure_threshold,
+            ejection_seconds=settings.ollama_ejection_seconds,
+            health_check_interval=settings.ollama_health_check_interval
+        )
+        app.state.backend_pool.start_health_checks()
+    # Stateless use only (astream_reply), so one bot serves every session
+    app.state.bot = NegotiationBot(
+        model_host=settings.ollama_host,
+        model_port=settings.ollama_port,
+        model=settings.ollama_model,
+        backend_pool=app.state.backend_pool
+    )
+    app.state.http_client = create_async_client()
+    if settings.warmup_on_startup:
+        await asyncio.to_thread(app.state.bot.warmup)
+    try:
+        yield
+    finally:
+        if app.state.backend_pool:
+            app.state.backend_pool.stop()
+        await app.state.http_client.aclose()
+        close_model_workers()
+        if app.state.session_cache:
+            await app.state.session_cache.stop()
+        await close_storage_backend(app.state.storage)
+
+
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
+
+EXPECTED_VERSION = Query(None, description="Only apply the change if the session is still at this version")
+
+
+async def get_analytics_store(request: Request) -> AnalyticsStore:
+    return request.app.state.analytics_store
+
+
+def session_not_found():
+    return HTTPException(status_code=404, detail="Negotiation session not found")
+
+
+def version_conflict():
+    return HTTPException(status_code=409, detail="Negotiation session was modified concurrently")
+
+
+def check_bulk_size(items: List):
+    if len(items) > settings.bulk_max_items:
+        raise HTTPException(status_code=413, detail=f"At most {settings.bulk_max_items} items per bulk request")
+
+
+async def record_appended(app: FastAPI, appended: List[tuple]):
+    """Fold user messages appended over REST into their sessions' analytics.
+
+    Runs as a background task after the response is sent: analysis goes through
+    the bot's cache, so a client that already analysed the text (the remote bot)
+    costs a cache hit. `appended` is [(session_id, messages)].
+    """
+    bot: NegotiationBot = app.state.bot
+    for session_id, messages in appended:
+        for message in messages:
+            content = message.get("content")
+            if message.get("role") != "user" or not isinstance(content, str):
+                continue
+            try:
+                analysis = await asyncio.to_thread(bot.enrich_with_analysis, content)
+                await app.state.analytics_store.record(session_id, analysis.get("emotions", []), analysis.get("entities"))
+            except Exception as e:
+                # Derived data: the messages are already stored, so a failure here is only logged
+                print(f"Recording analytics for {session_id} failed: {e}")
+
+
+# ----------------------------------------
+# Bulk endpoints (declared before /{session_id} routes so "bulk" isn't read as an id)
+# ----------------------------------------
+
+@app.post("/bulk", response_model=List[NegotiationSession])
+async def create_negotiations(parameters: List[NegotiationParameters], store: SessionStore = Depends(get_session_store)):
+    check_bulk_size(parameters)
+    timestamp = datetime.now().isoformat()
+
+    sessions = [
+        NegotiationSession(
+            session_id=str(uuid.uuid4()),
+            parameters=params,
+            messages=[],
+            created_at=timestamp,
+            updated_at=timestamp
+        )
+        for params in parameters
+    ]
+
+    await store.create_many(sessions)
+    return sessions
+
+
+@app.post("/bulk/fetch", response_model=List[BulkItemResult])
+async def get_negotiations(request: BulkFetchRequest, store: SessionStore = Depends(get_session_store)):
+    check_bulk_size(request.session_ids)
+    sessions = await store.get_many(request.session_ids, request.offset, request.limit)
+
+    response = []
+    for session_id in request.session_ids:
+        session = sessions[session_id]
+        if session:
+            response.append(BulkItemResult(session_id=session_id, status="ok", version=session.version, session=session))
+        else:
+            response.append(BulkItemResult(session_id=session_id, status="not_found"))
+    return response
+
+
+@app.post("/bulk/messages", response_model=List[BulkItemResult])
+async def add_messages_bulk(items: List[BulkMessagesItem], request: Request, background_tasks: BackgroundTasks, store: SessionStore = Depends(get_session_store)):
+    check_bulk_size(items)
+    results = await store.append_many(
+        [(item.session_id, item.messages, item.expected_version) for item in items],
+        datetime.now().isoformat()
+    )
+
+    response = []
+    for item, result in zip(items, results):
+        if isinstance(result, SessionNotFoundError):
+            response.append(BulkItemResult(session_id=item.session_id, status="not_found"))
+        elif isinstance(result, VersionConflictError):
+            response.append(BulkItemResult(session_id=item.session_id, status="conflict"))
+        else:
+            response.append(BulkItemResult(session_id=item.session_id, status="ok", version=result))
+    appended = [(item.session_id, item.messages) for item, result in zip(items, results) if not isinstance(result, Exception)]
+    background_tasks.add_task(record_appended, request.app, appended)
+    return response
+
+
+# ----------------------------------------
+# Single-session endpoints
+# ----------------------------------------
 
 
 @app.post("/", response_model=NegotiationSession)
-def create_negotiation(parameters: NegotiationParameters, redis_client: redis.Redis = Depends(get_redis)):
+async def create_negotiation(parameters: NegotiationParameters, store: SessionStore = Depends(get_session_store)):
     session_id = str(uuid.uuid4())
     timestamp = datetime.now().isoformat()
 
@@ -25,51 +193,223 @@ def create_negotiation(parameters: NegotiationParameters, redis_client: redis.Re
         updated_at=timestamp
     )
 
-    redis_client.setex(f"negotiation:{session_id}", settings.session_ttl, json.dumps(session.dict()))
+    await store.create(session)
     return session
 
 
 @app.get("/{session_id}", response_model=NegotiationSession)
-def get_negotiation(session_id: str, redis_client: redis.Redis = Depends(get_redis)):
-    session_data = redis_client.get(f"negotiation:{session_id}")
+async def get_negotiation(
+    session_id: str,
+    offset: int = Query(0, description="First message to return; negative values count from the newest"),
+    limit: Optional[int] = Query(None, ge=1, description="Page size, all remaining messages if omitted"),
+    store: SessionStore = Depends(get_session_store)
+):
+    session = await store.get(session_id, offset, limit)
 
-    if not session_data: raise HTTPException(status_code=404, detail="Negotiation session not found")
+    if not session: raise session_not_found()
 
-    return NegotiationSession(**json.loads(session_data))
+    return session
 
 
 @app.post("/{session_id}/messages")
-def add_message(session_id: str, message: Dict, redis_client: redis.Redis = Depends(get_redis)):
-    session_data = redis_client.get(f"negotiation:{session_id}")
-    if not session_data:
-        raise HTTPException(status_code=404, detail="Negotiation session not found")
+async def add_message(
+    session_id: str,
+    message: Dict,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    expected_version: Optional[int] = EXPECTED_VERSION,
+    store: SessionStore = Depends(get_session_store)
+):
+    try:
+        version = await store.append_message(session_id, message, datetime.now().isoformat(), expected_version)
+    except SessionNotFoundError:
+        raise session_not_found()
+    except VersionConflictError:
+        raise version_conflict()
+
+    background_tasks.add_task(record_appended, request.app, [(session_id, [message])])
+    return {"message": "Message added successfully", "version": version}
+
 
-    session = NegotiationSession(**json.loads(session_data))
-    session.messages.append(message)
-    session.updated_at = datetime.now().isoformat()
+@app.post("/{session_id}/messages/batch")
+async def add_messages(
+    session_id: str,
+    messages: List[Dict],
+    request: Request,
+    background_tasks: BackgroundTasks,
+    expected_version: Optional[int] = EXPECTED_VERSION,
+    store: SessionStore = Depends(get_session_store)
+):
+    """Append several messages, in order, in one atomic write"""
+    check_bulk_size(messages)
+    if not messages:
+        raise HTTPException(status_code=422, detail="No messages to add")
+    try:
+        version = await store.append_messages(session_id, messages, datetime.now().isoformat(), expected_version)
+    except SessionNotFoundError:
+        raise session_not_found()
+    except VersionConflictError:
+        raise version_conflict()
 
-    redis_client.setex(f"negotiation:{session_id}", settings.session_ttl, json.dumps(session.dict()))
-    return {"message": "Message added successfully"}
+    background_tasks.add_task(record_appended, request.app, [(session_id, messages)])
+    return {"message": f"{len(messages)} messages added successfully", "version": version}
 
 
 @app.put("/{session_id}/parameters")
-def update_parameters(session_id: str, parameters: NegotiationParameters, redis_client: redis.Redis = Depends(get_redis)):
-    session_data = redis_client.get(f"negotiation:{session_id}")
-    if not session_data:
-        raise HTTPException(status_code=404, detail="Negotiation session not found")
+async def update_parameters(session_id: str, parameters: NegotiationParameters, expected_version: Optional[int] = EXPECTED_VERSION, store: SessionStore = Depends(get_session_store)):
+    try:
+        version = await store.update_parameters(session_id, parameters, datetime.now().isoformat(), expected_version)
+    except SessionNotFoundError:
+        raise session_not_found()
+    except VersionConflictError:
+        raise version_conflict()
+
+    return {"message": "Parameters updated successfully", "version": version}
+
+
+@app.patch("/{session_id}/parameters")
+async def patch_parameters(session_id: str, changes: NegotiationParametersPatch, expected_version: Optional[int] = EXPECTED_VERSION, store: SessionStore = Depends(get_session_store)):
+    try:
+        parameters, version = await store.patch_parameters(
+            session_id, changes.model_dump(exclude_unset=True), datetime.now().isoformat(), expected_version
+        )
+    except SessionNotFoundError:
+        raise session_not_found()
+    except VersionConflictError:
+        raise version_conflict()
+
+    return {"message": "Parameters updated successfully", "parameters": parameters, "version": version}
 
-    session = NegotiationSession(**json.loads(session_data))
-    session.parameters = parameters
-    session.updated_at = datetime.now().isoformat()
 
-    redis_client.setex(f"negotiation:{session_id}", settings.session_ttl, json.dumps(session.dict()))
-    return {"message": "Parameters updated successfully"}
+@app.put("/{session_id}/summary")
+async def save_summary(session_id: str, summary: SessionSummary, store: SessionStore = Depends(get_session_store)):
+    """Store a client's running summary (multi-turn mode); ignored if a newer one is already stored"""
+    try:
+        saved = await store.save_summary(session_id, summary.summary, summary.summarized_count)
+    except SessionNotFoundError:
+        raise session_not_found()
+
+    return {"message": "Summary saved" if saved else "A newer summary is already stored", "saved": saved}
+
+@app.get("/{session_id}/analytics", response_model=SessionAnalyticsSummary)
+async def get_negotiation_analytics(session_id: str, store: SessionStore = Depends(get_session_store), analytics_store: AnalyticsStore = Depends(get_analytics_store)):
+    analytics = await analytics_store.get(session_id)
+    if analytics is None:
+        if not await store.exists(session_id):
+            raise session_not_found()
+        analytics = SessionAnalytics()  # no turns analyzed yet
+    return SessionAnalyticsSummary(session_id=session_id, **analytics.as_dict())
+
 
 @app.delete("/{session_id}")
-def delete_negotiation(session_id: str, redis_client: redis.Redis = Depends(get_redis)):
-    if not redis_client.exists(f"negotiation:{session_id}"):
-        raise HTTPException(status_code=404, detail="Negotiation session not found")
+async def delete_negotiation(session_id: str, store: SessionStore = Depends(get_session_store)):
+    if not await store.delete(session_id):
+        raise session_not_found()
 
-    redis_client.delete(f"negotiation:{session_id}")
     return {"message": "Negotiation session deleted successfully"}
 
+
+# ----------------------------------------
+# Streaming chat (SSE / WebSocket)
+# ----------------------------------------
+
+async def load_history(store: SessionStore, session_id: str, parameters: NegotiationParameters) -> List[Dict]:
+    """Multi-turn mode: the stored summary plus the newest turns within the token budget.
+
+    Only messages not yet summarized are read; turns pushed out of the window are
+    folded into the summary and saved, so each message is summarized once.
+    Raises SessionNotFoundError if the session is gone.
+    """
+    stored = await store.get_history(session_id)
+    if stored is None:
+        raise SessionNotFoundError(session_id)
+    summary, summarized_count, messages = stored
+    window = session_window(messages, summary, summarized_count, parameters.model_dump())
+    if window.evicted:
+        await store.save_summary(session_id, window.summary.as_dict(), window.summarized_count)
+    return history_prompt(window)
+
+
+async def run_turn(app: FastAPI, session_id: str, parameters: NegotiationParameters, content: str):
+    """Stream one turn as ("token", data) events, then persist both messages and emit ("done", data)"""
+    store: SessionStore = app.state.session_store
+    bot: NegotiationBot = app.state.bot
+    metrics = TurnMetrics()
+    # Model analysis (in a worker thread) overlaps the history read. Its result is used for
+    # both the prompt and the analytics: a degraded analysis isn't cached, so recomputing
+    # it would wait out the stage deadlines again.
+    analysis_task = asyncio.create_task(asyncio.to_thread(bot.enrich_with_analysis, content))
+    try:
+        history = await load_history(store, session_id, parameters) if settings.prompt_history_messages else None
+    except SessionNotFoundError:
+        # Deleted (or expired) since its parameters were read: don't generate a reply for it
+        analysis_task.cancel()
+        yield "error", {"detail": "Negotiation session not found"}
+        return
+    analysis = await analysis_task
+    tokens = []
+    async for token in bot.astream_reply(content, parameters.model_dump(), metrics, client=app.state.http_client, history=history, analysis=analysis):
+        tokens.append(token)
+        yield "token", {"token": token}
+
+    reply = bot.extract_reply("".join(tokens))
+    try:
+        version = await store.append_messages(
+            session_id,
+            [{"role": "user", "content": content}, {"role": "assistant", "content": reply}],
+            datetime.now().isoformat()
+        )
+    except SessionNotFoundError:
+        yield "error", {"detail": "Negotiation session not found"}
+        return
+
+    await app.state.analytics_store.record(session_id, analysis.get("emotions", []), analysis.get("entities"))
+
+    turn_metrics = metrics.finish()
+    print(
+        f"[turn {session_id}] ttft={turn_metrics['ttft_ms']}ms total={turn_metrics['total_ms']}ms tokens={turn_metrics['tokens']} "
+        f"prompt_tokens={turn_metrics['prompt_tokens']} completion_tokens={turn_metrics['completion_tokens']}"
+    )
+    yield "done", {"reply": reply, "version": version, "metrics": turn_metrics}
+
+
+@app.post("/{session_id}/chat/stream")
+async def stream_chat(session_id: str, turn: ChatTurn, request: Request, store: SessionStore = Depends(get_session_store)):
+    parameters = await store.get_parameters(session_id)
+    if parameters is None:
+        raise session_not_found()
+
+    async def events():
+        async for event, data in run_turn(request.app, session_id, parameters, turn.content):
+            yield sse_event(event, data)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.websocket("/{session_id}/ws")
+async def chat_websocket(websocket: WebSocket, session_id: str):
+    store: SessionStore = websocket.app.state.session_store
+
+    if await store.get_parameters(session_id) is None:
+        await websocket.close(code=4404, reason="Negotiation session not found")
+        return
+
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_json()
+            content = message.get("content") if isinstance(message, dict) else None
+            if not content:
+                await websocket.send_json({"type": "error", "detail": "Expected {\"content\": \"...\"}"})
+                continue
+
+            # Re-read every turn: parameters may have been updated in between
+            parameters = await store.get_parameters(session_id)
+            if parameters is None:
+                await websocket.close(code=4404, reason="Negotiation session not found")
+                return
+
+            async for event, data in run_turn(websocket.app, session_id, parameters, content):
+                await websocket.send_json({"type": event, **data})
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,135 @@
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Union
+
+from app.chatbot.backend.emotion_agent import format_emotion_summary
+from app.chatbot.backend.finance_agent import format_entity_summary
+
+if TYPE_CHECKING:
+    from redis import asyncio as aioredis
+
+    from app.db.backends import StorageBackend
+
+# ==================================================
+# PER-SESSION ANALYTICS (incremental emotion / entity state)
+# ==================================================
+# Each user message adds its detections to compact per-session counters, so a
+# session summary never needs its history re-analyzed. In Redis the counters
+# live in one hash next to the session:
+#   negotiation:{<id>}:analytics
+#     messages                      HINCRBY
+#     emotion_count:<label>         HINCRBY
+#     emotion_conf:<label>          HINCRBYFLOAT  (running mean = conf / count)
+#     entity:<category>:<text>      HINCRBY
+
+MESSAGES_FIELD = "messages"
+EMOTION_COUNT = "emotion_count:"
+EMOTION_CONF = "emotion_conf:"
+ENTITY = "entity:"
+
+
+class SessionAnalytics:
+    def __init__(self):
+        self.messages = 0
+        self.emotion_counts = defaultdict(int)
+        self.emotion_confidences = defaultdict(float)   # summed, divide by count for the mean
+        self.entity_counts = defaultdict(lambda: defaultdict(int))
+
+    def record(self, emotions: Iterable[Dict] = (), entities: Optional[Dict[str, List[Dict]]] = None):
+        """Fold one message's detections in: O(detections), independent of history length"""
+        self.messages += 1
+        for emotion in emotions:
+            self.emotion_counts[emotion['emotion']] += 1
+            self.emotion_confidences[emotion['emotion']] += emotion['confidence']
+        for category, items in (entities or {}).items():
+            for item in items:
+                self.entity_counts[category][item['text']] += 1
+
+    def emotion_means(self) -> Dict[str, float]:
+        return {label: self.emotion_confidences[label] / count for label, count in self.emotion_counts.items()}
+
+    def summarize_emotions(self) -> str:
+        return format_emotion_summary(self.emotion_counts, self.emotion_confidences)
+
+    def get_entity_summary(self) -> List[Dict]:
+        return format_entity_summary(self.entity_counts)
+
+    def as_dict(self) -> Dict:
+        return {
+            "messages": self.messages,
+            "emotions": {
+                label: {"count": count, "mean_confidence": round(self.emotion_confidences[label] / count, 4)}
+                for label, count in self.emotion_counts.items()
+            },
+            "entities": {category: dict(items) for category, items in self.entity_counts.items()},
+            "summary": self.summarize_emotions(),
+        }
+
+    @classmethod
+    def from_hash(cls, fields: Dict) -> "SessionAnalytics":
+        """Rebuild from an HGETALL reply (bytes or str keys)"""
+        analytics = cls()
+        for field, value in fields.items():
+            field = field.decode("utf-8") if isinstance(field, bytes) else field
+            value = value.decode("utf-8") if isinstance(value, bytes) else value
+            if field == MESSAGES_FIELD:
+                analytics.messages = int(value)
+            elif field.startswith(EMOTION_COUNT):
+                analytics.emotion_counts[field[len(EMOTION_COUNT):]] = int(value)
+            elif field.startswith(EMOTION_CONF):
+                analytics.emotion_confidences[field[len(EMOTION_CONF):]] = float(value)
+            elif field.startswith(ENTITY):
+                category, _, text = field[len(ENTITY):].partition(":")
+                analytics.entity_counts[category][text] = int(value)
+        return analytics
+
+
+class InMemoryAnalyticsStore:
+    """Process-local variant for the CLI bots"""
+
+    def __init__(self):
+        self.sessions: Dict[str, SessionAnalytics] = {}
+
+    def record(self, session_id: str, emotions: Iterable[Dict] = (), entities: Optional[Dict[str, List[Dict]]] = None):
+        self.sessions.setdefault(session_id, SessionAnalytics()).record(emotions, entities)
+
+    def get(self, session_id: str) -> Optional[SessionAnalytics]:
+        return self.sessions.get(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        return self.sessions.pop(session_id, None) is not None
+
+
+class AnalyticsStore:
+    """Redis variant: counters persisted next to the session, sharing its TTL.
+
+    The Redis modules are imported here rather than at the top, so the CLI bots
+    (InMemoryAnalyticsStore only) don't load them.
+    """
+
+    def __init__(self, storage: Union["aioredis.Redis", "StorageBackend"], ttl: int):
+        from app.db.backends import as_backend
+        self.backend = as_backend(storage)
+        self.ttl = ttl
+
+    async def record(self, session_id: str, emotions: Iterable[Dict] = (), entities: Optional[Dict[str, List[Dict]]] = None):
+        from app.db.session_store import analytics_key
+        key = analytics_key(session_id)
+        async with self.backend.node(session_id).pipeline(transaction=False) as pipe:
+            pipe.hincrby(key, MESSAGES_FIELD, 1)
+            for emotion in emotions:
+                pipe.hincrby(key, EMOTION_COUNT + emotion['emotion'], 1)
+                pipe.hincrbyfloat(key, EMOTION_CONF + emotion['emotion'], emotion['confidence'])
+            for category, items in (entities or {}).items():
+                for item in items:
+                    pipe.hincrby(key, f"{ENTITY}{category}:{item['text']}", 1)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def get(self, session_id: str) -> Optional[SessionAnalytics]:
+        from app.db.session_store import analytics_key
+        fields = await self.backend.node(session_id).hgetall(analytics_key(session_id))
+        return SessionAnalytics.from_hash(fields) if fields else None
+
+    async def delete(self, session_id: str) -> bool:
+        from app.db.session_store import analytics_key
+        return bool(await self.backend.node(session_id).delete(analytics_key(session_id)))
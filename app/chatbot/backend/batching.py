@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+# ==================================================
+# DYNAMIC MICRO-BATCHING
+# ==================================================
+
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_MAX_WAIT_MS = 5.0
+
+_STOP = object()
+
+
+class BatchScheduler:
+    """Collects concurrent single-item requests into one batched call.
+
+    The first request of a batch waits at most `max_wait_ms` for company; the
+    batch is flushed as soon as it reaches `max_batch_size`. `infer_fn` gets the
+    list of inputs and must return one result per input, in order.
+    """
+
+    def __init__(
+        self,
+        infer_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        name: str = "batch-scheduler"
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.infer_fn = infer_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+        # Simple counters, handy to check that batching actually happens
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item: Any) -> Future:
+        """Queue one input and return a future for its result"""
+        if self._closed:
+            raise RuntimeError("BatchScheduler is closed")
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Blocking helper: submit and wait for the result"""
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop the worker once the requests already queued have been served"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+    def _collect(self, first) -> Tuple[List, bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+            batch, stop = self._collect(entry)
+
+            # Futures cancelled while queued don't need a forward pass
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = self.infer_fn([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"infer_fn returned {len(results)} results for {len(batch)} inputs")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+def pipeline_batch_fn(pipe) -> Callable[[List[str]], List[Any]]:
+    """Wrap a HF pipeline so a list of texts runs as one padded batch"""
+    def infer(texts: List[str]) -> List[Any]:
+        return list(pipe(texts, batch_size=len(texts)))
+    return infer
+
+
+def gather(futures: List[Future]) -> Future:
+    """One future that resolves to the list of results, in order, once every input future is done"""
+    combined: Future = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def _done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            combined.set_result([f.result() for f in futures])
+        except Exception as e:
+            combined.set_exception(e)
+
+    if not futures:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(_done)
+    return combined
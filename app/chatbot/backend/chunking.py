@@ -0,0 +1,105 @@
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# ==================================================
+# SLIDING-WINDOW CHUNKING & LENGTH BUCKETING
+# ==================================================
+# Long inputs (pasted contracts, e-mails) are split into windows that fit the
+# model's max sequence length, overlapping by `stride` tokens so an entity cut
+# by one window boundary is whole in the next. Windows are cut on tokenizer
+# offsets, so every chunk is an exact slice of the original text.
+
+DEFAULT_STRIDE = 64
+FALLBACK_MAX_LENGTH = 512
+_UNSET_MAX_LENGTH = 100_000  # tokenizers without a limit report a huge sentinel
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int    # character offset in the original text
+    tokens: int   # window length in tokens, used as the aggregation weight
+
+
+def max_tokens_for(tokenizer, model=None, max_length: Optional[int] = None) -> int:
+    """Content tokens per window: the model limit minus the special tokens the tokenizer adds"""
+    limit = max_length or getattr(tokenizer, "model_max_length", None)
+    if not limit or limit > _UNSET_MAX_LENGTH:
+        config = getattr(model, "config", None)
+        limit = getattr(config, "max_position_embeddings", None) or FALLBACK_MAX_LENGTH
+    specials = tokenizer.num_special_tokens_to_add() if tokenizer is not None else 2
+    return limit - specials
+
+
+def split_text(text: str, tokenizer, max_tokens: int, stride: int = DEFAULT_STRIDE) -> List[Chunk]:
+    """Split text into overlapping token windows; short texts come back as a single chunk"""
+    # Every token covers at least one byte, so this skips tokenizing short texts
+    if tokenizer is None or not getattr(tokenizer, "is_fast", False) or len(text.encode("utf-8")) <= max_tokens:
+        return [Chunk(text, 0, len(text))]
+
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)["offset_mapping"]
+    if len(offsets) <= max_tokens:
+        return [Chunk(text, 0, len(offsets))]
+
+    chunks = []
+    step = max_tokens - min(stride, max_tokens // 2)  # windows must advance
+    for begin in range(0, len(offsets), step):
+        end = min(begin + max_tokens, len(offsets))
+        start_char, end_char = offsets[begin][0], offsets[end - 1][1]
+        chunks.append(Chunk(text[start_char:end_char], start_char, end - begin))
+        if end == len(offsets):
+            break
+    return chunks
+
+
+def length_buckets(lengths: Sequence[int], batch_size: int) -> List[List[int]]:
+    """Group indices into batches of similar length so little of each batch is padding"""
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def run_bucketed(infer_fn: Callable[[List[str]], List], texts: Sequence[str], batch_size: int) -> List:
+    """Run infer_fn over length-sorted batches and return the results in input order"""
+    results: List = [None] * len(texts)
+    for bucket in length_buckets([len(t) for t in texts], batch_size):
+        for index, result in zip(bucket, infer_fn([texts[i] for i in bucket])):
+            results[index] = result
+    return results
+
+
+def aggregate_chunk_scores(chunk_scores: List[List[Dict]], weights: Sequence[int]) -> List[Dict]:
+    """Token-weighted mean of each label's score over the chunks of one text"""
+    if len(chunk_scores) == 1:
+        return chunk_scores[0]
+    total = float(sum(weights))
+    sums: Dict[str, float] = {}
+    for scores, weight in zip(chunk_scores, weights):
+        for item in scores:
+            sums[item['label']] = sums.get(item['label'], 0.0) + item['score'] * weight
+    return [{'label': label, 'score': value / total} for label, value in sums.items()]
+
+
+def merge_entities(chunk_entities: List[Tuple[Chunk, List[Dict]]], text: str) -> List[Dict]:
+    """Shift chunk-relative NER spans to the full text and merge the duplicates from overlapping windows"""
+    spans = []
+    for chunk, entities in chunk_entities:
+        for entity in entities:
+            if entity.get('start') is None:
+                spans.append(dict(entity))  # no offsets to merge on
+                continue
+            spans.append({**entity, 'start': entity['start'] + chunk.start, 'end': entity['end'] + chunk.start})
+
+    positioned = sorted((s for s in spans if s.get('start') is not None), key=lambda s: (s['start'], -s['end']))
+    merged: List[Dict] = []
+    for span in positioned:
+        previous = merged[-1] if merged else None
+        if previous is None or span['start'] > previous['end']:
+            merged.append(span)
+        elif span.get('entity_group') == previous.get('entity_group'):
+            # Same entity seen by two windows (or split at a boundary): union the span
+            previous['end'] = max(previous['end'], span['end'])
+            previous['score'] = max(previous['score'], span['score'])
+            previous['word'] = text[previous['start']:previous['end']]
+        elif span['start'] < previous['end'] and span['score'] > previous['score']:
+            merged[-1] = span
+        elif span['start'] == previous['end']:
+            merged.append(span)
+    return merged + [s for s in spans if s.get('start') is None]
@@ -1,7 +1,17 @@
 from collections import defaultdict
-from typing import Optional, Callable
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Callable, Sequence, Tuple
 
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+
+from app.chatbot.backend.batching import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, gather
+from app.chatbot.backend.chunking import DEFAULT_STRIDE, aggregate_chunk_scores, max_tokens_for, run_bucketed, split_text
+from app.chatbot.backend.model_registry import registry, ModelRegistry
+from app.core.config import settings
+from app.core.lazy import LazyModule
+
+np = LazyModule("numpy")  # only needed by analyze_batch; keeps import time low
+
+DEFAULT_EMOTION_MODEL = "ayoubkirouane/BERT-Emotions-Classifier"
 
 # ==================================================
 # EMOTION IDENTIFICATION
@@ -9,28 +19,127 @@ from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassifica
 class EmotionAnalyzer:
     def __init__(
         self,
-        model_name: str = "ayoubkirouane/BERT-Emotions-Classifier",
+        model_name: str = DEFAULT_EMOTION_MODEL,
         confidence_threshold: float = 0.5,
-        pipeline_fn: Optional[Callable] = None
+        pipeline_fn: Optional[Callable] = None,
+        model_registry: Optional[ModelRegistry] = None,
+        batching: bool = False,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        engine: Optional[str] = None,
+        max_length: Optional[int] = None,
+        stride: int = DEFAULT_STRIDE
     ):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        # Weights, tokenizer and pipeline are shared process-wide; only the
+        # counters below belong to this analyzer instance.
+        self.engine = engine or settings.model_engine  # torch | torch-mmap | onnx | onnx-int8
+        shared = (model_registry or registry).get("text-classification", model_name, pipeline_fn, self.engine, return_all_scores=True)
+        self.tokenizer = shared.tokenizer
+        self.model = shared.model
+        self.emotion_pipeline = shared.pipeline
 
-        self.emotion_pipeline = (
-            pipeline_fn("text-classification", model=self.model, tokenizer=self.tokenizer, return_all_scores=True)
-            if pipeline_fn else
-            pipeline("text-classification", model=self.model, tokenizer=self.tokenizer, return_all_scores=True)
-        )
+        # With batching on, concurrent analyzers of the same model share forward passes
+        self.scheduler = shared.get_scheduler(max_batch_size, max_wait_ms) if batching else None
 
         self.confidence_threshold = confidence_threshold
+        self.max_batch_size = max_batch_size
+        # Texts longer than the model's window are scored in overlapping chunks
+        self.max_tokens = max_tokens_for(self.tokenizer, self.model, max_length)
+        self.stride = stride
         self.emotion_counts = defaultdict(int)
         self.emotion_confidences = defaultdict(float)   # To track total confidence per emotion
         self.labels = self.model.config.id2label.values()
+        # Column order of the analyze_batch score matrix
+        self.label_names = [label for _, label in sorted(self.model.config.id2label.items())]
+        self._label_index = {label: i for i, label in enumerate(self.label_names)}
 
     def analyze_text(self, text: str):
         """Analyze emotion of the given text"""
-        scores = self.emotion_pipeline(text)[0]
+        chunks = split_text(text, self.tokenizer, self.max_tokens, self.stride)
+        if len(chunks) > 1:
+            scores = self._infer([c.text for c in chunks])
+            return self._process_scores(aggregate_chunk_scores(scores, [c.tokens for c in chunks]))
+        if self.scheduler:
+            return self._process_scores(self.scheduler(text))
+        return self._process_scores(self.emotion_pipeline(text)[0])
+
+    def _infer(self, texts: List[str]) -> List[List[Dict]]:
+        """Per-text label scores; length-bucketed batches unless the shared batcher does the batching"""
+        if self.scheduler:
+            return [f.result() for f in [self.scheduler.submit(text) for text in texts]]
+        return run_bucketed(lambda batch: self.emotion_pipeline(batch, batch_size=len(batch)), texts, self.max_batch_size)
+
+    def analyze_text_async(self, text: str) -> Future:
+        """Queue the text on the shared batcher; the future resolves to the same result as analyze_text"""
+        result: Future = Future()
+        if not self.scheduler:
+            try:
+                result.set_result(self.analyze_text(text))
+            except Exception as e:
+                result.set_exception(e)
+            return result
+
+        chunks = split_text(text, self.tokenizer, self.max_tokens, self.stride)
+
+        def _done(batched: Future):
+            try:
+                scores = aggregate_chunk_scores(batched.result(), [c.tokens for c in chunks])
+                result.set_result(self._process_scores(scores))
+            except Exception as e:
+                result.set_exception(e)
+
+        gather([self.scheduler.submit(c.text) for c in chunks]).add_done_callback(_done)
+        return result
+
+    def analyze_batch(self, texts: Sequence[str], update_counts: bool = True) -> "np.ndarray":
+        """Score many texts in one call; returns an (n_texts x n_labels) matrix ordered like `label_names`"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, len(self.label_names)), dtype=np.float32)
 
+        owners, chunk_texts, weights = [], [], []
+        for i, text in enumerate(texts):
+            for chunk in split_text(text, self.tokenizer, self.max_tokens, self.stride):
+                owners.append(i)
+                chunk_texts.append(chunk.text)
+                weights.append(chunk.tokens)
+
+        scores = self._to_matrix(self._infer(chunk_texts))
+        if len(chunk_texts) > len(texts):
+            # Token-weighted mean of each long text's chunk rows
+            owners, weights = np.asarray(owners), np.asarray(weights, dtype=np.float32)
+            combined = np.zeros((len(texts), scores.shape[1]), dtype=np.float32)
+            np.add.at(combined, owners, scores * weights[:, None])
+            scores = combined / np.bincount(owners, weights=weights, minlength=len(texts))[:, None].astype(np.float32)
+        if update_counts:
+            counts, totals = self._aggregate(scores)
+            for i in np.flatnonzero(counts):
+                label = self.label_names[i]
+                self.emotion_counts[label] += int(counts[i])
+                self.emotion_confidences[label] += float(totals[i])
+        return scores
+
+    def _to_matrix(self, results) -> "np.ndarray":
+        scores = np.zeros((len(results), len(self.label_names)), dtype=np.float32)
+        for row, text_scores in enumerate(results):
+            for item in text_scores:
+                scores[row, self._label_index[item['label']]] = item['score']
+        return scores
+
+    def _aggregate(self, scores: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """Per-label detection counts and summed confidence above the threshold"""
+        mask = scores >= self.confidence_threshold
+        return mask.sum(axis=0), np.where(mask, scores, 0.0).sum(axis=0)
+
+    def detections(self, scores: "np.ndarray") -> List[List[Dict]]:
+        """analyze_text style per-text results from a score matrix"""
+        rows, cols = np.nonzero(scores >= self.confidence_threshold)
+        detected = [[] for _ in range(scores.shape[0])]
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            detected[row].append({'emotion': self.label_names[col], 'confidence': float(scores[row, col])})
+        return detected
+
+    def _process_scores(self, scores):
         detected_emotions = []
         for emotion in scores:
             if emotion['score'] >= self.confidence_threshold:
@@ -49,18 +158,32 @@ class EmotionAnalyzer:
         self.emotion_counts.clear()
         self.emotion_confidences.clear()
 
-    def summarize_emotions(self) -> str:
-        """Generate a one-line summary of detected emotions with average confidence."""
-        if not self.emotion_counts:
-            return "No emotions detected yet."
+    def summarize_emotions(self, scores: Optional["np.ndarray"] = None) -> str:
+        """Generate a one-line summary of detected emotions with average confidence.
+
+        Pass an analyze_batch score matrix to summarize that transcript instead of the running counters.
+        """
+        if scores is not None:
+            counts, totals = self._aggregate(scores)
+            emotion_counts = {self.label_names[i]: int(counts[i]) for i in np.flatnonzero(counts)}
+            emotion_confidences = {self.label_names[i]: float(totals[i]) for i in np.flatnonzero(counts)}
+        else:
+            emotion_counts, emotion_confidences = self.emotion_counts, self.emotion_confidences
+        return format_emotion_summary(emotion_counts, emotion_confidences)
+
+
+def format_emotion_summary(emotion_counts: Dict[str, int], emotion_confidences: Dict[str, float]) -> str:
+    """One-line summary from per-emotion counts and summed confidences (shared with session analytics)"""
+    if not emotion_counts:
+        return "No emotions detected yet."
 
-        parts = []
-        for emotion, count in sorted(self.emotion_counts.items(), key=lambda x: x[1], reverse=True):
-            avg_conf = self.emotion_confidences[emotion] / count 
-            # {count} occurrence{'s' if count > 1 else ''} with avg
-            parts.append(f"{emotion} confidence: {avg_conf:.0%}")
+    parts = []
+    for emotion, count in sorted(emotion_counts.items(), key=lambda x: x[1], reverse=True):
+        avg_conf = emotion_confidences[emotion] / count 
+        # {count} occurrence{'s' if count > 1 else ''} with avg
+        parts.append(f"{emotion} confidence: {avg_conf:.0%}")
 
-        return " | ".join(parts)
+    return " | ".join(parts)
 
 
 
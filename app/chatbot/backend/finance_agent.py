@@ -1,34 +1,54 @@
 from collections import defaultdict
+from concurrent.futures import Future
 from typing import Dict, List, Optional, Callable
 
-from transformers import pipeline, AutoTokenizer, AutoModelForTokenClassification
+from app.chatbot.backend.batching import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, gather
+from app.chatbot.backend.chunking import DEFAULT_STRIDE, max_tokens_for, merge_entities, run_bucketed, split_text
+from app.chatbot.backend.model_registry import registry, ModelRegistry
+from app.core.config import settings
 
 
 # ==================================================
 # FINANCE IDENTIFICATION (Finance-NER)
 # ==================================================
 
+DEFAULT_FINANCE_MODEL = "AhmedTaha012/finance-ner-v0.0.9-finetuned-ner"
+
+
 # Quantitative (profit, loss, percentage)
 class FinanceAnalyzer:
     def __init__(self,
-        model_name: str = "AhmedTaha012/finance-ner-v0.0.9-finetuned-ner",
+        model_name: str = DEFAULT_FINANCE_MODEL,
         entity_types: Optional[List[str]] = None,
         aggregation_strategy: str = "simple",
         confidence_threshold: float = 0.85,
-        pipeline_fn: Optional[Callable] = None):
+        pipeline_fn: Optional[Callable] = None,
+        model_registry: Optional[ModelRegistry] = None,
+        batching: bool = False,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        engine: Optional[str] = None,
+        max_length: Optional[int] = None,
+        stride: int = DEFAULT_STRIDE):
         
-        # Load model & tokenizer
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForTokenClassification.from_pretrained(model_name)
+        # Shared model, tokenizer & NER pipeline (loaded once per process)
+        self.engine = engine or settings.model_engine  # torch | torch-mmap | onnx | onnx-int8
+        shared = (model_registry or registry).get("ner", model_name, pipeline_fn, self.engine, aggregation_strategy=aggregation_strategy)
+        self.tokenizer = shared.tokenizer
+        self.model = shared.model
 
         # Extract labels from model config
         self.raw_labels = self.model.config.id2label
         self.entity_types = entity_types or self._extract_entity_types()
 
-        # Build NER pipeline
-        self.ner = pipeline_fn("ner", model=self.model, tokenizer=self.tokenizer, aggregation_strategy=aggregation_strategy) if pipeline_fn else pipeline("ner", model=self.model, tokenizer=self.tokenizer, aggregation_strategy=aggregation_strategy)
+        self.ner = shared.pipeline
+        self.scheduler = shared.get_scheduler(max_batch_size, max_wait_ms) if batching else None
 
         self.confidence_threshold = confidence_threshold
+        self.max_batch_size = max_batch_size
+        # Long documents run as overlapping windows; spans are merged back onto the full text
+        self.max_tokens = max_tokens_for(self.tokenizer, self.model, max_length)
+        self.stride = stride
         self.entity_counts = defaultdict(lambda: defaultdict(int))
 
     def _extract_entity_types(self) -> List[str]:
@@ -43,11 +63,43 @@ class FinanceAnalyzer:
     def analyze_text(self, title: str, content: str) -> Dict[str, List[Dict]]:
         """Analyze entities in combined text"""
         full_text = f"{title}\n{content}"
-        entities = self.ner(full_text)
+        chunks = split_text(full_text, self.tokenizer, self.max_tokens, self.stride)
+        if len(chunks) > 1:
+            if self.scheduler:
+                results = [f.result() for f in [self.scheduler.submit(c.text) for c in chunks]]
+            else:
+                results = run_bucketed(lambda batch: self.ner(batch, batch_size=len(batch)), [c.text for c in chunks], self.max_batch_size)
+            entities = merge_entities(list(zip(chunks, results)), full_text)
+        else:
+            entities = self.scheduler(full_text) if self.scheduler else self.ner(full_text)
         processed = self._process_entities(entities)
         self._update_counts(processed)
         return processed
 
+    def analyze_text_async(self, title: str, content: str) -> Future:
+        """Queue the text on the shared batcher; the future resolves to the same result as analyze_text"""
+        result: Future = Future()
+        if not self.scheduler:
+            try:
+                result.set_result(self.analyze_text(title, content))
+            except Exception as e:
+                result.set_exception(e)
+            return result
+
+        full_text = f"{title}\n{content}"
+        chunks = split_text(full_text, self.tokenizer, self.max_tokens, self.stride)
+
+        def _done(batched: Future):
+            try:
+                processed = self._process_entities(merge_entities(list(zip(chunks, batched.result())), full_text))
+                self._update_counts(processed)
+                result.set_result(processed)
+            except Exception as e:
+                result.set_exception(e)
+
+        gather([self.scheduler.submit(c.text) for c in chunks]).add_done_callback(_done)
+        return result
+
     def _process_entities(self, entities: List[Dict]) -> Dict[str, List[Dict]]:
         """Filter and organize entities by simplified type"""
         categorized = defaultdict(list)
@@ -70,12 +122,17 @@ class FinanceAnalyzer:
 
     def get_entity_summary(self) -> List[Dict]:
         """Summarize entities by category without frequency counts"""
-        summary = []
-        for category, entities in self.entity_counts.items():
-            for entity in entities.keys():
-                summary.append({
-                    'Category': category,
-                    'Entity': entity
-                })
-        return summary    
+        return format_entity_summary(self.entity_counts)
+
+
+def format_entity_summary(entity_counts: Dict[str, Dict[str, int]]) -> List[Dict]:
+    """Category/entity pairs from per-category entity counts (shared with session analytics)"""
+    summary = []
+    for category, entities in entity_counts.items():
+        for entity in entities.keys():
+            summary.append({
+                'Category': category,
+                'Entity': entity
+            })
+    return summary    
     
\ No newline at end of file
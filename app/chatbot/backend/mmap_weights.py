@@ -0,0 +1,82 @@
+import json
+import os
+from typing import Dict
+
+from app.core.lazy import LazyModule
+
+transformers = LazyModule("transformers")
+
+# ==================================================
+# MEMORY-MAPPED WEIGHTS ("torch-mmap" engine)
+# ==================================================
+# The model's parameters are views into a private (copy-on-write) mmap of its
+# model.safetensors file instead of freshly allocated tensors. Inference never
+# writes to them, so every process that maps the same file shares the same
+# physical pages through the page cache: N model workers cost roughly one
+# copy of the weights plus their activations.
+#
+# Checkpoints without a single model.safetensors (sharded or .bin only) fall
+# back to a regular from_pretrained load.
+
+SAFETENSORS_FILE = "model.safetensors"
+
+# safetensors dtype names -> torch dtype attribute names
+DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+def mmap_state_dict(path: str) -> Dict:
+    """Tensors of a .safetensors file as views of one read-only shared mapping, nothing copied"""
+    import torch
+
+    with open(path, "rb") as f:
+        header_size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+
+    # shared=False maps the file MAP_PRIVATE: pages come from the page cache and
+    # stay shared between processes unless written to
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    data = torch.empty(0, dtype=torch.uint8).set_(storage)
+    base = 8 + header_size
+
+    state = {}
+    for name, info in header.items():
+        begin, end = info["data_offsets"]
+        dtype = getattr(torch, DTYPES[info["dtype"]])
+        state[name] = data[base + begin:base + end].view(dtype).reshape(info["shape"])
+    return state
+
+
+def load_mmap_model(model_class: str, model_name: str):
+    """`model_class` from_pretrained equivalent whose weights alias the mmapped checkpoint"""
+    import torch
+
+    cls = getattr(transformers, model_class)
+    try:
+        path = transformers.utils.cached_file(model_name, SAFETENSORS_FILE)
+    except OSError:
+        path = None
+    if path is None:
+        print(f"No {SAFETENSORS_FILE} for {model_name}, loading private weights instead")
+        return cls.from_pretrained(model_name).eval()
+
+    config = transformers.AutoConfig.from_pretrained(model_name)
+    state = mmap_state_dict(path)
+    with torch.no_grad():
+        model = cls.from_config(config)
+        # assign=True swaps the parameters for the mapped tensors instead of copying
+        # into them; the randomly initialised ones are freed
+        missing, _ = model.load_state_dict(state, strict=False, assign=True)
+        model.tie_weights()
+
+    # Parameters absent from the file are fine only if tying made them alias a mapped one
+    mapped = {tensor.data_ptr() for tensor in state.values()}
+    parameters = dict(model.named_parameters(remove_duplicate=False))
+    unmapped = [name for name in missing if name in parameters and parameters[name].data_ptr() not in mapped]
+    if unmapped:
+        print(f"{model_name}: {len(unmapped)} parameters missing from {SAFETENSORS_FILE}, loading private weights instead")
+        return cls.from_pretrained(model_name).eval()
+    return model.eval()
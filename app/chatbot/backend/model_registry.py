@@ -0,0 +1,138 @@
+import gc
+import threading
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from app.chatbot.backend.batching import BatchScheduler, pipeline_batch_fn, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS
+from app.chatbot.backend.mmap_weights import load_mmap_model
+from app.chatbot.backend.onnx_engine import check_engine, load_onnx_model
+from app.core.lazy import LazyModule
+
+transformers = LazyModule("transformers")
+
+# ==================================================
+# MODEL REGISTRY (one copy of each HF model per process)
+# ==================================================
+# transformers is imported on the first load, not at module import, so API
+# workers and the CLI start fast and only pay for it once a model is needed.
+
+MODEL_CLASSES = {
+    "text-classification": "AutoModelForSequenceClassification",
+    "ner": "AutoModelForTokenClassification",
+}
+
+
+class LoadedModel:
+    """Tokenizer, weights and pipeline shared by every analyzer using the same key."""
+
+    def __init__(self, key: Tuple, tokenizer, model, pipe):
+        self.key = key
+        self.tokenizer = tokenizer
+        self.model = model
+        self.pipeline = pipe
+        self.scheduler: Optional[BatchScheduler] = None
+        self._scheduler_lock = threading.Lock()
+
+    def get_scheduler(self, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_wait_ms: float = DEFAULT_MAX_WAIT_MS) -> BatchScheduler:
+        """Batching front-end for this pipeline. Created by the first caller and shared afterwards."""
+        if self.scheduler is None:
+            with self._scheduler_lock:
+                if self.scheduler is None:
+                    self.scheduler = BatchScheduler(
+                        pipeline_batch_fn(self.pipeline),
+                        max_batch_size=max_batch_size,
+                        max_wait_ms=max_wait_ms,
+                        name=f"batcher-{self.key[1]}"
+                    )
+        return self.scheduler
+
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.close()
+            self.scheduler = None
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._models: Dict[Tuple, LoadedModel] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+
+    @staticmethod
+    def make_key(task: str, model_name: str, pipeline_fn: Optional[Callable] = None, engine: str = "torch", **options) -> Tuple:
+        """Build the cache key from the model name, the engine and the options that change the loaded pipeline"""
+        frozen: Tuple[Tuple[str, Hashable], ...] = tuple(sorted(options.items()))
+        return (task, model_name, pipeline_fn, frozen, engine)
+
+    def get(self, task: str, model_name: str, pipeline_fn: Optional[Callable] = None, engine: str = "torch", **options) -> LoadedModel:
+        """Return the shared model for this key, loading it on first use"""
+        key = self.make_key(task, model_name, pipeline_fn, engine, **options)
+        loaded = self._models.get(key)
+        if loaded is not None:
+            return loaded
+
+        # Per-key lock: two threads asking for the same model load it once,
+        # while different models can still load in parallel.
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            loaded = self._models.get(key)
+            if loaded is None:
+                loaded = self._load(key, task, model_name, pipeline_fn, engine, options)
+                with self._lock:
+                    self._models[key] = loaded
+        return loaded
+
+    def _load(self, key: Tuple, task: str, model_name: str, pipeline_fn: Optional[Callable], engine: str, options: Dict) -> LoadedModel:
+        if task not in MODEL_CLASSES:
+            raise ValueError(f"Unsupported task: {task}")
+        check_engine(engine)
+
+        tokenizer = transformers.AutoTokenizer.from_pretrained(model_name)
+        if engine == "torch":
+            model = getattr(transformers, MODEL_CLASSES[task]).from_pretrained(model_name)
+            model.eval()
+        elif engine == "torch-mmap":
+            model = load_mmap_model(MODEL_CLASSES[task], model_name)
+        else:
+            model = load_onnx_model(task, model_name, quantize=engine == "onnx-int8")
+
+        build = pipeline_fn or transformers.pipeline
+        pipe = build(task, model=model, tokenizer=tokenizer, **options)
+        return LoadedModel(key, tokenizer, model, pipe)
+
+    def warmup(self, specs: Iterable[Tuple[str, str, Dict]]) -> List[Tuple]:
+        """Load every (task, model_name, options) spec up front, e.g. at process startup (options may include engine)"""
+        return [self.get(task, model_name, **options).key for task, model_name, options in specs]
+
+    def is_loaded(self, task: str, model_name: str, pipeline_fn: Optional[Callable] = None, engine: str = "torch", **options) -> bool:
+        return self.make_key(task, model_name, pipeline_fn, engine, **options) in self._models
+
+    def loaded_keys(self) -> List[Tuple]:
+        with self._lock:
+            return list(self._models.keys())
+
+    def evict(self, task: str, model_name: str, pipeline_fn: Optional[Callable] = None, engine: str = "torch", **options) -> bool:
+        """Drop one model from the registry. Analyzers already holding it keep working until released."""
+        key = self.make_key(task, model_name, pipeline_fn, engine, **options)
+        with self._lock:
+            removed = self._models.pop(key, None)
+            self._key_locks.pop(key, None)
+        if removed is None:
+            return False
+        removed.close()
+        del removed
+        gc.collect()
+        return True
+
+    def unload_all(self):
+        """Drop every loaded model, e.g. before shutdown or to free memory"""
+        with self._lock:
+            models = list(self._models.values())
+            self._models.clear()
+            self._key_locks.clear()
+        for loaded in models:
+            loaded.close()
+        gc.collect()
+
+
+registry = ModelRegistry()
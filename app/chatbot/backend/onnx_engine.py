@@ -0,0 +1,91 @@
+import importlib.util
+import os
+import platform
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+
+# ==================================================
+# ONNX RUNTIME ENGINE (CPU inference, optional int8)
+# ==================================================
+# "torch"      - transformers PyTorch model (default)
+# "torch-mmap" - the same, weights memory-mapped from safetensors (see mmap_weights)
+# "onnx"       - exported to ONNX, fp32, run by onnxruntime
+# "onnx-int8"  - the same export with dynamic int8 quantization of the weights
+# Exports are cached on disk so only the first process pays for them.
+# onnxruntime and optimum are optional ("optimum[onnxruntime]") and imported
+# only when an ONNX engine is actually loaded.
+
+ENGINES = ("torch", "torch-mmap", "onnx", "onnx-int8")
+TORCH_ENGINES = ("torch", "torch-mmap")
+QUANTIZED_FILE = "model_quantized.onnx"
+
+ORT_MODEL_CLASSES = {
+    "text-classification": "ORTModelForSequenceClassification",
+    "ner": "ORTModelForTokenClassification",
+}
+
+
+def onnx_available() -> bool:
+    return all(importlib.util.find_spec(name) is not None for name in ("onnxruntime", "optimum"))
+
+
+def check_engine(engine: str):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}' (choose from {', '.join(ENGINES)})")
+    if engine not in TORCH_ENGINES and not onnx_available():
+        raise ImportError(f"Engine '{engine}' needs onnxruntime and optimum: pip install \"optimum[onnxruntime]\"")
+
+
+def export_dir(model_name: str, quantized: bool, cache_dir: Optional[str] = None) -> Path:
+    root = Path(cache_dir or settings.onnx_cache_dir)
+    return root / model_name.replace("/", "--") / ("int8" if quantized else "fp32")
+
+
+def session_options():
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if settings.onnx_threads:
+        options.intra_op_num_threads = settings.onnx_threads
+    return options
+
+
+def quantization_config():
+    """Dynamic int8 config for this CPU (no calibration data needed)"""
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+    return AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+
+
+def load_onnx_model(task: str, model_name: str, quantize: bool = False, cache_dir: Optional[str] = None):
+    """Export (once) and load the model as an onnxruntime-backed transformers model"""
+    from optimum import onnxruntime as ort_models
+
+    model_class = getattr(ort_models, ORT_MODEL_CLASSES[task])
+    fp32_dir = export_dir(model_name, quantized=False, cache_dir=cache_dir)
+
+    if not (fp32_dir / "model.onnx").exists():
+        exported = model_class.from_pretrained(model_name, export=True)
+        exported.save_pretrained(fp32_dir)
+        del exported
+
+    if not quantize:
+        return model_class.from_pretrained(fp32_dir, session_options=session_options(), provider="CPUExecutionProvider")
+
+    int8_dir = export_dir(model_name, quantized=True, cache_dir=cache_dir)
+    if not (int8_dir / QUANTIZED_FILE).exists():
+        os.makedirs(int8_dir, exist_ok=True)
+        quantizer = ort_models.ORTQuantizer.from_pretrained(fp32_dir, file_name="model.onnx")
+        quantizer.quantize(save_dir=int8_dir, quantization_config=quantization_config())
+
+    return model_class.from_pretrained(
+        int8_dir,
+        file_name=QUANTIZED_FILE,
+        session_options=session_options(),
+        provider="CPUExecutionProvider"
+    )
@@ -0,0 +1,394 @@
+import argparse
+import importlib
+import importlib.util
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, Optional, Tuple, Union
+
+from app.core.config import settings
+
+# ==================================================
+# MODEL WORKER PROCESSES
+# ==================================================
+# Inference runs in a pool of processes sized to the cores, outside the GIL of
+# the API / bot process. Requests go through one shared queue, so an idle
+# worker always picks up the next one. Workers load their models with the
+# "torch-mmap" engine by default: weights are mapped from the safetensors
+# files and shared through the page cache, so memory grows by activations per
+# worker, not by a copy of every model.
+#
+#   ModelWorkerPool     the processes, used in-process (MODEL_WORKERS=local)
+#   serve()             exposes a pool on a socket for every uvicorn worker
+#   ModelWorkerClient   talks to that server (MODEL_WORKERS=host:port or a path)
+#
+# Both front-ends have the same submit() / call() interface. The socket carries
+# pickles, and unpickling runs code, so serve() and the client refuse to start
+# without MODEL_WORKER_AUTHKEY; keep the address off untrusted networks too.
+
+# task name -> "module:function" resolved inside the worker
+DEFAULT_TASKS = {
+    "emotions": "app.chatbot.tools.negotiation_tools:analyze_emotions",
+    "entities": "app.chatbot.tools.negotiation_tools:analyze_entities",
+}
+DEFAULT_WARMUP = "app.chatbot.tools.negotiation_tools:warmup_models"
+
+_READY = "__ready__"
+_IDLE = -1  # a worker's current request when it holds none
+
+
+def _resolve(path: str):
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects container CPU affinity)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def parse_address(address: str) -> Union[Tuple[str, int], str]:
+    """"host:port" -> TCP address, anything else is a unix socket path"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+def _authkey(authkey: Optional[str]) -> bytes:
+    key = authkey or settings.model_worker_authkey
+    if not key:
+        raise ValueError("Set MODEL_WORKER_AUTHKEY (the same secret for the server and its clients) to use model workers over a socket")
+    return key.encode()
+
+
+def _worker_main(tasks: Dict[str, str], warmup: Optional[str], engine: str, threads: int, requests, responses, current):
+    settings.model_engine = engine
+    if threads and importlib.util.find_spec("torch") is not None:
+        import torch
+        torch.set_num_threads(threads)  # workers x threads = cores, no oversubscription
+
+    functions = {name: _resolve(path) for name, path in tasks.items()}
+    if warmup:
+        try:
+            _resolve(warmup)()
+        except Exception as e:
+            print(f"Model worker {os.getpid()} warmup failed, loading on first request: {e}")
+    responses.put((_READY, os.getpid(), None))
+
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        request_id, task, args = item
+        current.value = request_id  # failed by the pool if this process dies now
+        try:
+            response = (request_id, True, functions[task](*args))
+        except Exception as e:
+            response = (request_id, False, f"{type(e).__name__}: {e}")
+        current.value = _IDLE
+        responses.put(response)
+
+
+class WorkerError(Exception):
+    pass
+
+
+class ModelWorkerPool:
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        tasks: Optional[Dict[str, str]] = None,
+        warmup: Optional[str] = DEFAULT_WARMUP,
+        engine: Optional[str] = None,
+        threads_per_worker: Optional[int] = None
+    ):
+        self.processes = processes or settings.model_worker_processes or available_cores()
+        self.tasks = tasks or DEFAULT_TASKS
+        self.warmup_path = warmup
+        self.engine = engine or settings.model_worker_engine
+        self.threads_per_worker = settings.model_worker_threads if threads_per_worker is None else threads_per_worker
+
+        self._context = multiprocessing.get_context("spawn")  # no forked copies of the parent's state
+        self._requests = None
+        self._responses = None
+        self._workers = []
+        self._current = []  # per worker: the request id it is running, shared memory
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._collector: Optional[threading.Thread] = None
+        self._ready = threading.Semaphore(0)
+        self._started = False
+        self._closing = False
+
+    @property
+    def pids(self):
+        return [worker.pid for worker in self._workers]
+
+    def _spawn(self):
+        current = self._context.Value("q", _IDLE, lock=False)
+        worker = self._context.Process(
+            target=_worker_main,
+            args=(self.tasks, self.warmup_path, self.engine, self.threads_per_worker, self._requests, self._responses, current),
+            daemon=True
+        )
+        worker.start()
+        return worker, current
+
+    def start(self, timeout: Optional[float] = None) -> "ModelWorkerPool":
+        """Start the workers and wait until each has loaded its models"""
+        with self._lock:
+            if self._started:
+                return self
+            self._requests = self._context.Queue()
+            self._responses = self._context.Queue()
+            for _ in range(self.processes):
+                worker, current = self._spawn()
+                self._workers.append(worker)
+                self._current.append(current)
+            self._collector = threading.Thread(target=self._collect, name="model-workers", daemon=True)
+            self._collector.start()
+            self._started = True  # last: submit() reads it unlocked and then uses the queues
+        for _ in range(self.processes):
+            if not self._ready.acquire(timeout=timeout):
+                raise WorkerError("Model workers did not become ready in time")
+        return self
+
+    def warmup(self):
+        self.start()
+
+    def _collect(self):
+        while True:
+            try:
+                item = self._responses.get(timeout=1.0)
+            except queue.Empty:
+                item = None
+            except (EOFError, OSError):
+                return
+            self._replace_dead_workers()
+            if item is None:
+                continue
+            request_id, ok, result = item
+            if request_id is None:
+                return
+            if request_id == _READY:
+                self._ready.release()
+                continue
+            with self._lock:
+                future = self._futures.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(WorkerError(result))
+
+    def _replace_dead_workers(self):
+        if self._closing:
+            return
+        for i, worker in enumerate(self._workers):
+            if worker.exitcode is not None:
+                print(f"Model worker {worker.pid} exited with {worker.exitcode}, restarting")
+                request_id = self._current[i].value
+                self._workers[i], self._current[i] = self._spawn()
+                if request_id == _IDLE:
+                    continue
+                with self._lock:
+                    future = self._futures.pop(request_id, None)
+                if future is not None:
+                    future.set_exception(WorkerError(f"Model worker {worker.pid} exited with {worker.exitcode} while running this request"))
+
+    def submit(self, task: str, *args: Any) -> Future:
+        if task not in self.tasks:
+            raise ValueError(f"Unknown task '{task}' (choose from {', '.join(self.tasks)})")
+        if not self._started:
+            self.start()
+        if self._closing:
+            raise RuntimeError("ModelWorkerPool is closed")
+        future: Future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            self._futures[request_id] = future
+        self._requests.put((request_id, task, args))
+        return future
+
+    def call(self, task: str, *args: Any, timeout: Optional[float] = None) -> Any:
+        return self.submit(task, *args).result(timeout=settings.model_worker_timeout if timeout is None else timeout)
+
+    def close(self, timeout: float = 10.0):
+        if not self._started or self._closing:
+            return
+        self._closing = True
+        for _ in self._workers:
+            self._requests.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._responses.put((None, False, None))
+        self._collector.join(timeout)
+        with self._lock:
+            futures, self._futures = list(self._futures.values()), {}
+        for future in futures:
+            future.set_exception(WorkerError("ModelWorkerPool closed"))
+
+
+# ----------------------------------------
+# Socket front-end (shared by several API processes)
+# ----------------------------------------
+
+def _serve_connection(pool: ModelWorkerPool, conn):
+    send_lock = threading.Lock()
+
+    def reply(request_id, future: Future):
+        try:
+            message = (request_id, True, future.result())
+        except Exception as e:
+            message = (request_id, False, str(e))
+        try:
+            with send_lock:
+                conn.send(message)
+        except OSError:
+            pass  # client went away
+
+    try:
+        while True:
+            request_id, task, args = conn.recv()
+            try:
+                future = pool.submit(task, *args)
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(lambda f, request_id=request_id: reply(request_id, f))
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+
+def serve(pool: ModelWorkerPool, address: str, authkey: Optional[str] = None):
+    """Accept clients forever; each connection gets a thread, requests are pipelined"""
+    key = _authkey(authkey)
+    pool.start()
+    with Listener(parse_address(address), authkey=key) as listener:
+        print(f"Model workers {pool.pids} serving {address}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_serve_connection, args=(pool, conn), daemon=True).start()
+
+
+class ModelWorkerClient:
+    """Connects lazily and reconnects after the server restarts; requests in flight then fail"""
+
+    def __init__(self, address: str, authkey: Optional[str] = None):
+        self.address = address
+        self.authkey = _authkey(authkey)
+        self._conn = None
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def _connect(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = Client(parse_address(self.address), authkey=self.authkey)
+                threading.Thread(target=self._read, args=(self._conn,), name="model-worker-client", daemon=True).start()
+            return self._conn
+
+    def _read(self, conn):
+        try:
+            while True:
+                request_id, ok, result = conn.recv()
+                with self._lock:
+                    future = self._futures.pop(request_id, None)
+                if future is None:
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(WorkerError(result))
+        except (EOFError, OSError):
+            with self._lock:
+                if self._conn is conn:
+                    self._conn = None
+                futures, self._futures = list(self._futures.values()), {}
+            for future in futures:
+                future.set_exception(WorkerError(f"Lost connection to model workers at {self.address}"))
+
+    def warmup(self):
+        self._connect()
+
+    def submit(self, task: str, *args: Any) -> Future:
+        conn = self._connect()
+        future: Future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            self._futures[request_id] = future
+        try:
+            with self._send_lock:
+                conn.send((request_id, task, args))
+        except OSError as e:
+            with self._lock:
+                self._futures.pop(request_id, None)
+                if self._conn is conn:
+                    self._conn = None
+            future.set_exception(WorkerError(f"Model workers at {self.address} unreachable: {e}"))
+        return future
+
+    def call(self, task: str, *args: Any, timeout: Optional[float] = None) -> Any:
+        return self.submit(task, *args).result(timeout=settings.model_worker_timeout if timeout is None else timeout)
+
+    def close(self):
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+
+_workers: Optional[Union[ModelWorkerPool, ModelWorkerClient]] = None
+_workers_lock = threading.Lock()
+
+
+def get_model_workers() -> Optional[Union[ModelWorkerPool, ModelWorkerClient]]:
+    """Front-end selected by MODEL_WORKERS, or None for in-process inference"""
+    global _workers
+    if not settings.model_workers:
+        return None
+    if _workers is None:
+        with _workers_lock:
+            if _workers is None:
+                if settings.model_workers == "local":
+                    _workers = ModelWorkerPool()
+                else:
+                    _workers = ModelWorkerClient(settings.model_workers)
+    return _workers
+
+
+def close_model_workers():
+    global _workers
+    with _workers_lock:
+        workers, _workers = _workers, None
+    if workers is not None:
+        workers.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the analysis models from a pool of worker processes")
+    parser.add_argument("--address", default=settings.model_workers if settings.model_workers not in ("", "local") else "127.0.0.1:8765")
+    parser.add_argument("--processes", type=int, default=0, help="0 = MODEL_WORKER_PROCESSES or one per core")
+    parser.add_argument("--engine", default=None, help="default MODEL_WORKER_ENGINE (torch-mmap)")
+    parser.add_argument("--threads", type=int, default=None, help="torch threads per worker")
+    args = parser.parse_args()
+    serve(ModelWorkerPool(args.processes or None, engine=args.engine, threads_per_worker=args.threads), args.address)
+
+
+if __name__ == "__main__":
+    main()
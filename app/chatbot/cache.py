@@ -0,0 +1,199 @@
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import redis
+
+from app.core.config import settings
+
+# ==================================================
+# ANALYSIS CACHE (in-process LRU/LFU + optional Redis tier)
+# ==================================================
+
+_QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"'})
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n.!?,;:"
+
+
+def normalize_text(text: str) -> str:
+    """Cache key text: "What's  your best price?!" and "what's your best price" hit the same entry"""
+    text = unicodedata.normalize("NFKC", text).translate(_QUOTES).lower()
+    return _WHITESPACE.sub(" ", text).strip(_EDGE_PUNCTUATION)
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def as_dict(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+        }
+
+
+class AnalysisCache:
+    """Bounded cache for analysis results keyed by normalized text.
+
+    Tier 1 is in-process with LRU or LFU eviction and a TTL. Tier 2 (optional) is
+    Redis, so every worker and session shares results for common phrases. Values
+    must be JSON-serializable to use the Redis tier.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: Optional[float] = 3600,
+        policy: str = "lru",
+        redis_client: Optional[redis.Redis] = None,
+        redis_ttl: Optional[int] = None,
+        namespace: str = "analysis"
+    ):
+        if policy not in ("lru", "lfu"):
+            raise ValueError("policy must be 'lru' or 'lfu'")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.policy = policy
+        self.redis = redis_client
+        self.redis_ttl = redis_ttl or (max(1, math.ceil(ttl)) if ttl else None)
+        self.namespace = namespace
+        self.stats = CacheStats()
+
+        self._entries: "OrderedDict[str, list]" = OrderedDict()  # key -> [value, expires_at, frequency]
+        self._lock = threading.Lock()
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+
+    def _expired(self, entry) -> bool:
+        return entry[1] is not None and entry[1] <= time.monotonic()
+
+    def _evict_one(self):
+        if self.policy == "lru":
+            self._entries.popitem(last=False)
+        else:
+            # Least frequently used; ties go to the least recently used
+            victim = min(self._entries, key=lambda k: self._entries[k][2])
+            del self._entries[victim]
+        self.stats.evictions += 1
+
+    def _store_local(self, key: str, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                entry = self._entries[key]
+                entry[0], entry[1] = value, expires_at
+                self._entries.move_to_end(key)
+                return
+            while len(self._entries) >= self.max_size:
+                self._evict_one()
+            self._entries[key] = [value, expires_at, 1]
+
+    def _get_local(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                del self._entries[key]
+                self.stats.expirations += 1
+                return None
+            entry[2] += 1
+            self._entries.move_to_end(key)
+            return entry
+
+    def get(self, text: str) -> Optional[Any]:
+        key = normalize_text(text)
+        entry = self._get_local(key)
+        if entry is not None:
+            self.stats.hits += 1
+            return entry[0]
+
+        if self.redis is not None:
+            try:
+                shared = self.redis.get(self._redis_key(key))
+            except redis.RedisError:
+                self.stats.shared_errors += 1
+                shared = None
+            if shared is not None:
+                value = json.loads(shared)
+                self._store_local(key, value)
+                self.stats.hits += 1
+                self.stats.shared_hits += 1
+                return value
+
+        self.stats.misses += 1
+        return None
+
+    def set(self, text: str, value: Any):
+        key = normalize_text(text)
+        self._store_local(key, value)
+        if self.redis is not None:
+            try:
+                self.redis.set(self._redis_key(key), json.dumps(value), ex=self.redis_ttl)
+            except redis.RedisError:
+                self.stats.shared_errors += 1
+
+    def get_or_compute(self, text: str, compute: Callable[[str], Any], cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """`cacheable` can reject a computed value (e.g. a degraded result) so it is recomputed next time"""
+        value = self.get(text)
+        if value is None:
+            value = compute(text)
+            if cacheable is None or cacheable(value):
+                self.set(text, value)
+        return value
+
+    def clear(self):
+        """Drop the in-process tier (the shared tier expires by TTL)"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_shared_cache: Optional[AnalysisCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Process-wide cache configured from Settings, shared by every bot"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                redis_client = None
+                if settings.analysis_cache_redis:
+                    redis_client = redis.Redis(
+                        host=settings.redis_host,
+                        port=settings.redis_port,
+                        password=settings.redis_password or None,
+                        socket_timeout=settings.redis_socket_timeout,
+                        socket_connect_timeout=settings.redis_connect_timeout,
+                        decode_responses=True
+                    )
+                _shared_cache = AnalysisCache(
+                    max_size=settings.analysis_cache_size,
+                    ttl=settings.analysis_cache_ttl,
+                    policy=settings.analysis_cache_policy,
+                    redis_client=redis_client
+                )
+    return _shared_cache
@@ -1,19 +1,38 @@
-import json
+import asyncio
+import re
 import uuid
+import httpx
 import requests
 
-from app.chatbot.strategy.strategy_analysis import run_analysis_pipeline
+from app.chatbot.strategy.strategy_analysis import analysis_complete, run_analysis_pipeline, warmup_analysis
+from app.chatbot.strategy.pricing import extract_price
+from app.chatbot.strategy.strategy_engine import counter_offer
+from app.chatbot.analytics import InMemoryAnalyticsStore
+from app.chatbot.cache import get_analysis_cache
+from app.chatbot.prompts import build_messages
+from app.chatbot.history import history_prompt, session_window
+from app.chatbot.http_client import get_http_session, get_async_client, open_stream, request_timeout
+from app.chatbot.streaming import TurnMetrics, iter_stream_tokens, aiter_stream_tokens
+from app.core.config import settings
+
+FALLBACK_REPLY = "I'm having trouble connecting to the model service."
+QUOTED_TEXT = re.compile(r'"([^"]*)"')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
 # from strategy.strategy_analysis import run_analysis_pipeline
 
 class NegotiationBot:
-    def __init__(self, model_host="localhost", model_port=11434, model="mistral:latest"):
+    def __init__(self, model_host="localhost", model_port=11434, model="mistral:latest", http_session=None, backend_pool=None, analysis_cache=None):
         self.session_id = None
         self.messages = []
         self.model = model
         self.model_url = f"http://{model_host}:{model_port}/api/chat"
         self.headers = {"Content-Type": "application/json"}
-        self.memory = {}
+        self.http = http_session or get_http_session()  # pooled keep-alive connections shared across bots
+        self.backend_pool = backend_pool  # optional BackendPool routing over several Ollama hosts
+        self.memory = analysis_cache or get_analysis_cache()  # shared LRU/LFU (+ optional Redis) analysis cache
         self.sessions = {}  # Local storage for sessions instead of API
+        self.last_turn_metrics = None
+        self.analytics = InMemoryAnalyticsStore()  # incremental per-session emotion/entity counters
 
     def create_session(self, max_price: float, min_price: float, target_price: float, product_id: str, flexibility: float = 0.1, negotiation_strategy: str = "standard"):
         """Create a new negotiation session locally"""
@@ -28,7 +47,9 @@ class NegotiationBot:
                 "flexibility": flexibility,
                 "negotiation_strategy": negotiation_strategy
             },
-            "messages": []
+            "messages": [],
+            "summary": None,  # running summary of turns that left the prompt window
+            "summarized_count": 0
         }
         
         self.sessions[session_id] = session_data
@@ -58,28 +79,38 @@ class NegotiationBot:
         
         return {"message": "Parameters updated successfully"}
     
+    def warmup(self):
+        """Load the analysis models now instead of on the first turn (they are imported lazily)"""
+        warmup_analysis()
+
     def enrich_with_analysis(self, user_input):
-        if user_input not in self.memory:
-            self.memory[user_input] = run_analysis_pipeline(user_input)
-            
-        if len(self.memory) > 10:
-            self.memory.pop(next(iter(self.memory)))
-        return self.memory[user_input]
-
-    def build_payload(self, prompt): 
-        return {
+        return self.memory.get_or_compute(user_input, run_analysis_pipeline, cacheable=analysis_complete)
+
+    def record_analytics(self, user_input, analysis=None):
+        """Fold this message into the active session's counters; pass the turn's analysis to skip recomputing it"""
+        if analysis is None:
+            analysis = self.enrich_with_analysis(user_input)
+        self.analytics.record(self.session_id, analysis.get("emotions", []), analysis.get("entities"))
+
+    def session_analytics(self, session_id=None):
+        return self.analytics.get(session_id or self.session_id)
+
+    def build_payload(self, messages):
+        payload = {
             "model": self.model,
             "options": {"temperature": 0.0},
             "stream": True,
-            "messages": [
-                {"role": "system", "content": "You are a helpful negotiation assistant."},
-                {"role": "user", "content": prompt}
-            ]
+            "messages": messages
         }
-    
+        if settings.ollama_keep_alive:
+            payload["keep_alive"] = settings.ollama_keep_alive  # keep the model and its prompt cache loaded between turns
+        return payload
+
     def send_streaming_request(self, payload):
+        if self.backend_pool:
+            return self.backend_pool.post_stream(self.http, payload, headers=self.headers, timeout=request_timeout())
         try:
-            response = requests.post(self.model_url, json=payload, headers=self.headers, stream=True)
+            response = self.http.post(self.model_url, json=payload, headers=self.headers, stream=True, timeout=request_timeout())
 
             if response.status_code == 200:
                 return response
@@ -90,117 +121,161 @@ class NegotiationBot:
             print(f"Request failed: {e}")
             return None
 
-    def process_stream(self, response):
-        full_reply = ""
+    def close_response(self, response, success=True):
+        response.close()
+        if self.backend_pool:
+            self.backend_pool.release_response(response, success)
+
+    def process_stream(self, response, metrics=None):
+        success = True
         try:
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        res = json.loads(line.decode('utf-8'))
-                        content = res.get('message', {}).get('content', '')
-                        full_reply += content
-
-                    except json.JSONDecodeError as e:
-                        print(f"\n[Error decoding JSON in stream: {e}]")
-                        continue
-                    
-                    except Exception as e:
-                        print(f"\n[Error processing stream chunk: {e}]")
-                        continue
+            full_reply = "".join(iter_stream_tokens(response.iter_lines(), metrics))
             print()
             return full_reply
+        except requests.exceptions.RequestException:
+            success = False  # the backend broke off the stream
+            raise
         finally:
-            response.close()  
+            self.close_response(response, success)
+
+
+    def build_messages(self, user_input, context, history=None, analysis=None):
+        if analysis is None:
+            analysis = self.enrich_with_analysis(user_input)
+
+        # Ranked price extraction ("6-month warranty" is not an offer of $6) and a
+        # numeric counter-offer from the session's strategy table
+        strategy_guidance = ""
+        mentioned_price = extract_price(user_input, reference=context)
+        if mentioned_price is not None:
+            decision = counter_offer(context, mentioned_price)
+            if decision:
+                strategy_guidance = decision.guidance
+
+        return build_messages(context, user_input, analysis, strategy_guidance, history)
+
+    def history(self):
+        """Running summary + newest turns of the active session within the token budget (multi-turn mode, PROMPT_HISTORY_MESSAGES)"""
+        if not settings.prompt_history_messages or not self.session_id:
+            return []
+        session = self.sessions[self.session_id]
+        summarized_count = session.get("summarized_count", 0)
+        window = session_window(session["messages"][summarized_count:], session.get("summary"), summarized_count, session["parameters"])
+        session["summary"], session["summarized_count"] = window.summary.as_dict(), window.summarized_count
+        return history_prompt(window)
+
+    def extract_reply(self, full_reply):
+        quoted_text = QUOTED_TEXT.findall(full_reply)
+
+        if quoted_text:
+            return quoted_text[0]
+
+        sentences = SENTENCE_END.split(full_reply)
+        relevant_sentences = [s for s in sentences if any(word in s.lower() for word in ["price", "deal", "offer", "$"])]
 
+        if relevant_sentences:
+            return min(relevant_sentences, key=len)
+        return full_reply
 
     def send_message(self, user_input):
         if not self.session_id:
             raise Exception("No active session.")
         
         context = self.sessions[self.session_id]["parameters"]
-        enriched_input = self.enrich_with_analysis(user_input)
-        
-        import re
-        price_mentions = re.findall(r'\$?(\d+(?:\.\d+)?)', user_input)
-        mentioned_price = float(price_mentions[0]) if price_mentions else None
-
-        strategy_guidance = ""
-
-        if mentioned_price is not None:
-            max_price = context['max_price']
-            target_price = context['target_price'] 
-            min_price = context['min_price']
-            strategy = context['negotiation_strategy']
-            
-            if strategy == "aggressive":
-                if mentioned_price > target_price:
-                    strategy_guidance = f"""
-                    Since the user is offering {mentioned_price}, which is above our target of {target_price}, 
-                    we should push for an even higher price. Counter with a price closer to our maximum of {max_price}.
-                    """
-                else:
-                    strategy_guidance = f"""
-                    Since the user is offering {mentioned_price}, which is below our target of {target_price}, 
-                    we should strongly counter with a price at or above our target.
-                    """
-            if strategy == "standard":
-                if mentioned_price > target_price:
-                    strategy_guidance = f"""
-                    Since the user is offering {mentioned_price}, which is above our target of {target_price}, 
-                    we should push for an even higher price. Counter with a price closer to our maximum of {max_price}.
-                    """
-                else:
-                    strategy_guidance = f"""
-                    Since the user is offering {mentioned_price}, which is below our target of {target_price}, 
-                    we should strongly counter with a price at or above our target.
-                    """
-
-        prompt = f"""Negotiation Parameters:
-                        - Max Price: {context['max_price']}
-                        - Target: {context['target_price']}
-                        - Min Price: {context['min_price']}
-                        - Flexibility: {context['flexibility']}
-                        - Strategy: {context['negotiation_strategy']}
-
-                    {strategy_guidance}
-                    {enriched_input}
-
-                    USER INPUT: {user_input}
-                    
-                    CRITICAL INSTRUCTION: You are in a direct negotiation. Respond with ONLY the exact words you would say to the customer. Do not include any explanations or reasoning. When they mention a specific price:
-                    - If they offer MORE than our target price, try to increase it further (especially with aggressive strategy)
-                    - If they offer LESS than our target price, counter closer to our target
-                    
-                    Your response should be a single direct statement about price."""
-
-        payload = self.build_payload(prompt)
+        metrics = TurnMetrics()
+        analysis = self.enrich_with_analysis(user_input)  # once per turn: prompt and analytics
+        payload = self.build_payload(self.build_messages(user_input, context, self.history(), analysis))
         response = self.send_streaming_request(payload)
 
         if response:
-            full_reply = self.process_stream(response)
-
-            import re
-            quoted_text = re.findall(r'"([^"]*)"', full_reply)
-
-            if quoted_text:
-                reply = quoted_text[0]
-            else:
-                sentences = re.split(r'(?<=[.!?])\s+', full_reply)
-                relevant_sentences = [s for s in sentences if any(word in s.lower() for word in ["price", "deal", "offer", "$"])]
-
-                if relevant_sentences:
-                    reply = min(relevant_sentences, key=len)
-                else:
-                    reply = full_reply
+            full_reply = self.process_stream(response, metrics)
+            self.last_turn_metrics = metrics.finish()
+            reply = self.extract_reply(full_reply)
             self.save_message_locally("user", user_input)
+            self.record_analytics(user_input, analysis)
             self.save_message_locally("assistant", reply)
             return reply
         else:
-            fallback_reply = "I'm having trouble connecting to the model service."
+            fallback_reply = FALLBACK_REPLY
             print(f"\nFallback response: {fallback_reply}")
             self.save_message_locally("user", user_input)
+            self.record_analytics(user_input, analysis)
             self.save_message_locally("assistant", fallback_reply)
             return fallback_reply
+
+    def stream_reply(self, user_input, parameters, metrics=None, history=None, analysis=None):
+        """Yield reply tokens for one turn. Touches no session state, so one bot can serve many sessions."""
+        payload = self.build_payload(self.build_messages(user_input, parameters, history, analysis))
+        response = self.send_streaming_request(payload)
+
+        if not response:
+            if metrics:
+                metrics.on_token()
+            yield FALLBACK_REPLY
+            return
+
+        success = True
+        try:
+            yield from iter_stream_tokens(response.iter_lines(), metrics)
+        except requests.exceptions.RequestException:
+            success = False
+            raise
+        finally:
+            self.close_response(response, success)
+
+    async def astream_reply(self, user_input, parameters, metrics=None, client=None, history=None, analysis=None):
+        """Async variant of stream_reply on the pooled httpx client. Analysis runs in a worker thread."""
+        messages = await asyncio.to_thread(self.build_messages, user_input, parameters, history, analysis)
+        client = client or get_async_client()
+
+        try:
+            if self.backend_pool:
+                response = await self.backend_pool.aopen_stream(client, self.build_payload(messages), headers=self.headers)
+            else:
+                response = await open_stream(client, "POST", self.model_url, json=self.build_payload(messages), headers=self.headers)
+        except httpx.HTTPError as e:
+            print(f"Request failed: {e}")
+            response = None
+
+        if response is None or response.status_code != 200:
+            if response is not None:
+                await response.aread()
+                print(f"API Error: {response.status_code} - {response.text}")
+                await response.aclose()
+            if metrics:
+                metrics.on_token()
+            yield FALLBACK_REPLY
+            return
+
+        success = True
+        try:
+            async for token in aiter_stream_tokens(response.aiter_lines(), metrics):
+                yield token
+        except httpx.HTTPError:
+            success = False
+            raise
+        finally:
+            await response.aclose()
+            if self.backend_pool:
+                self.backend_pool.release_response(response, success)
+
+    def stream_message(self, user_input):
+        """Generator variant of send_message: yields tokens as they arrive, saves the turn when done.
+        Time-to-first-token and total latency end up in self.last_turn_metrics."""
+        if not self.session_id:
+            raise Exception("No active session.")
+
+        metrics = TurnMetrics()
+        analysis = self.enrich_with_analysis(user_input)
+        tokens = []
+        for token in self.stream_reply(user_input, self.sessions[self.session_id]["parameters"], metrics, self.history(), analysis):
+            tokens.append(token)
+            yield token
+
+        self.save_message_locally("user", user_input)
+        self.record_analytics(user_input, analysis)
+        self.save_message_locally("assistant", self.extract_reply("".join(tokens)))
+        self.last_turn_metrics = metrics.finish()
     
     def save_message_locally(self, role, content):
         message = {"role": role, "content": content}
@@ -237,6 +312,7 @@ class NegotiationBot:
 if __name__ == "__main__":
 
     bot = NegotiationBot()
+    bot.warmup()
     try:
         session = bot.create_session(
             max_price=1000,
@@ -1,18 +1,42 @@
+import asyncio
+import re
+import httpx
 import requests
-import json
 
-from app.chatbot.strategy.strategy_analysis import run_analysis_pipeline
+from app.chatbot.strategy.strategy_analysis import analysis_complete, run_analysis_pipeline, warmup_analysis
+from app.chatbot.strategy.pricing import extract_price
+from app.chatbot.strategy.strategy_engine import counter_offer
+from app.chatbot.cache import get_analysis_cache
+from app.chatbot.prompts import build_messages
+from app.chatbot.history import history_prompt, session_window
+from app.chatbot.http_client import get_http_session, get_async_client, open_stream, request_timeout
+from app.chatbot.streaming import TurnMetrics, iter_stream_tokens, aiter_stream_tokens
+from app.chatbot.write_behind import MessageWriter
+from app.core.config import settings
+from app.models.models import NegotiationParametersPatch
+
+FALLBACK_REPLY = "I'm having trouble connecting to the model service."
+QUOTED_TEXT = re.compile(r'"([^"]*)"')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
 
 
 class NegotiationBot:
-    def __init__(self, api_url, model_host="192.168.1.54", model_port=11434, model="mistral:latest"):
+    def __init__(self, api_url, model_host="192.168.1.54", model_port=11434, model="mistral:latest", http_session=None, backend_pool=None, analysis_cache=None):
         self.api_url = api_url
         self.session_id = None
         self.messages = []
         self.model = model
         self.model_url = f"http://{model_host}:{model_port}/api/chat"
         self.headers = {"Content-Type": "application/json"}
-        self.memory = {}
+        self.http = http_session or get_http_session()  # pooled keep-alive connections shared across bots
+        self.backend_pool = backend_pool  # optional BackendPool routing over several Ollama hosts
+        self.memory = analysis_cache or get_analysis_cache()  # shared LRU/LFU (+ optional Redis) analysis cache
+        self.parameters = None  # last known parameters of the active session
+        self.summary = None  # running summary of turns that left the prompt window
+        self.summarized_count = 0
+        self.last_turn_metrics = None
+        # Messages are saved in the background, batched per session (WRITE_BEHIND=false saves inline)
+        self.writer = MessageWriter(api_url, self.http) if settings.write_behind else None
 
     def create_session(self, max_price: float, min_price: float, target_price: float, product_id: str, flexibility: float = 0.1, negotiation_strategy: str = "standard"):
         """Create a new negotiation session"""
@@ -24,71 +48,84 @@ class NegotiationBot:
             "flexibility": flexibility,
             "negotiation_strategy": negotiation_strategy
         }
-        response = requests.post(f"{self.api_url}/negotiations", json=payload)
+        response = self.http.post(f"{self.api_url}/negotiations", json=payload, timeout=request_timeout())
         
         if response.status_code == 200:
             session_data = response.json()
             self.session_id = session_data["session_id"]
+            self.parameters = session_data["parameters"]
+            self.messages = []
+            self.summary, self.summarized_count = None, 0
             return session_data
         else:
             raise Exception(f"Failed to create session: {response.text}")
     
     def load_session(self, session_id: str):
         """Load an existing negotiation session"""
-        response = requests.get(f"{self.api_url}/negotiations/{session_id}")
+        if self.writer:
+            self.writer.flush()  # read our own writes
+        response = self.http.get(f"{self.api_url}/negotiations/{session_id}", timeout=request_timeout())
         if response.status_code == 200:
             session_data = response.json()
             self.session_id = session_id
             self.messages = session_data["messages"]
+            self.parameters = session_data["parameters"]
+            self.summary = session_data.get("summary")
+            self.summarized_count = session_data.get("summarized_count", 0)
             return session_data
         else:
             raise Exception(f"Failed to load session: {response.text}")
 
     def update_parameters(self, **kwargs):
-        """Update negotiation parameters"""
+        """Update negotiation parameters (a partial update: only the given fields are sent)"""
         if not self.session_id:
             raise Exception("No active session. Create or load a session first.")
-        
 
-        session = self.load_session(self.session_id)
-        parameters = session["parameters"]
-        
-        for key, value in kwargs.items():
-            if key in parameters:
-                parameters[key] = value
-        
-        response = requests.put(
+        changes = {key: value for key, value in kwargs.items() if key in NegotiationParametersPatch.model_fields}
+        response = self.http.patch(
             f"{self.api_url}/negotiations/{self.session_id}/parameters",
-            json=parameters
+            json=changes,
+            timeout=request_timeout()
         )
         
         if response.status_code != 200:
             raise Exception(f"Failed to update parameters: {response.text}")
         
+        self.parameters = response.json()["parameters"]
         return {"message": "Parameters updated successfully"}
     
+    def warmup(self):
+        """Load the analysis models now instead of on the first turn (they are imported lazily)"""
+        warmup_analysis()
 
     def enrich_with_analysis(self, user_input):
-        if user_input not in self.memory:
-            self.memory[user_input] = run_analysis_pipeline(user_input)
-        if len(self.memory) > 10:
-            self.memory.pop(next(iter(self.memory)))
-        return self.memory[user_input]
-
-    def build_payload(self, prompt): 
-        return {
+        return self.memory.get_or_compute(user_input, run_analysis_pipeline, cacheable=analysis_complete)
+
+    def session_analytics(self, session_id=None):
+        """The session's emotion/entity counters, kept by the API as user messages are appended"""
+        if self.writer:
+            self.writer.flush()
+        response = self.http.get(f"{self.api_url}/negotiations/{session_id or self.session_id}/analytics", timeout=request_timeout())
+        if response.status_code != 200:
+            raise Exception(f"Failed to load analytics: {response.text}")
+        return response.json()
+
+    def build_payload(self, messages):
+        payload = {
             "model": self.model,
             "options": {"temperature": 0.0},
             "stream": True,
-            "messages": [
-                {"role": "system", "content": "You are a helpful negotiation assistant."},
-                {"role": "user", "content": prompt}
-            ]
+            "messages": messages
         }
-    
+        if settings.ollama_keep_alive:
+            payload["keep_alive"] = settings.ollama_keep_alive  # keep the model and its prompt cache loaded between turns
+        return payload
+
     def send_streaming_request(self, payload):
+        if self.backend_pool:
+            return self.backend_pool.post_stream(self.http, payload, headers=self.headers, timeout=request_timeout())
         try:
-            response = requests.post(self.model_url, json=payload, headers=self.headers, stream=True)
+            response = self.http.post(self.model_url, json=payload, headers=self.headers, stream=True, timeout=request_timeout())
 
             if response.status_code == 200:
                 return response
@@ -99,25 +136,22 @@ class NegotiationBot:
             print(f"Request failed: {e}")
             return None
 
-    def process_stream(self, response):
-        full_reply = ""
+    def close_response(self, response, success=True):
+        response.close()
+        if self.backend_pool:
+            self.backend_pool.release_response(response, success)
+
+    def process_stream(self, response, metrics=None):
+        success = True
         try:
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        res = json.loads(line.decode('utf-8'))
-                        content = res.get('message', {}).get('content', '')
-                        full_reply += content
-                    except json.JSONDecodeError as e:
-                        print(f"\n[Error decoding JSON in stream: {e}]")
-                        continue
-                    except Exception as e:
-                        print(f"\n[Error processing stream chunk: {e}]")
-                        continue
+            full_reply = "".join(iter_stream_tokens(response.iter_lines(), metrics))
             print()
             return full_reply
+        except requests.exceptions.RequestException:
+            success = False  # the backend broke off the stream
+            raise
         finally:
-            response.close()  
+            self.close_response(response, success)
 
     # def send_message(self, user_input):
     #     if not self.session_id:
@@ -152,97 +186,169 @@ class NegotiationBot:
     #     return reply
 
 
+    def build_messages(self, user_input, context, history=None, analysis=None):
+        if analysis is None:
+            analysis = self.enrich_with_analysis(user_input)
+
+        # Ranked price extraction ("6-month warranty" is not an offer of $6) and a
+        # numeric counter-offer from the session's strategy table
+        strategy_guidance = ""
+        mentioned_price = extract_price(user_input, reference=context)
+        if mentioned_price is not None:
+            decision = counter_offer(context, mentioned_price)
+            if decision:
+                strategy_guidance = decision.guidance
+
+        return build_messages(context, user_input, analysis, strategy_guidance, history)
+
+    def history(self):
+        """Running summary + newest turns of the active session within the token budget (multi-turn mode, PROMPT_HISTORY_MESSAGES)"""
+        if not settings.prompt_history_messages or not self.session_id:
+            return []
+        window = session_window(self.messages[self.summarized_count:], self.summary, self.summarized_count, self.parameters)
+        self.summary, self.summarized_count = window.summary.as_dict(), window.summarized_count
+        if window.evicted:
+            self.save_summary_to_api()  # each turn is summarized once, here or by the API
+        return history_prompt(window)
+
+    def save_summary_to_api(self):
+        response = self.http.put(
+            f"{self.api_url}/negotiations/{self.session_id}/summary",
+            json={"summary": self.summary, "summarized_count": self.summarized_count},
+            timeout=request_timeout()
+        )
+        if response.status_code != 200:
+            print(f"Failed to save summary: {response.text}")
+
+    def extract_reply(self, full_reply):
+        # Post-process to extract just the core negotiation response
+        # Try to find quoted text first
+        quoted_text = QUOTED_TEXT.findall(full_reply)
+        if quoted_text:
+            return quoted_text[0]
+
+        # If no quotes, try to get the most relevant sentence about price
+        sentences = SENTENCE_END.split(full_reply)
+        # Use the shortest sentence that mentions price, deal, or offer
+        relevant_sentences = [s for s in sentences if any(word in s.lower() for word in ["price", "deal", "offer", "$"])]
+        if relevant_sentences:
+            return min(relevant_sentences, key=len)
+        return full_reply
+
     def send_message(self, user_input):
         if not self.session_id:
             raise Exception("No active session.")
         
-        context = self.sessions[self.session_id]["parameters"]
-        enriched_input = self.enrich_with_analysis(user_input)
-        
-        # Extract numeric values from user input for better price analysis
-        import re
-        price_mentions = re.findall(r'\$?(\d+(?:\.\d+)?)', user_input)
-        mentioned_price = float(price_mentions[0]) if price_mentions else None
-        
-        # Add guidance based on the mentioned price and our strategy
-        strategy_guidance = ""
-        if mentioned_price is not None:
-            max_price = context['max_price']
-            target_price = context['target_price'] 
-            min_price = context['min_price']
-            strategy = context['negotiation_strategy']
-            
-            if strategy == "aggressive":
-                if mentioned_price > target_price:
-                    strategy_guidance = f"""
-                    Since the user is offering {mentioned_price}, which is above our target of {target_price}, 
-                    we should push for an even higher price. Counter with a price closer to our maximum of {max_price}.
-                    """
-                else:
-                    strategy_guidance = f"""
-                    Since the user is offering {mentioned_price}, which is below our target of {target_price}, 
-                    we should strongly counter with a price at or above our target.
-                    """
-
-        prompt = f"""Negotiation Parameters:
-                        - Max Price: {context['max_price']}
-                        - Target: {context['target_price']}
-                        - Min Price: {context['min_price']}
-                        - Flexibility: {context['flexibility']}
-                        - Strategy: {context['negotiation_strategy']}
-
-                    {strategy_guidance}
-                    {enriched_input}
-                    USER INPUT: {user_input}
-                    
-                    CRITICAL INSTRUCTION: You are in a direct negotiation. Respond with ONLY the exact words you would say to the customer. Do not include any explanations or reasoning. When they mention a specific price:
-                    - If they offer MORE than our target price, try to increase it further (especially with aggressive strategy)
-                    - If they offer LESS than our target price, counter closer to our target
-                    
-                    Your response should be a single direct statement about price."""
-
-        payload = self.build_payload(prompt)
+        metrics = TurnMetrics()
+        payload = self.build_payload(self.build_messages(user_input, self.parameters, self.history()))
         response = self.send_streaming_request(payload)
         if response:
-            full_reply = self.process_stream(response)
-            
-            # Post-process to extract just the core negotiation response
-            import re
-            
-            # Try to find quoted text first
-            quoted_text = re.findall(r'"([^"]*)"', full_reply)
-            if quoted_text:
-                reply = quoted_text[0]
-            else:
-                # If no quotes, try to get the most relevant sentence about price
-                sentences = re.split(r'(?<=[.!?])\s+', full_reply)
-                # Use the shortest sentence that mentions price, deal, or offer
-                relevant_sentences = [s for s in sentences if any(word in s.lower() for word in ["price", "deal", "offer", "$"])]
-                if relevant_sentences:
-                    reply = min(relevant_sentences, key=len)
-                else:
-                    reply = full_reply
+            full_reply = self.process_stream(response, metrics)
+            self.last_turn_metrics = metrics.finish()
+            reply = self.extract_reply(full_reply)
             
             self.save_message_to_api("user", user_input)
             self.save_message_to_api("assistant", reply)
             return reply
         else:
-            fallback_reply = "I'm having trouble connecting to the model service."
+            fallback_reply = FALLBACK_REPLY
             print(f"\nFallback response: {fallback_reply}")
             self.save_message_to_api("user", user_input)
             self.save_message_to_api("assistant", fallback_reply)
             return fallback_reply
 
 
+    def stream_reply(self, user_input, parameters, metrics=None, history=None, analysis=None):
+        """Yield reply tokens for one turn. Touches no session state, so one bot can serve many sessions."""
+        payload = self.build_payload(self.build_messages(user_input, parameters, history, analysis))
+        response = self.send_streaming_request(payload)
+
+        if not response:
+            if metrics:
+                metrics.on_token()
+            yield FALLBACK_REPLY
+            return
+
+        success = True
+        try:
+            yield from iter_stream_tokens(response.iter_lines(), metrics)
+        except requests.exceptions.RequestException:
+            success = False
+            raise
+        finally:
+            self.close_response(response, success)
+
+    async def astream_reply(self, user_input, parameters, metrics=None, client=None, history=None, analysis=None):
+        """Async variant of stream_reply on the pooled httpx client. Analysis runs in a worker thread."""
+        messages = await asyncio.to_thread(self.build_messages, user_input, parameters, history, analysis)
+        client = client or get_async_client()
+
+        try:
+            if self.backend_pool:
+                response = await self.backend_pool.aopen_stream(client, self.build_payload(messages), headers=self.headers)
+            else:
+                response = await open_stream(client, "POST", self.model_url, json=self.build_payload(messages), headers=self.headers)
+        except httpx.HTTPError as e:
+            print(f"Request failed: {e}")
+            response = None
+
+        if response is None or response.status_code != 200:
+            if response is not None:
+                await response.aread()
+                print(f"API Error: {response.status_code} - {response.text}")
+                await response.aclose()
+            if metrics:
+                metrics.on_token()
+            yield FALLBACK_REPLY
+            return
+
+        success = True
+        try:
+            async for token in aiter_stream_tokens(response.aiter_lines(), metrics):
+                yield token
+        except httpx.HTTPError:
+            success = False
+            raise
+        finally:
+            await response.aclose()
+            if self.backend_pool:
+                self.backend_pool.release_response(response, success)
+
+    def stream_message(self, user_input):
+        """Generator variant of send_message: yields tokens as they arrive, saves the turn when done.
+        Time-to-first-token and total latency end up in self.last_turn_metrics."""
+        if not self.session_id:
+            raise Exception("No active session.")
+
+        metrics = TurnMetrics()
+        tokens = []
+        for token in self.stream_reply(user_input, self.parameters, metrics, self.history()):
+            tokens.append(token)
+            yield token
+
+        self.save_message_to_api("user", user_input)
+        self.save_message_to_api("assistant", self.extract_reply("".join(tokens)))
+        self.last_turn_metrics = metrics.finish()
+
     def save_message_to_api(self, role, content):
         message = {"role": role, "content": content}
-        requests.post(f"{self.api_url}/negotiations/{self.session_id}/messages", json=message)
+        self.messages.append(message)
+        if self.writer:
+            self.writer.enqueue(self.session_id, message)
+            return
+        self.http.post(f"{self.api_url}/negotiations/{self.session_id}/messages", json=message, timeout=request_timeout())
+
+    def close(self, timeout=10.0):
+        """Write any queued messages before the bot goes away (also runs at interpreter exit)"""
+        if self.writer:
+            self.writer.close(timeout)
 
 
 if __name__ == "__main__":
 
     api_url = "http://0.0.0.0:8000"  # Replace with your actual API URL
     bot = NegotiationBot(api_url=api_url)
+    bot.warmup()
 
     # Step 1: Create a negotiation session
     try:
@@ -271,3 +377,5 @@ if __name__ == "__main__":
         print(f"[Error] Failed during message exchange: {e}")
 
 
+
+    bot.close()  # flush the queued messages
@@ -0,0 +1,140 @@
+from typing import Dict, List, NamedTuple, Optional
+
+from app.chatbot.prompts import HISTORY_ROLES
+from app.chatbot.strategy.pricing import extract_price
+from app.core.config import settings
+
+# ==================================================
+# CONVERSATION HISTORY WINDOW (multi-turn mode)
+# ==================================================
+# The prompt carries the newest turns verbatim, bounded by a token budget and
+# a message count. Older turns are folded into a running summary that is
+# stored with the session, so each message is summarized exactly once and the
+# prompt size stays bounded however long the negotiation runs:
+#
+#   [system] [summary of turns 0..k) ] [turns k..n verbatim] [this turn]
+#
+# Eviction has hysteresis: once over budget the window is cut down to
+# KEEP_RATIO of it, so the summary and the window's first message (the
+# prompt prefix the backend caches) only change every few turns.
+
+CHARS_PER_TOKEN = 4         # rough estimate for Mistral/Llama tokenizers on English text
+KEEP_RATIO = 0.5            # fraction of the budget kept after an eviction
+SUMMARY_OFFERS = 5          # most recent offers kept per side in the summary
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class HistorySummary:
+    """Running summary of the evicted turns: counts and the offers each side made"""
+
+    def __init__(self, turns: int = 0, first_offer: Optional[float] = None, customer_offers: Optional[List[float]] = None, our_offers: Optional[List[float]] = None):
+        self.turns = turns
+        self.first_offer = first_offer
+        self.customer_offers = customer_offers or []
+        self.our_offers = our_offers or []
+
+    def fold(self, messages: List[Dict], reference: Optional[Dict] = None):
+        """Add evicted messages. Only the last SUMMARY_OFFERS offers per side are kept, so the summary is bounded too."""
+        for message in messages:
+            price = extract_price(message["content"], reference)
+            if message["role"] == "user":
+                self.turns += 1
+                if price is not None:
+                    if self.first_offer is None:
+                        self.first_offer = price
+                    self.customer_offers = (self.customer_offers + [price])[-SUMMARY_OFFERS:]
+            elif message["role"] == "assistant" and price is not None:
+                self.our_offers = (self.our_offers + [price])[-SUMMARY_OFFERS:]
+
+    def render(self) -> str:
+        if not self.turns:
+            return ""
+        lines = [f"Earlier in this negotiation ({self.turns} customer messages, summarized):"]
+        if self.customer_offers:
+            offers = " -> ".join(f"{p:g}" for p in self.customer_offers)
+            lines.append(f"Customer offers: {offers} (first offer {self.first_offer:g}).")
+        if self.our_offers:
+            lines.append(f"Our prices: {' -> '.join(f'{p:g}' for p in self.our_offers)}.")
+        if not (self.customer_offers or self.our_offers):
+            lines.append("No prices were mentioned.")
+        return "\n".join(lines)
+
+    def as_dict(self) -> Dict:
+        return {
+            "turns": self.turns,
+            "first_offer": self.first_offer,
+            "customer_offers": self.customer_offers,
+            "our_offers": self.our_offers,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> "HistorySummary":
+        return cls(**data) if data else cls()
+
+
+class HistoryWindow(NamedTuple):
+    summary: HistorySummary
+    summarized_count: int       # messages folded into the summary, from the start of the session
+    messages: List[Dict]        # verbatim tail
+    evicted: int                # messages folded in by this call (0 = summary unchanged)
+
+
+def window_history(
+    messages: List[Dict],
+    summary: Optional[HistorySummary] = None,
+    summarized_count: int = 0,
+    token_budget: int = 1024,
+    max_messages: int = 0,
+    reference: Optional[Dict] = None
+) -> HistoryWindow:
+    """Fit the unsummarized tail of a session (`messages`, starting at `summarized_count`) into the budget.
+
+    Anything that doesn't fit is folded into `summary`. `max_messages` <= 0 means no count limit.
+    """
+    summary = summary or HistorySummary()
+    positions = [i for i, m in enumerate(messages) if m.get("role") in HISTORY_ROLES]
+    turns = [messages[i] for i in positions]
+    sizes = [estimate_tokens(m["content"]) for m in turns]
+
+    if sum(sizes) <= token_budget and (max_messages <= 0 or len(turns) <= max_messages):
+        return HistoryWindow(summary, summarized_count, turns, 0)
+
+    # Over a limit: keep the newest messages within KEEP_RATIO of both limits
+    keep_tokens = int(token_budget * KEEP_RATIO)
+    keep_messages = int(max_messages * KEEP_RATIO) if max_messages > 0 else len(turns)
+    kept, total = 0, 0
+    for size in reversed(sizes):
+        if kept >= keep_messages or total + size > keep_tokens:
+            break
+        kept += 1
+        total += size
+
+    split = len(turns) - kept
+    if kept > 1 and turns[split]["role"] == "assistant":
+        split += 1  # start the window on a customer message
+    summary.fold(turns[:split], reference)
+    # `messages` may contain other roles, so count what was consumed from it
+    consumed = positions[split] if split < len(turns) else len(messages)
+    return HistoryWindow(summary, summarized_count + consumed, turns[split:], consumed)
+
+
+def history_prompt(window: HistoryWindow) -> List[Dict]:
+    """Messages that go between the system message and this turn"""
+    text = window.summary.render()
+    summary = [{"role": "system", "content": text}] if text else []
+    return summary + [{"role": m["role"], "content": m["content"]} for m in window.messages]
+
+
+def session_window(messages: List[Dict], summary: Optional[Dict], summarized_count: int, reference: Optional[Dict] = None) -> HistoryWindow:
+    """window_history with the configured limits (HISTORY_TOKEN_BUDGET, PROMPT_HISTORY_MESSAGES) and a stored summary"""
+    return window_history(
+        messages,
+        HistorySummary.from_dict(summary),
+        summarized_count,
+        token_budget=settings.history_token_budget,
+        max_messages=settings.prompt_history_messages,
+        reference=reference
+    )
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.core.config import settings
+
+# ==================================================
+# SHARED HTTP CLIENTS (Ollama backend + negotiation API)
+# ==================================================
+# One keep-alive connection pool per process, reused by every bot, instead of
+# a fresh TCP connection per requests.post call.
+
+RETRY_STATUSES = (502, 503, 504)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def request_timeout():
+    """(connect, read) tuple for requests calls"""
+    return (settings.http_connect_timeout, settings.http_read_timeout)
+
+
+def create_http_session(
+    pool_maxsize: Optional[int] = None,
+    retries: Optional[int] = None,
+    backoff_factor: Optional[float] = None
+) -> requests.Session:
+    retry = Retry(
+        total=settings.http_retries if retries is None else retries,
+        connect=settings.http_retries if retries is None else retries,
+        read=0,  # the request may already have been processed
+        # Gateway statuses are retried for idempotent methods only (urllib3's default
+        # allowed_methods): a 504 can come after the API applied a POST. Connect errors
+        # are retried for every method, nothing was sent yet.
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=settings.http_backoff_factor if backoff_factor is None else backoff_factor,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings.http_pool_connections,
+        pool_maxsize=pool_maxsize or settings.http_pool_maxsize,
+        max_retries=retry,
+        pool_block=True  # wait for a free connection rather than opening extra sockets
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Content-Type": "application/json"})
+    return session
+
+
+def get_http_session() -> requests.Session:
+    """Process-wide pooled requests.Session (thread-safe for concurrent requests)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_http_session()
+    return _session
+
+
+def create_async_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.http_pool_maxsize,
+            max_keepalive_connections=settings.http_pool_maxsize
+        ),
+        timeout=httpx.Timeout(settings.http_read_timeout, connect=settings.http_connect_timeout),
+        headers={"Content-Type": "application/json"}
+    )
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Process-wide httpx client for callers without their own (the API lifespan owns one instead)"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = create_async_client()
+    return _async_client
+
+
+async def open_stream(client: httpx.AsyncClient, method: str, url: str, retries: Optional[int] = None, backoff_factor: Optional[float] = None, **kwargs) -> httpx.Response:
+    """Send a streaming request, retrying with exponential backoff on connect errors and gateway statuses.
+
+    The caller owns the returned response and must `await response.aclose()`.
+    """
+    retries = settings.http_retries if retries is None else retries
+    backoff_factor = settings.http_backoff_factor if backoff_factor is None else backoff_factor
+
+    for attempt in range(retries + 1):
+        try:
+            response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            await response.aclose()
+        await asyncio.sleep(backoff_factor * (2 ** attempt))
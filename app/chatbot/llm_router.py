@@ -0,0 +1,335 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, List, Optional, Tuple
+
+import httpx
+import requests
+
+from app.chatbot.http_client import open_stream
+
+# ==================================================
+# LLM BACKEND POOL (several Ollama hosts behind one bot)
+# ==================================================
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Backend:
+    def __init__(self, base_url: str, max_concurrency: int):
+        self.base_url = base_url.rstrip("/")
+        self.chat_url = f"{self.base_url}/api/chat"
+        self.health_url = f"{self.base_url}/api/tags"
+        self.max_concurrency = max_concurrency
+
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    @property
+    def load(self) -> float:
+        """Queue depth relative to capacity, so bigger boxes get proportionally more traffic"""
+        return self.outstanding / self.max_concurrency
+
+    def has_capacity(self) -> bool:
+        return self.outstanding < self.max_concurrency
+
+    def stats(self):
+        return {
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+        }
+
+
+def parse_endpoints(value: str, default_port: int = 11434) -> List[str]:
+    """"gpu1:11434, gpu2" -> ["http://gpu1:11434", "http://gpu2:11434"]"""
+    endpoints = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "://" not in item:
+            item = f"http://{item}"
+        if item.count(":") < 2:
+            item = f"{item}:{default_port}"
+        endpoints.append(item)
+    return endpoints
+
+
+class BackendPool:
+    """Least-outstanding-requests routing with per-backend concurrency limits.
+
+    A backend is ejected after `failure_threshold` consecutive failures and gets
+    traffic again once a health check passes (or `ejection_seconds` elapse, as a
+    single probe). If every backend is ejected, requests go to the least loaded
+    one anyway rather than failing outright.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[str],
+        max_concurrency: int = 4,
+        failure_threshold: int = 3,
+        ejection_seconds: float = 30.0,
+        health_check_interval: float = 10.0,
+        health_check_timeout: float = 2.0,
+        acquire_timeout: Optional[float] = 60.0,
+        http_session: Optional[requests.Session] = None
+    ):
+        if not endpoints:
+            raise ValueError("BackendPool needs at least one endpoint")
+
+        self.backends = [Backend(url, max_concurrency) for url in endpoints]
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.acquire_timeout = acquire_timeout
+        self.http = http_session or requests.Session()
+
+        self._cond = threading.Condition()
+        # aacquire() waiters, woken by release() from whichever thread or loop it runs on
+        self._async_waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+    # ----------------------------------------
+    # Routing
+    # ----------------------------------------
+
+    def _pick(self) -> Optional[Backend]:
+        now = time.monotonic()
+        routable = [b for b in self.backends if b.healthy or now >= b.ejected_until]
+        if not routable:
+            routable = self.backends  # everything ejected: degrade instead of refusing
+        candidates = [b for b in routable if b.has_capacity()]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda b: (b.load, b.total_requests))
+
+    def _take(self, backend: Backend) -> Backend:
+        backend.outstanding += 1
+        backend.total_requests += 1
+        if not backend.healthy:
+            # Half-open probe: push the ejection window so only one request tries it
+            backend.ejected_until = time.monotonic() + self.ejection_seconds
+        return backend
+
+    def try_acquire(self) -> Optional[Backend]:
+        with self._cond:
+            backend = self._pick()
+            return self._take(backend) if backend else None
+
+    def acquire(self, timeout: Optional[float] = None) -> Backend:
+        """Block until some backend has a free slot"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                backend = self._pick()
+                if backend:
+                    return self._take(backend)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise NoBackendAvailable("All LLM backends are at their concurrency limit")
+                self._cond.wait(remaining)
+
+    async def aacquire(self, timeout: Optional[float] = None) -> Backend:
+        """Async acquire: waits on a future that release() resolves, no thread parked per waiter"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                backend = self._pick()
+                if backend:
+                    return self._take(backend)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise NoBackendAvailable("All LLM backends are at their concurrency limit")
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            woken = False
+            try:
+                await asyncio.wait_for(waiter[1], remaining)
+                woken = True
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self._forget(waiter, woken)
+
+    def _forget(self, waiter, woken: bool):
+        try:
+            self._async_waiters.remove(waiter)
+        except ValueError:
+            if not woken:
+                self._notify_async()  # release() picked it after it gave up: pass the wakeup on
+
+    def _notify_async(self, everyone: bool = False):
+        """Wake the oldest aacquire() waiter (or all); call with self._cond held"""
+        while self._async_waiters:
+            loop, future = self._async_waiters.popleft()
+            loop.call_soon_threadsafe(_wake, future)
+            if not everyone:
+                break
+
+    def release(self, backend: Backend, success: bool = True):
+        with self._cond:
+            backend.outstanding = max(0, backend.outstanding - 1)
+            if success:
+                backend.consecutive_failures = 0
+                backend.healthy = True
+            else:
+                backend.total_failures += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.failure_threshold:
+                    self._eject(backend)
+            self._cond.notify()
+            self._notify_async()
+
+    def _eject(self, backend: Backend):
+        backend.healthy = False
+        backend.ejected_until = time.monotonic() + self.ejection_seconds
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None):
+        backend = self.acquire(timeout)
+        success = False
+        try:
+            yield backend
+            success = True
+        finally:
+            self.release(backend, success)
+
+    @asynccontextmanager
+    async def alease(self, timeout: Optional[float] = None):
+        backend = await self.aacquire(timeout)
+        success = False
+        try:
+            yield backend
+            success = True
+        finally:
+            self.release(backend, success)
+
+    # ----------------------------------------
+    # Streaming requests (lease held until release_response)
+    # ----------------------------------------
+
+    def post_stream(self, session: requests.Session, payload, attempts: int = 2, **kwargs) -> Optional[requests.Response]:
+        """POST a streaming chat request to the least loaded backend, failing over to another on error.
+
+        The returned response keeps its backend slot until `release_response` is called.
+        """
+        for _ in range(min(attempts, len(self.backends))):
+            try:
+                backend = self.acquire(self.acquire_timeout)
+            except NoBackendAvailable as e:
+                print(f"Request failed: {e}")
+                return None
+            try:
+                response = session.post(backend.chat_url, json=payload, stream=True, **kwargs)
+            except requests.exceptions.RequestException as e:
+                print(f"Request to {backend.base_url} failed: {e}")
+                self.release(backend, success=False)
+                continue
+
+            if response.status_code == 200:
+                response.backend = backend
+                return response
+
+            print(f"API Error from {backend.base_url}: {response.status_code} - {response.text}")
+            response.close()
+            self.release(backend, success=response.status_code < 500)
+            if response.status_code < 500:
+                return None  # a bad request fails the same way everywhere
+        return None
+
+    async def aopen_stream(self, client: httpx.AsyncClient, payload, attempts: int = 2, **kwargs) -> Optional[httpx.Response]:
+        """Async twin of post_stream on an httpx client"""
+        for _ in range(min(attempts, len(self.backends))):
+            try:
+                backend = await self.aacquire(self.acquire_timeout)
+            except NoBackendAvailable as e:
+                print(f"Request failed: {e}")
+                return None
+            try:
+                response = await open_stream(client, "POST", backend.chat_url, retries=0, json=payload, **kwargs)
+            except httpx.HTTPError as e:
+                print(f"Request to {backend.base_url} failed: {e}")
+                self.release(backend, success=False)
+                continue
+
+            if response.status_code == 200:
+                response.backend = backend
+                return response
+
+            await response.aread()
+            print(f"API Error from {backend.base_url}: {response.status_code} - {response.text}")
+            await response.aclose()
+            self.release(backend, success=response.status_code < 500)
+            if response.status_code < 500:
+                return None
+        return None
+
+    def release_response(self, response, success: bool = True):
+        """Give back the slot of a post_stream / aopen_stream response; `success` False
+        when the stream broke off, which counts towards ejecting the backend"""
+        backend = getattr(response, "backend", None)
+        if backend is not None:
+            response.backend = None
+            self.release(backend, success)
+
+    # ----------------------------------------
+    # Health checks
+    # ----------------------------------------
+
+    def check_health(self):
+        """Probe every backend once; ejects dead ones and re-admits recovered ones"""
+        for backend in self.backends:
+            try:
+                ok = self.http.get(backend.health_url, timeout=self.health_check_timeout).status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            with self._cond:
+                if ok:
+                    backend.healthy = True
+                    backend.consecutive_failures = 0
+                    self._cond.notify_all()
+                    self._notify_async(everyone=True)
+                elif backend.healthy:
+                    self._eject(backend)
+
+    def start_health_checks(self):
+        if self._health_thread and self._health_thread.is_alive():
+            return
+        self._stop.clear()
+        self._health_thread = threading.Thread(target=self._health_loop, name="llm-health-check", daemon=True)
+        self._health_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._health_thread:
+            self._health_thread.join(self.health_check_timeout + 1)
+
+    def _health_loop(self):
+        while not self._stop.is_set():
+            self.check_health()
+            self._stop.wait(self.health_check_interval)
+
+    def stats(self):
+        with self._cond:
+            return [b.stats() for b in self.backends]
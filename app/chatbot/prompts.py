@@ -0,0 +1,59 @@
+from typing import Dict, List, Optional
+
+# ==================================================
+# PROMPT LAYER
+# ==================================================
+# Messages are ordered from most to least stable so consecutive requests share
+# the longest possible prefix and Ollama can reuse its KV cache:
+#   1. system: fixed instructions + session parameters (changes only on update)
+#   2. multi-turn mode: running summary, then earlier turns verbatim (app.chatbot.history)
+#   3. this turn: guidance, analysis and the customer's words
+# Templates carry no indentation; every whitespace character is prefilled.
+
+SYSTEM_PREFIX = (
+    "You are negotiating a price directly with a customer.\n"
+    "Reply with ONLY the exact words you would say to the customer: no explanations, reasoning or labels.\n"
+    "When they mention a specific price:\n"
+    "- If they offer MORE than our target price, try to increase it further (especially with aggressive strategy)\n"
+    "- If they offer LESS than our target price, counter closer to our target\n"
+    "Your response should be a single direct statement about price."
+)
+
+PARAMETERS_TEMPLATE = (
+    "Negotiation parameters: max price {max_price:g}, target {target_price:g}, min price {min_price:g}, "
+    "flexibility {flexibility:g}, strategy {negotiation_strategy}."
+)
+
+HISTORY_ROLES = ("user", "assistant")
+
+
+def system_message(parameters: Dict) -> Dict:
+    """Identical for every turn of a session until its parameters change"""
+    details = PARAMETERS_TEMPLATE.format(
+        max_price=parameters["max_price"],
+        target_price=parameters["target_price"],
+        min_price=parameters["min_price"],
+        flexibility=parameters.get("flexibility") or 0,
+        negotiation_strategy=parameters.get("negotiation_strategy") or "standard"
+    )
+    return {"role": "system", "content": f"{SYSTEM_PREFIX}\n{details}"}
+
+
+def turn_message(user_input: str, analysis: Optional[Dict] = None, guidance: str = "") -> Dict:
+    lines = []
+    if guidance:
+        lines.append(f"Guidance: {guidance}")
+    if analysis:
+        # "analysis" only restates the input, so it stays out of the prompt
+        entities = ", ".join(analysis.get("key_entities", []))
+        lines.append(f"Analysis: sentiment {analysis.get('sentiment', '')}; intent {analysis.get('intent', '')}; entities {entities}")
+    lines.append(f"Customer: {user_input}")
+    return {"role": "user", "content": "\n".join(lines)}
+
+
+def build_messages(parameters: Dict, user_input: str, analysis: Optional[Dict] = None, guidance: str = "", history: Optional[List[Dict]] = None) -> List[Dict]:
+    return [system_message(parameters), *(history or []), turn_message(user_input, analysis, guidance)]
+
+
+def prompt_chars(messages: List[Dict]) -> int:
+    return sum(len(m["content"]) for m in messages)
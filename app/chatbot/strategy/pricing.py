@@ -0,0 +1,104 @@
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+# ==================================================
+# PRICE / OFFER EXTRACTION
+# ==================================================
+# Every number in the message becomes a candidate and is scored on its
+# context: currency markers and offer words push it up, units that make it
+# something other than a price ("6-month warranty", "12%", "500 units") push
+# it down. The best candidate with a non-negative score is the offer.
+
+PRICE_PATTERN = re.compile(
+    r"""
+    (?P<currency>[$€£]|\b(?:usd|eur|gbp)\b)?\s?
+    (?<![\w.,])
+    (?P<number>\d{1,3}(?:,\d{3})+|\d+)(?!,?\d)  # thousands groups of exactly 3 digits, "1,2345" is no number
+    (?:\.(?P<decimals>\d+))?
+    (?:\s?(?P<suffix>k|thousand|grand|mn|million)\b)?
+    (?P<after>\s?(?:dollars?|bucks|usd|euros?|eur|gbp|pounds?)\b)?
+    """,
+    re.IGNORECASE | re.VERBOSE
+)
+
+# Units that make the preceding number something other than a price
+NON_PRICE_UNIT = re.compile(
+    r"\s?-?\s?(?:%|percent|x\b|(?:days?|weeks?|months?|years?|yrs?|hours?|hrs?|minutes?|mins?|"
+    r"units?|pcs|pieces?|items?|boxes|pallets?|trucks?|loads?|kg|lbs?|tons?|miles?|km|people|times?)\b)",
+    re.IGNORECASE
+)
+
+# Words that introduce an offer shortly before the number
+OFFER_CONTEXT = re.compile(
+    r"\b(?:offer(?:ing)?|pay|price|budget|for|at|about|around|deal|settle|counter|go|do|make it|best|accept|up to|max(?:imum)?|spend)\W*$",
+    re.IGNORECASE
+)
+
+MULTIPLIERS = {"k": 1_000, "thousand": 1_000, "grand": 1_000, "mn": 1_000_000, "million": 1_000_000}
+CONTEXT_WINDOW = 24  # characters of left context checked for offer words
+
+SCORE_CURRENCY = 3
+SCORE_OFFER_CONTEXT = 2
+SCORE_MULTIPLIER = 1
+SCORE_IN_RANGE = 1
+PENALTY_NON_PRICE_UNIT = -5
+PENALTY_IMPLAUSIBLE = -2
+
+
+class PriceCandidate(NamedTuple):
+    value: float
+    score: int
+    start: int
+    end: int
+    text: str
+
+
+def _parse_value(match) -> float:
+    value = float(match.group("number").replace(",", ""))
+    if match.group("decimals"):
+        value += float(f"0.{match.group('decimals')}")
+    suffix = match.group("suffix")
+    if suffix:
+        value *= MULTIPLIERS[suffix.lower()]
+    return value
+
+
+def price_candidates(text: str, reference: Optional[Dict] = None) -> List[PriceCandidate]:
+    """All numbers in the text scored as potential prices, best first.
+
+    `reference` (negotiation parameters with min_price / max_price) lets values
+    far outside the negotiated range rank lower.
+    """
+    low = high = None
+    if reference:
+        low, high = reference.get("min_price"), reference.get("max_price")
+
+    candidates = []
+    for match in PRICE_PATTERN.finditer(text):
+        value = _parse_value(match)
+        score = 0
+        if match.group("currency") or match.group("after"):
+            score += SCORE_CURRENCY
+        if match.group("suffix"):
+            score += SCORE_MULTIPLIER
+        if OFFER_CONTEXT.search(text[max(0, match.start() - CONTEXT_WINDOW):match.start()]):
+            score += SCORE_OFFER_CONTEXT
+        if NON_PRICE_UNIT.match(text, match.end()):
+            score += PENALTY_NON_PRICE_UNIT
+        if low and high:
+            if low / 10 <= value <= high * 10:
+                score += SCORE_IN_RANGE
+            else:
+                score += PENALTY_IMPLAUSIBLE
+        candidates.append(PriceCandidate(value, score, match.start(), match.end(), match.group(0).strip()))
+
+    # Stable sort: equal scores keep text order
+    return sorted(candidates, key=lambda c: c.score, reverse=True)
+
+
+def extract_price(text: str, reference: Optional[Dict] = None) -> Optional[float]:
+    """The most likely offered price in the message, or None if nothing looks like one"""
+    candidates = price_candidates(text, reference)
+    if candidates and candidates[0].score >= 0:
+        return candidates[0].value
+    return None
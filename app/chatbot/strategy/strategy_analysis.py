@@ -1,14 +1,312 @@
-from tools.negotiation_tools import detect_emotion
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from app.chatbot.backend.workers import get_model_workers
+from app.chatbot.strategy.pricing import extract_price
+from app.chatbot.tools.negotiation_tools import analyze_emotions, analyze_entities, warmup_models
+from app.core.config import settings
+
+# ==================================================
+# ANALYSIS PIPELINE (DAG of concurrent stages)
+# ==================================================
+# Each analyzer is a stage with its dependencies. Stages whose inputs are
+# ready run concurrently on a shared thread pool (the models release the GIL
+# during inference, or run in the model worker processes when MODEL_WORKERS is
+# set), so analysis takes about as long as the slowest stage rather than the
+# sum. An optional stage that fails or misses its deadline is replaced by its
+# default and listed in the result's "skipped". Deadlines:
+#   - per stage, counted from when a pool thread starts running it;
+#   - per run (ANALYSIS_DEADLINE), counted from the start of the run, so it
+#     covers time spent queued behind other runs: optional stages that haven't
+#     started by then are skipped without running.
+# A late stage finishes in the background and its result is dropped; its
+# thread is detached from the pool (see StagePool), so it doesn't hold a slot.
+#
+#   emotions ─┐
+#   entities ─┼─> analysis dict
+#   price ────┘
+
+
+class Stage(NamedTuple):
+    name: str
+    fn: Callable[..., Any]              # fn(text, **results of `requires`)
+    requires: Tuple[str, ...] = ()
+    timeout: Optional[float] = None     # seconds from when the stage starts running (not queued); None waits
+    optional: bool = False              # skip on failure / timeout instead of raising
+    default: Any = None
+
+
+QUEUED_POLL = 0.01  # seconds between checks for queued stages starting (their deadline clock)
+
+
+class StagePool(Executor):
+    """Thread pool whose `max_workers` limit counts only stages a run still waits for.
+
+    detach(future) gives up on a running stage: its thread finishes the call in
+    the background and then exits, and a replacement thread takes its slot.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "analysis"):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._workers = 0  # threads counted against max_workers
+        self._idle = 0
+        self._running: Set[Future] = set()
+        self._detached: Set[Future] = set()
+        self._names = itertools.count()
+        self._shutdown = False
+
+    @property
+    def active(self) -> int:
+        """Stages running that some run still waits for (detached ones excluded)"""
+        with self._lock:
+            return len(self._running) - len(self._detached)
+
+    def _spawn(self):
+        # Called with self._lock held
+        self._workers += 1
+        threading.Thread(target=self._work, name=f"{self.thread_name_prefix}_{next(self._names)}", daemon=True).start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("StagePool is shut down")
+            self._queue.put((future, fn, args, kwargs))
+            if self._idle == 0 and self._workers < self.max_workers:
+                self._spawn()
+        return future
+
+    def detach(self, future: Future):
+        """Stop counting a running stage's thread; a replacement thread is started"""
+        with self._lock:
+            if future not in self._running or future in self._detached or future.done():
+                return
+            self._detached.add(future)
+            self._workers -= 1
+            if not self._shutdown:
+                self._spawn()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            item = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue  # cancelled while queued
+            with self._lock:
+                self._running.add(future)
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            with self._lock:
+                self._running.discard(future)
+                if future in self._detached:
+                    self._detached.discard(future)
+                    return  # replaced while it ran
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._shutdown = True
+            workers = self._workers
+        for _ in range(workers):
+            self._queue.put(None)
+
+
+class AnalysisDAG:
+    def __init__(self, stages: Sequence[Stage], executor: Optional[Executor] = None, deadline: Optional[float] = None):
+        names = [stage.name for stage in stages]
+        if len(set(names)) != len(names):
+            raise ValueError("Stage names must be unique")
+        # Topological order; rejects unknown dependencies and cycles
+        ordered, done = [], set()
+        remaining = list(stages)
+        while remaining:
+            ready = [stage for stage in remaining if set(stage.requires) <= done]
+            if not ready:
+                raise ValueError(f"Unresolvable stage dependencies: {[stage.name for stage in remaining]}")
+            for stage in ready:
+                remaining.remove(stage)
+                ordered.append(stage)
+                done.add(stage.name)
+        self.stages = ordered
+        self._executor = executor
+        self.deadline = deadline  # seconds per run, queueing included; None waits
+
+    @property
+    def executor(self) -> Executor:
+        return self._executor or get_analysis_executor()
+
+    def run(self, text: str) -> Tuple[Dict[str, Any], Dict[str, float], List[str]]:
+        """(results by stage, milliseconds per stage, skipped stage names)"""
+        run_deadline = None if self.deadline is None else time.perf_counter() + self.deadline
+        executor = self.executor
+        results: Dict[str, Any] = {}
+        timings: Dict[str, float] = {}
+        skipped: List[str] = []
+        waiting = list(self.stages)
+        pending = {}
+        started: Dict[str, float] = {}  # set by the pool thread when a stage starts running
+
+        def call(stage: Stage, inputs: Dict[str, Any]):
+            started[stage.name] = time.perf_counter()
+            return stage.fn(text, **inputs)
+
+        def skip(stage: Stage, reason: str):
+            if not stage.optional:
+                raise TimeoutError(f"Analysis stage {stage.name} {reason}")
+            print(f"Analysis stage {stage.name} skipped: {reason}")
+            results[stage.name] = stage.default
+            skipped.append(stage.name)
+
+        def submit_ready():
+            for stage in [s for s in waiting if all(dep in results for dep in s.requires)]:
+                waiting.remove(stage)
+                future = executor.submit(call, stage, {dep: results[dep] for dep in stage.requires})
+                pending[future] = stage
+
+        def skip_unstarted():
+            # Run deadline passed: optional stages that never got a thread are skipped
+            for stage in [s for s in waiting if s.optional]:
+                waiting.remove(stage)
+                skip(stage, f"not started within the {self.deadline:g}s analysis deadline")
+            for future, stage in list(pending.items()):
+                if stage.optional and stage.name not in started and future.cancel():
+                    del pending[future]
+                    timings[stage.name] = 0.0
+                    skip(stage, f"not started within the {self.deadline:g}s analysis deadline")
+
+        submit_ready()
+        while pending:
+            timed = [stage for stage in pending.values() if stage.timeout is not None]
+            deadlines = [started[stage.name] + stage.timeout for stage in timed if stage.name in started]
+            queued_optional = any(stage.optional and stage.name not in started for stage in pending.values())
+            if run_deadline is not None and (queued_optional or any(stage.optional for stage in waiting)):
+                deadlines.append(run_deadline)
+            timeout = max(0.0, min(deadlines) - time.perf_counter()) if deadlines else None
+            if any(stage.name not in started for stage in timed):
+                # A queued stage's clock starts when a pool thread picks it up
+                timeout = QUEUED_POLL if timeout is None else min(timeout, QUEUED_POLL)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            now = time.perf_counter()
+            for future in done:
+                stage = pending.pop(future)
+                timings[stage.name] = round((now - started.get(stage.name, now)) * 1000, 2)
+                try:
+                    results[stage.name] = future.result()
+                except Exception as e:
+                    if not stage.optional:
+                        raise
+                    skip(stage, f"failed ({e})")
+
+            for future, stage in list(pending.items()):
+                if stage.timeout is not None and stage.name in started and now - started[stage.name] >= stage.timeout:
+                    del pending[future]
+                    if isinstance(executor, StagePool):
+                        executor.detach(future)  # left to finish, no longer holds a pool slot
+                    timings[stage.name] = round((now - started[stage.name]) * 1000, 2)
+                    skip(stage, f"missed its {stage.timeout:g}s deadline")
+
+            if run_deadline is not None and now >= run_deadline:
+                skip_unstarted()
+            submit_ready()
+        return results, timings, skipped
+
+
+_executor: Optional[StagePool] = None
+_executor_lock = threading.Lock()
+
+
+def get_analysis_executor() -> StagePool:
+    """Process-wide pool shared by every pipeline run"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = StagePool(max_workers=settings.analysis_workers, thread_name_prefix="analysis")
+    return _executor
+
+
+def _emotions(text: str):
+    workers = get_model_workers()
+    return workers.call("emotions", text) if workers else analyze_emotions(text)
+
+
+def _entities(text: str):
+    workers = get_model_workers()
+    return workers.call("entities", text) if workers else analyze_entities(text)
+
+
+def _price(text: str):
+    return extract_price(text)
+
+
+def default_stages() -> List[Stage]:
+    stages = [
+        Stage("emotions", _emotions, timeout=settings.analysis_emotion_timeout, optional=True, default=([], "unknown")),
+        Stage("price", _price),
+    ]
+    if settings.analysis_entities:
+        stages.append(Stage("entities", _entities, timeout=settings.analysis_entity_timeout, optional=True, default={}))
+    return stages
+
+
+_pipeline: Optional[AnalysisDAG] = None
+
+
+def get_pipeline() -> AnalysisDAG:
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = AnalysisDAG(default_stages(), deadline=settings.analysis_deadline)
+    return _pipeline
+
 
 def run_analysis_pipeline(user_input):
+    results, _, skipped = get_pipeline().run(user_input)
+    emotions, sentiment = results["emotions"]
+    entities = results.get("entities") or {}
+    key_entities = [item["text"] for items in entities.values() for item in items]
     analysis = {
-        "sentiment": f"{detect_emotion(user_input)}",
-        "intent": "price_negotiation",                              # add this model (not trained yet) "f{negotiation_context(user_input)}"   
-        "key_entities": ["price", "deal"],
-        "analysis": f"User is discussing price points around {user_input}"
+        "sentiment": f"{sentiment}",
+        "intent": "price_negotiation",                              # add this model (not trained yet) "f{negotiation_context(user_input)}"
+        "key_entities": key_entities or ["price", "deal"],
+        "analysis": f"User is discussing price points around {user_input}",
+        "emotions": emotions,
+        "entities": entities,
+        "offer": results["price"],
+        "skipped": skipped,
         }
-    return analysis 
+    return analysis
+
+
+def warmup_analysis():
+    """Load the models now: in the worker processes when MODEL_WORKERS is set, else in this one"""
+    workers = get_model_workers()
+    if workers:
+        workers.warmup()
+    else:
+        warmup_models()
+
+
+def analysis_complete(analysis: Dict) -> bool:
+    """Only complete results are cached; a skipped stage gets another chance next time"""
+    return not analysis.get("skipped")
+
 
-    
 # if __name__ == "__main__":
 #     print(run_analysis_pipeline("I can offer $10,000 for the truck load, but only if you include a 6-month warranty."))
@@ -0,0 +1,106 @@
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional
+
+# ==================================================
+# STRATEGY ENGINE (table-driven counter-offers)
+# ==================================================
+# A strategy is a row of numbers, not an if-chain: how far towards max_price
+# to counter when the offer is above target, how far above target when it is
+# below, and when to simply accept. The guidance given to the LLM then
+# carries a concrete counter price computed from NegotiationParameters.
+
+class Decision(NamedTuple):
+    action: str             # "accept" or "counter"
+    offer: float
+    counter_price: float
+    guidance: str
+
+
+class Strategy:
+    """Counter-offer rule. Subclass and override counter_offer for non-linear strategies."""
+
+    def __init__(
+        self,
+        name: str,
+        above_target_push: float,
+        below_target_anchor: float,
+        accept_at: float = 1.0,
+        above_template: str = (
+            "The user is offering {offer:g}, above our target of {target:g}. "
+            "Push for more: counter at {counter:g}, closer to our maximum of {max:g}."
+        ),
+        below_template: str = (
+            "The user is offering {offer:g}, below our target of {target:g}. "
+            "Counter firmly at {counter:g}."
+        ),
+        accept_template: str = "The user is offering {offer:g}, which meets our goal. Accept the deal at {offer:g}."
+    ):
+        self.name = name
+        self.above_target_push = above_target_push      # fraction of the gap offer -> max_price
+        self.below_target_anchor = below_target_anchor  # fraction of the gap target -> max_price
+        self.accept_at = accept_at                      # fraction of the way target -> max_price
+        self.above_template = above_template
+        self.below_template = below_template
+        self.accept_template = accept_template
+
+    def counter_offer(self, offer: float, params: Dict) -> Decision:
+        target, max_price, min_price = params["target_price"], params["max_price"], params["min_price"]
+        accept_price = target + (max_price - target) * self.accept_at
+        values = {"offer": offer, "target": target, "max": max_price}
+
+        if offer >= accept_price:
+            return Decision("accept", offer, offer, self.accept_template.format(counter=offer, **values))
+
+        if offer > target:
+            counter = offer + (max_price - offer) * self.above_target_push
+            template = self.above_template
+        else:
+            counter = target + (max_price - target) * self.below_target_anchor
+            template = self.below_template
+
+        # Never counter below the offer on the table or outside our limits
+        counter = min(max(round_price(counter), offer, min_price), max_price)
+        return Decision("counter", offer, counter, template.format(counter=counter, **values))
+
+
+def round_price(value: float) -> float:
+    """Round to a number a person would say: whole units, steps of 5 from 100 up"""
+    if value >= 100:
+        return float(round(value / 5) * 5)
+    return float(round(value))
+
+
+STRATEGIES: Dict[str, Strategy] = {}
+
+
+def register_strategy(strategy: Strategy):
+    STRATEGIES[strategy.name] = strategy
+    _plan.cache_clear()
+
+
+@lru_cache(maxsize=1024)
+def _plan(strategy_name: str, target: float, max_price: float, min_price: float, offer: float) -> Optional[Decision]:
+    strategy = STRATEGIES.get(strategy_name)
+    if strategy is None:
+        return None
+    return strategy.counter_offer(offer, {"target_price": target, "max_price": max_price, "min_price": min_price})
+
+
+def counter_offer(params: Dict, offer: float) -> Optional[Decision]:
+    """Decision for this offer under the session's strategy; None for unknown strategies"""
+    return _plan(
+        params.get("negotiation_strategy", "standard"),
+        float(params["target_price"]),
+        float(params["max_price"]),
+        float(params["min_price"]),
+        float(offer)
+    )
+
+
+# Built-in strategies:  name   above_target_push  below_target_anchor  accept_at
+for _row in (
+    ("standard",   0.5,  0.0,  1.0),
+    ("aggressive", 0.8,  0.5,  1.0),
+    ("flexible",   0.25, 0.0,  0.5),
+):
+    register_strategy(Strategy(*_row))
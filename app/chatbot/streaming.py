@@ -0,0 +1,118 @@
+import json
+import time
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, Optional
+
+# ==================================================
+# TOKEN STREAMING HELPERS
+# ==================================================
+
+class TurnMetrics:
+    """Wall-clock timings for one chat turn (time-to-first-token, end-to-end latency) plus Ollama's token counts."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.tokens = 0
+        # From the final stream chunk. prompt_tokens only counts tokens that had to be
+        # prefilled, so it drops when the server reuses a cached prompt prefix.
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.prompt_eval_ms: Optional[float] = None
+
+    def on_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += 1
+
+    def on_done(self, chunk: Dict):
+        self.prompt_tokens = chunk.get("prompt_eval_count", self.prompt_tokens)
+        self.completion_tokens = chunk.get("eval_count", self.completion_tokens)
+        if "prompt_eval_duration" in chunk:
+            self.prompt_eval_ms = round(chunk["prompt_eval_duration"] / 1e6, 1)  # ns
+
+    def finish(self) -> Dict:
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+        return self.as_dict()
+
+    def as_dict(self) -> Dict:
+        end = self.finished_at or time.perf_counter()
+        return {
+            "ttft_ms": round((self.first_token_at - self.started) * 1000, 1) if self.first_token_at else None,
+            "total_ms": round((end - self.started) * 1000, 1),
+            "tokens": self.tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "prompt_eval_ms": self.prompt_eval_ms,
+        }
+
+
+def parse_stream_line(line) -> Optional[Dict]:
+    """Decode one NDJSON line of an Ollama /api/chat stream, None if it isn't valid JSON"""
+    if not line:
+        return None
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        print(f"\n[Error decoding JSON in stream: {e}]")
+        return None
+
+
+def chunk_content(chunk) -> str:
+    """The content token of a decoded chunk, "" for anything without one.
+
+    Ollama reports failures mid-stream as {"error": "..."} chunks; those are
+    logged and skipped, as is any chunk whose "message" isn't an object.
+    """
+    if not isinstance(chunk, dict):
+        return ""
+    if "error" in chunk:
+        print(f"\n[Error in stream: {chunk['error']}]")
+        return ""
+    message = chunk.get("message")
+    if not isinstance(message, dict):
+        return ""
+    content = message.get("content")
+    return content if isinstance(content, str) else ""
+
+
+def iter_stream_tokens(lines: Iterable, metrics: Optional[TurnMetrics] = None) -> Iterator[str]:
+    """Yield content tokens from the stream lines as soon as each one arrives"""
+    for line in lines:
+        chunk = parse_stream_line(line)
+        if chunk is None:
+            continue
+        content = chunk_content(chunk)
+        if content:
+            if metrics:
+                metrics.on_token()
+            yield content
+        if isinstance(chunk, dict) and chunk.get("done"):
+            if metrics:
+                metrics.on_done(chunk)
+            break
+
+
+async def aiter_stream_tokens(lines: AsyncIterable, metrics: Optional[TurnMetrics] = None) -> AsyncIterator[str]:
+    """Async twin of iter_stream_tokens, for httpx `response.aiter_lines()`"""
+    async for line in lines:
+        chunk = parse_stream_line(line)
+        if chunk is None:
+            continue
+        content = chunk_content(chunk)
+        if content:
+            if metrics:
+                metrics.on_token()
+            yield content
+        if isinstance(chunk, dict) and chunk.get("done"):
+            if metrics:
+                metrics.on_done(chunk)
+            break
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -1,21 +1,45 @@
-from backend.emotion_agent import EmotionAnalyzer
+from app.chatbot.backend.emotion_agent import EmotionAnalyzer, DEFAULT_EMOTION_MODEL
+from app.chatbot.backend.finance_agent import FinanceAnalyzer, DEFAULT_FINANCE_MODEL
+from app.chatbot.backend.model_registry import registry
+from app.core.config import settings
 
-# from app.chatbot.backend.emotion_agent import EmotionAnalyzer
-# from app.chatbot.backend.finance_agent import FinanceAnalyzer
+# from backend.emotion_agent import EmotionAnalyzer
 # from app.chatbot.backend.context_agent import NegotiationContext
 
 # ----------------------------------------
 # TOOL 1: Emotion Detection
 # ----------------------------------------
 
+def analyze_emotions(context: str, threshold: float = 0.6):
+    """Detected emotions (list of {emotion, confidence}) plus their one-line summary."""
+    # Cheap per call: the model comes from the shared registry, only the counters are new.
+    analyzer = EmotionAnalyzer(confidence_threshold=threshold)
+    detected = analyzer.analyze_text(context)
+    return detected, analyzer.summarize_emotions()
+
+
 def detect_emotion(context: str, threshold: float = 0.6):
     """Detects emotions in negotiation-related messages."""
-    analyzer = EmotionAnalyzer(confidence_threshold=threshold)
-    analyzer.analyze_text(context)
-    return analyzer.summarize_emotions()
+    return analyze_emotions(context, threshold)[1]
+
+
+def warmup_models():
+    """Load the models used by the tools so the first chat turn doesn't pay for it."""
+    models = [("text-classification", DEFAULT_EMOTION_MODEL, {"return_all_scores": True, "engine": settings.model_engine})]
+    if settings.analysis_entities:
+        models.append(("ner", DEFAULT_FINANCE_MODEL, {"aggregation_strategy": "simple", "engine": settings.model_engine}))
+    registry.warmup(models)
+
+# ----------------------------------------
+# TOOL 2: Financial Entities
+# ----------------------------------------
+
+def analyze_entities(context: str, threshold: float = 0.85):
+    """Finance entities in the message, grouped by type ({type: [{text, confidence}]})."""
+    return FinanceAnalyzer(confidence_threshold=threshold).analyze_text("", context)
 
 # ----------------------------------------
-# TOOL 2: Negotiation Context
+# TOOL 3: Negotiation Context
 # ----------------------------------------
 
 # def negotiation_context(text: str):
@@ -0,0 +1,156 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import requests
+
+from app.chatbot.http_client import get_http_session, request_timeout
+from app.core.config import settings
+
+# ==================================================
+# WRITE-BEHIND MESSAGE PERSISTENCE (remote bot)
+# ==================================================
+# Chat messages are queued per session and written by a background thread,
+# so a turn never waits on the API. A session's queue is flushed as one
+# POST /negotiations/{id}/messages/batch once it holds `max_batch` messages
+# or its oldest message is `max_delay_ms` old, which turns the two writes of
+# a turn into one request. Failed writes are retried with backoff, keeping
+# their order; 4xx answers (e.g. the session expired) drop the batch.
+# Delivery is at-least-once: a retry after a lost response can repeat a batch.
+
+
+class MessageWriter:
+    def __init__(
+        self,
+        api_url: str,
+        http_session: Optional[requests.Session] = None,
+        max_batch: Optional[int] = None,
+        max_delay_ms: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff: float = 0.5
+    ):
+        self.api_url = api_url
+        self.http = http_session or get_http_session()
+        self.max_batch = max_batch or settings.write_behind_batch_size
+        self.max_delay = (settings.write_behind_delay_ms if max_delay_ms is None else max_delay_ms) / 1000.0
+        self.max_retries = settings.write_behind_retries if max_retries is None else max_retries
+        self.backoff = backoff
+
+        # session_id -> [messages, first queued at, failed attempts, not before]
+        self._pending: "OrderedDict[str, List]" = OrderedDict()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+        # Counters, handy to check that batching happens
+        self.requests = 0
+        self.written = 0
+        self.dropped = 0
+
+    def enqueue(self, session_id: str, message: Dict):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MessageWriter is closed")
+            entry = self._pending.get(session_id)
+            if entry is None:
+                self._pending[session_id] = [[message], time.monotonic(), 0, 0.0]
+            else:
+                entry[0].append(message)
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(len(entry[0]) for entry in self._pending.values()) + self._in_flight
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything queued now and wait for it; False if still pending after `timeout`"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            for entry in self._pending.values():
+                entry[1] = 0.0  # due immediately
+            self._cond.notify()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Flush what is queued, then stop the worker"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+
+    def _next_due(self):
+        """(session_id, entry) ready to write, else (None, seconds until the next one is due)"""
+        now = time.monotonic()
+        wait = None
+        for session_id, entry in self._pending.items():
+            messages, queued_at, _, not_before = entry
+            due = max(not_before, queued_at + self.max_delay) if len(messages) < self.max_batch else not_before
+            if due <= now:
+                return session_id, entry
+            wait = due - now if wait is None else min(wait, due - now)
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not self._pending:
+                        return
+                    session_id, entry = self._next_due()
+                    if session_id is not None:
+                        break
+                    self._cond.wait(entry)
+                del self._pending[session_id]
+                messages, _, attempts, _ = entry
+                batch, rest = messages[:self.max_batch], messages[self.max_batch:]
+                if rest:
+                    self._pending[session_id] = [rest, 0.0, 0, 0.0]
+                    self._pending.move_to_end(session_id, last=False)
+                self._in_flight += len(batch)
+
+            ok, retry = self._post(session_id, batch)
+
+            with self._cond:
+                self._in_flight -= len(batch)
+                if ok:
+                    self.written += len(batch)
+                elif retry and attempts < self.max_retries:
+                    # Back to the front of the session's queue, ahead of anything queued since
+                    queued = self._pending.pop(session_id, [[], 0.0, 0, 0.0])
+                    delay = self.backoff * (2 ** attempts)
+                    self._pending[session_id] = [batch + queued[0], 0.0, attempts + 1, time.monotonic() + delay]
+                    self._pending.move_to_end(session_id, last=False)
+                else:
+                    self.dropped += len(batch)
+                    print(f"Dropped {len(batch)} messages for session {session_id} after {attempts + 1} attempts")
+                self._cond.notify_all()
+
+    def _post(self, session_id: str, batch: List[Dict]):
+        """(written, worth retrying)"""
+        self.requests += 1
+        try:
+            response = self.http.post(
+                f"{self.api_url}/negotiations/{session_id}/messages/batch",
+                json=batch,
+                timeout=request_timeout()
+            )
+        except requests.RequestException as e:
+            print(f"Saving messages failed: {e}")
+            return False, True
+        if response.status_code < 400:
+            return True, False
+        print(f"Saving messages failed: {response.status_code} {response.text}")
+        return False, response.status_code >= 500
@@ -6,8 +6,61 @@ class Settings(BaseSettings):
     redis_host: str = os.getenv("REDIS_HOST", "localhost")
     redis_port: int = int(os.getenv("REDIS_PORT", 6379))
     redis_password: str = os.getenv("REDIS_PASSWORD", "")
+    redis_max_connections: int = int(os.getenv("REDIS_MAX_CONNECTIONS", 100))
+    redis_socket_timeout: float = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5.0))
+    redis_connect_timeout: float = float(os.getenv("REDIS_CONNECT_TIMEOUT", 2.0))
+    redis_pool_timeout: float = float(os.getenv("REDIS_POOL_TIMEOUT", 5.0))  # wait for a free connection
+    redis_health_check_interval: int = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+    redis_backend: str = os.getenv("REDIS_BACKEND", "single")  # single | cluster | sharded (app.db.backends)
+    redis_nodes: str = os.getenv("REDIS_NODES", "")  # host:port,... cluster seeds or shards; default REDIS_HOST:REDIS_PORT
+    ollama_host: str = os.getenv("OLLAMA_HOST", "localhost")
+    ollama_port: int = int(os.getenv("OLLAMA_PORT", 11434))
+    ollama_model: str = os.getenv("OLLAMA_MODEL", "mistral:latest")
+    ollama_keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # keeps the model + prompt cache loaded; "" = server default
+    prompt_history_messages: int = int(os.getenv("PROMPT_HISTORY_MESSAGES", 0))  # >0 resends recent turns (multi-turn mode)
+    history_token_budget: int = int(os.getenv("HISTORY_TOKEN_BUDGET", 1024))  # verbatim history per prompt; older turns are summarized
+    ollama_hosts: str = os.getenv("OLLAMA_HOSTS", "")  # "gpu1:11434,gpu2:11434" enables the backend pool
+    ollama_max_concurrency: int = int(os.getenv("OLLAMA_MAX_CONCURRENCY", 4))  # per backend
+    ollama_failure_threshold: int = int(os.getenv("OLLAMA_FAILURE_THRESHOLD", 3))
+    ollama_ejection_seconds: float = float(os.getenv("OLLAMA_EJECTION_SECONDS", 30.0))
+    ollama_health_check_interval: float = float(os.getenv("OLLAMA_HEALTH_CHECK_INTERVAL", 10.0))
+    http_pool_connections: int = int(os.getenv("HTTP_POOL_CONNECTIONS", 10))  # distinct hosts kept pooled
+    http_pool_maxsize: int = int(os.getenv("HTTP_POOL_MAXSIZE", 100))  # connections per host
+    http_connect_timeout: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.0))
+    http_read_timeout: float = float(os.getenv("HTTP_READ_TIMEOUT", 120.0))
+    http_retries: int = int(os.getenv("HTTP_RETRIES", 3))
+    http_backoff_factor: float = float(os.getenv("HTTP_BACKOFF_FACTOR", 0.3))
+    analysis_cache_size: int = int(os.getenv("ANALYSIS_CACHE_SIZE", 1024))
+    analysis_cache_ttl: float = float(os.getenv("ANALYSIS_CACHE_TTL", 3600))
+    analysis_cache_policy: str = os.getenv("ANALYSIS_CACHE_POLICY", "lru")  # lru | lfu
+    analysis_cache_redis: bool = os.getenv("ANALYSIS_CACHE_REDIS", "false").lower() in ("1", "true", "yes")
+    analysis_workers: int = int(os.getenv("ANALYSIS_WORKERS", 4))  # threads running analysis stages concurrently
+    analysis_emotion_timeout: float = float(os.getenv("ANALYSIS_EMOTION_TIMEOUT", 2.0))  # seconds, then skipped
+    analysis_entity_timeout: float = float(os.getenv("ANALYSIS_ENTITY_TIMEOUT", 1.0))
+    analysis_deadline: float = float(os.getenv("ANALYSIS_DEADLINE", 3.0))  # per message, time queued for a thread included
+    analysis_entities: bool = os.getenv("ANALYSIS_ENTITIES", "true").lower() in ("1", "true", "yes")  # finance NER stage
+    model_workers: str = os.getenv("MODEL_WORKERS", "")  # "" in-process | "local" own worker pool | host:port or socket path of a shared one
+    model_worker_processes: int = int(os.getenv("MODEL_WORKER_PROCESSES", 0))  # 0 = one per core
+    model_worker_threads: int = int(os.getenv("MODEL_WORKER_THREADS", 1))  # torch threads per worker
+    model_worker_engine: str = os.getenv("MODEL_WORKER_ENGINE", "torch-mmap")  # weights shared between workers
+    model_worker_timeout: float = float(os.getenv("MODEL_WORKER_TIMEOUT", 30.0))
+    model_worker_authkey: str = os.getenv("MODEL_WORKER_AUTHKEY", "")  # required with a host:port / socket MODEL_WORKERS
+    model_engine: str = os.getenv("MODEL_ENGINE", "torch")  # torch | torch-mmap | onnx | onnx-int8
+    onnx_cache_dir: str = os.getenv("ONNX_CACHE_DIR", ".onnx_cache")
+    warmup_on_startup: bool = os.getenv("WARMUP_ON_STARTUP", "false").lower() in ("1", "true", "yes")  # load models before serving
+    onnx_threads: int = int(os.getenv("ONNX_THREADS", 0))  # 0 = onnxruntime default
     ai_api_key: str = os.getenv("AI_API_KEY", "")
     session_ttl: int = 86400  # 24 hours
+    session_codec: str = os.getenv("SESSION_CODEC", "orjson")  # json | orjson | msgpack
+    session_cache: str = os.getenv("SESSION_CACHE", "pubsub")  # off | pubsub | keyspace (how other workers' writes invalidate it)
+    session_cache_size: int = int(os.getenv("SESSION_CACHE_SIZE", 1024))  # sessions per API worker
+    session_cache_max_messages: int = int(os.getenv("SESSION_CACHE_MAX_MESSAGES", 500))  # longer sessions aren't cached
+    session_cache_ttl: float = float(os.getenv("SESSION_CACHE_TTL", 60.0))
+    write_behind: bool = os.getenv("WRITE_BEHIND", "true").lower() in ("1", "true", "yes")  # remote bot saves messages in the background
+    write_behind_batch_size: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 20))
+    write_behind_delay_ms: float = float(os.getenv("WRITE_BEHIND_DELAY_MS", 200))  # max time a message waits for company
+    write_behind_retries: int = int(os.getenv("WRITE_BEHIND_RETRIES", 5))
+    bulk_max_items: int = int(os.getenv("BULK_MAX_ITEMS", 1000))
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,37 @@
+import importlib
+import threading
+from types import ModuleType
+from typing import Optional
+
+# ==================================================
+# LAZY MODULE IMPORTS
+# ==================================================
+# `transformers = LazyModule("transformers")` binds a placeholder that imports
+# the real module on first attribute access, so heavy ML libraries are only
+# paid for by processes that actually run a model.
+# (importlib's LazyLoader can't be used: transformers swaps its own module
+# object into sys.modules while loading, which LazyLoader rejects.)
+
+
+class LazyModule:
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}' ({'loaded' if self.loaded else 'not loaded'})>"
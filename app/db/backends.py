@@ -0,0 +1,108 @@
+import bisect
+import hashlib
+from typing import Dict, List, Mapping, Sequence, Union
+
+import redis.asyncio as aioredis
+from redis.asyncio.cluster import RedisCluster
+
+# ==================================================
+# STORAGE BACKENDS
+# ==================================================
+# Which Redis node holds a session. Every key of a session carries the {<id>}
+# hash tag (see app.db.session_store), so a session never spans nodes: its Lua
+# scripts and MULTI blocks always run on one node.
+#
+#   single   one Redis (REDIS_HOST / REDIS_PORT)
+#   cluster  Redis Cluster, seeded from REDIS_NODES; the hash tag picks the slot
+#   sharded  plain Redis nodes (REDIS_NODES), session ids spread over them by
+#            client-side consistent hashing
+#
+# Bulk paths group their sessions by node and send one pipeline per node,
+# every node at once. A RedisCluster client already splits a pipeline by node,
+# so the cluster backend looks like a single node to the store.
+#
+# Sessions are not moved when REDIS_NODES changes: with consistent hashing about
+# 1/N of them map to a different shard and read as missing until they expire.
+
+RING_REPLICAS = 500  # points per shard on the ring, smooths the distribution
+
+
+class StorageBackend:
+    """One Redis node (REDIS_BACKEND=single)"""
+    name = "single"
+    legacy_keys = True  # pre-hash-tag `negotiation:<id>` blobs live here and can be migrated
+
+    def __init__(self, nodes: Sequence[aioredis.Redis]):
+        self.nodes = list(nodes)
+
+    def index(self, session_id: str) -> int:
+        return 0
+
+    def node(self, session_id: str) -> aioredis.Redis:
+        return self.nodes[self.index(session_id)]
+
+    def group(self, session_ids: Sequence[str]) -> Dict[int, List[int]]:
+        """node index -> positions in `session_ids` stored there"""
+        groups: Dict[int, List[int]] = {}
+        for position, session_id in enumerate(session_ids):
+            groups.setdefault(self.index(session_id), []).append(position)
+        return groups
+
+    def subscribers(self, keyspace: bool = False) -> List[aioredis.Redis]:
+        """Clients to subscribe on to hear every node's invalidations"""
+        return self.nodes
+
+
+class ClusterBackend(StorageBackend):
+    """Redis Cluster (REDIS_BACKEND=cluster): routing by slot is left to the client"""
+    name = "cluster"
+    legacy_keys = False  # a legacy key hashes to another slot than the session's keys
+
+    def __init__(self, client: RedisCluster):
+        super().__init__([client])
+
+    def subscribers(self, keyspace: bool = False) -> List[aioredis.Redis]:
+        if keyspace:
+            # Keyspace events are node-local; PUBLISH reaches every node of a cluster
+            raise ValueError("Keyspace invalidation is not supported with Redis Cluster, use SESSION_CACHE=pubsub")
+        return self.nodes
+
+
+class HashRing:
+    """Consistent hashing: adding or removing a shard remaps only ~1/N of the keys"""
+
+    def __init__(self, names: Sequence[str], replicas: int = RING_REPLICAS):
+        if not names:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted((self.hash(f"{name}#{i}"), index) for index, name in enumerate(names) for i in range(replicas))
+        self._points = [point for point, _ in points]
+        self._indexes = [index for _, index in points]
+
+    @staticmethod
+    def hash(value: str) -> int:
+        # Stable across processes, unlike hash()
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def index(self, key: str) -> int:
+        position = bisect.bisect(self._points, self.hash(key)) % len(self._points)
+        return self._indexes[position]
+
+
+class ShardedBackend(StorageBackend):
+    """Plain Redis nodes behind a consistent-hash ring (REDIS_BACKEND=sharded)"""
+    name = "sharded"
+    legacy_keys = False  # migrate legacy blobs (app.db.migrate_sessions) before sharding
+
+    def __init__(self, nodes: Mapping[str, aioredis.Redis], replicas: int = RING_REPLICAS):
+        # Placement depends on the node names ("host:port"), not on their order
+        super().__init__(list(nodes.values()))
+        self.names = list(nodes)
+        self.ring = HashRing(self.names, replicas)
+
+    def index(self, session_id: str) -> int:
+        return self.ring.index(session_id)
+
+
+def as_backend(storage: Union[aioredis.Redis, StorageBackend]) -> StorageBackend:
+    """Accept a plain client wherever a backend is expected"""
+    return storage if isinstance(storage, StorageBackend) else StorageBackend([storage])
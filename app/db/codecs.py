@@ -0,0 +1,119 @@
+import json
+from typing import Any, Dict
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib codec
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+# ==================================================
+# SESSION VALUE CODECS
+# ==================================================
+# Every value written to Redis starts with a two byte header:
+#   [codec id][schema version]
+# so a reader can decode values written by any codec (e.g. during a rollout
+# that switches SESSION_CODEC) and refuse data from a newer schema.
+# Values without a header are legacy stdlib JSON. Codec ids stay below 0x20 so a
+# header can never be mistaken for the first character of a JSON document.
+
+SCHEMA_VERSION = 1
+
+
+class CodecError(ValueError):
+    pass
+
+
+class SessionCodec:
+    name = ""
+    codec_id = 0
+
+    def dumps(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+    def encode(self, value: Any) -> bytes:
+        return bytes((self.codec_id, SCHEMA_VERSION)) + self.dumps(value)
+
+
+class JSONCodec(SessionCodec):
+    name = "json"
+    codec_id = 1
+
+    # Reused encoder: json.dumps with custom separators builds a new one per call
+    _encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+    def dumps(self, value: Any) -> bytes:
+        return self._encoder.encode(value).encode("utf-8")
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data.decode("utf-8"))
+
+
+class OrjsonCodec(SessionCodec):
+    name = "orjson"
+    codec_id = 2
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec(SessionCodec):
+    name = "msgpack"
+    codec_id = 3
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+CODECS: Dict[str, SessionCodec] = {}
+_BY_ID: Dict[int, SessionCodec] = {}
+
+
+def register_codec(codec: SessionCodec):
+    CODECS[codec.name] = codec
+    _BY_ID[codec.codec_id] = codec
+
+
+register_codec(JSONCodec())
+if orjson is not None:
+    register_codec(OrjsonCodec())
+if msgpack is not None:
+    register_codec(MsgpackCodec())
+
+
+def get_codec(name: str) -> SessionCodec:
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise CodecError(f"Unknown or unavailable session codec '{name}' (available: {', '.join(CODECS)})")
+
+
+def decode_value(data: bytes) -> Any:
+    """Decode a stored value whatever codec wrote it"""
+    if not data:
+        raise CodecError("Empty value")
+
+    if data[0] >= 0x20:
+        # No header: legacy stdlib json written before codecs existed
+        return json.loads(data)
+
+    codec = _BY_ID.get(data[0])
+    if codec is None:
+        raise CodecError(f"Value written with codec id {data[0]}, which isn't installed here")
+
+    if data[1] > SCHEMA_VERSION:
+        raise CodecError(f"Value has schema version {data[1]}, this build reads up to {SCHEMA_VERSION}")
+    return codec.loads(data[2:])
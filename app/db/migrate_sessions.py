@@ -0,0 +1,20 @@
+import asyncio
+
+from app.core.config import settings
+from app.db.codecs import get_codec
+from app.db.redis_connection import create_async_redis, close_async_redis
+from app.db.session_store import SessionStore
+
+
+async def main():
+    """Convert every legacy `negotiation:<id>` blob to the hash + message list layout"""
+    redis_client = create_async_redis(settings)
+    try:
+        migrated = await SessionStore(redis_client, settings.session_ttl, codec=get_codec(settings.session_codec)).migrate_all()
+        print(f"Migrated {migrated} session(s)")
+    finally:
+        await close_async_redis(redis_client)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
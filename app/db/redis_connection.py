@@ -1,5 +1,12 @@
 import redis
+import redis.asyncio as aioredis
 import os
+from typing import List, Optional, Tuple
+
+from fastapi import Request
+from redis.asyncio.cluster import ClusterNode, RedisCluster
+
+from app.db.backends import ClusterBackend, ShardedBackend, StorageBackend
 
 def get_redis():
     redis_host = os.getenv("REDIS_HOST", "localhost")
@@ -17,3 +24,71 @@ def get_redis():
         yield redis_client
     finally:
         redis_client.close()
+
+
+def create_async_redis(settings, host: Optional[str] = None, port: Optional[int] = None) -> aioredis.Redis:
+    """Build the process-wide async client. Connections are opened lazily and reused."""
+    pool = aioredis.BlockingConnectionPool(
+        host=host or settings.redis_host,
+        port=port or settings.redis_port,
+        password=settings.redis_password or None,
+        max_connections=settings.redis_max_connections,
+        timeout=settings.redis_pool_timeout,
+        socket_timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_connect_timeout,
+        health_check_interval=settings.redis_health_check_interval,
+        decode_responses=False  # session values are codec-encoded bytes
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+def create_async_cluster(settings, nodes: List[Tuple[str, int]]) -> RedisCluster:
+    """Cluster client seeded from `nodes`; it discovers the rest and keeps a pool per node"""
+    return RedisCluster(
+        startup_nodes=[ClusterNode(host, port) for host, port in nodes],
+        password=settings.redis_password or None,
+        max_connections=settings.redis_max_connections,
+        socket_timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_connect_timeout,
+        health_check_interval=settings.redis_health_check_interval,
+        decode_responses=False
+    )
+
+
+def parse_nodes(nodes: str) -> List[Tuple[str, int]]:
+    """"host:port,host:port" -> [(host, port), ...]"""
+    parsed = []
+    for node in nodes.split(","):
+        node = node.strip()
+        if node:
+            host, _, port = node.rpartition(":")
+            parsed.append((host or "localhost", int(port)))
+    return parsed
+
+
+def create_storage_backend(settings) -> StorageBackend:
+    """The backend selected by REDIS_BACKEND (see app.db.backends)"""
+    if settings.redis_backend == "single":
+        return StorageBackend([create_async_redis(settings)])
+    nodes = parse_nodes(settings.redis_nodes) or [(settings.redis_host, settings.redis_port)]
+    if settings.redis_backend == "cluster":
+        return ClusterBackend(create_async_cluster(settings, nodes))
+    if settings.redis_backend == "sharded":
+        return ShardedBackend({f"{host}:{port}": create_async_redis(settings, host, port) for host, port in nodes})
+    raise ValueError(f"Unknown REDIS_BACKEND '{settings.redis_backend}' (choose from single, cluster, sharded)")
+
+
+async def close_async_redis(redis_client: aioredis.Redis):
+    await redis_client.aclose()
+    if not isinstance(redis_client, RedisCluster):
+        await redis_client.connection_pool.disconnect()
+
+
+async def close_storage_backend(backend: StorageBackend):
+    for node in backend.nodes:
+        await close_async_redis(node)
+
+
+async def get_async_redis(request: Request) -> aioredis.Redis:
+    """FastAPI dependency: the pooled client created in the app lifespan (no per-request ping)"""
+    return request.app.state.redis
@@ -0,0 +1,292 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import redis.asyncio as aioredis
+from redis.asyncio.cluster import RedisCluster
+
+from app.db.backends import StorageBackend, as_backend
+from app.models.models import NegotiationParameters, NegotiationSession
+
+# ==================================================
+# LOCAL SESSION CACHE (per API worker)
+# ==================================================
+# A size-bounded LRU of decoded sessions in front of Redis, so hot sessions are
+# served without a network hop. Only complete sessions are cached (every
+# message, at most `max_messages` of them); pages are sliced locally.
+#
+# Other workers' writes reach the cache through Redis:
+#   pubsub    every store mutation PUBLISHes "<meta key> <version> <summarized>"
+#             from inside its Lua script, atomically with the write. An entry
+#             survives only if it is at least that new, so this worker's own
+#             writes (applied to the entry in place) are not thrown away.
+#   keyspace  keyspace notifications on the meta hashes (the server needs
+#             notify-keyspace-events with K and h or A). These also cover
+#             expiry and writers that bypass the store, but every event drops
+#             the entry.
+#
+# Guards against serving stale data:
+#   - while the listener is not subscribed (on every node, with a sharded
+#     backend) the cache is bypassed, and it is cleared on every
+#     (re)subscribe, so no invalidation can be missed;
+#   - a read that started before an invalidation of the same session doesn't
+#     fill the cache with what it read (see token() / put());
+#   - entries expire after `ttl` seconds whatever happens.
+# Between a write in another worker and its invalidation arriving (usually
+# well under a millisecond) that worker's change may not be visible here yet;
+# conditional writes are checked against Redis, so they are never affected.
+
+CHANNEL = "negotiation:invalidate"
+KEYSPACE_PATTERN = "__keyspace@*__:negotiation:{*}:meta"
+MODES = ("pubsub", "keyspace")
+
+# Appended to the store's mutation scripts in pubsub mode, just before the success return
+PUBLISH_LUA = """
+local stamp = redis.call('HMGET', KEYS[1], 'version', 'summarized')
+redis.call('PUBLISH', ARGV_CHANNEL, KEYS[1] .. ' ' .. (stamp[1] or '0') .. ' ' .. (stamp[2] or '0'))
+"""
+
+
+def with_invalidation(script: str, channel: str) -> str:
+    """Insert the PUBLISH before the script's final return"""
+    head, sep, tail = script.rstrip().rpartition("\nreturn ")
+    publish = PUBLISH_LUA.replace("ARGV_CHANNEL", "'" + channel.replace("'", "") + "'")
+    return head + publish + sep.lstrip("\n") + tail + "\n"
+
+
+def session_id_from_key(key: str) -> Optional[str]:
+    """negotiation:{<id>}:meta -> <id>"""
+    start, end = key.find("{"), key.rfind("}")
+    if start < 0 or end < start:
+        return None
+    return key[start + 1:end]
+
+
+class SessionCache:
+    def __init__(self, max_sessions: int = 1024, max_messages: int = 500, ttl: float = 60.0, mode: str = "pubsub", channel: str = CHANNEL):
+        if mode not in MODES:
+            raise ValueError(f"Unknown session cache mode '{mode}' (choose from {', '.join(MODES)})")
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.mode = mode
+        self.channel = channel
+
+        # session_id -> (session, expires at)
+        self._entries: "OrderedDict[str, Tuple[NegotiationSession, float]]" = OrderedDict()
+        # session_id -> (seq, version, summarized) of its last invalidation, bounded;
+        # version is None when the invalidation isn't stamped (delete, keyspace event)
+        self._invalidations: "OrderedDict[str, Tuple[int, Optional[int], int]]" = OrderedDict()
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._floor = 0  # highest seq dropped from _invalidations
+        self._listeners: List[asyncio.Task] = []
+        self._subscribed = set()  # listeners currently subscribed
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def connected(self) -> bool:
+        return bool(self._listeners) and len(self._subscribed) == len(self._listeners)
+
+    # ----------------------------------------
+    # Reads
+    # ----------------------------------------
+
+    def get(self, session_id: str) -> Optional[NegotiationSession]:
+        """The cached session, complete. Treat it as read-only."""
+        if not self.connected:
+            return None
+        entry = self._entries.get(session_id)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._entries[session_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return entry[0]
+
+    def token(self) -> int:
+        """Take before reading from Redis; pass to put() with what was read"""
+        return self._last_seq
+
+    def put(self, session: NegotiationSession, token: int):
+        """Cache a complete session read from Redis, unless it was invalidated since `token`"""
+        if not self.connected or len(session.messages) > self.max_messages:
+            return
+        if len(session.messages) != session.message_count:
+            return
+        invalidation = self._invalidations.get(session.session_id)
+        if invalidation is None:
+            if token < self._floor:
+                return  # can't tell, forgotten
+        elif invalidation[0] > token:
+            seq, version, summarized = invalidation
+            if version is None or (session.version, session.summarized_count) < (version, summarized):
+                return
+        self._store(session)
+
+    def _store(self, session: NegotiationSession):
+        self._entries[session.session_id] = (session, time.monotonic() + self.ttl)
+        self._entries.move_to_end(session.session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    # ----------------------------------------
+    # This worker's writes (applied in place when the entry is exactly one version behind)
+    # ----------------------------------------
+
+    def _advance(self, session_id: str, version: int) -> Optional[NegotiationSession]:
+        self._record(session_id, version, 0)
+        entry = self._entries.pop(session_id, None)
+        if entry is None or entry[0].version != version - 1:
+            return None
+        return entry[0]
+
+    def apply_append(self, session_id: str, version: int, messages: List[Dict], updated_at: str):
+        session = self._advance(session_id, version)
+        if session is None or session.message_count + len(messages) > self.max_messages:
+            return
+        self._store(session.model_copy(update={
+            "messages": session.messages + [dict(m) for m in messages],
+            "message_count": session.message_count + len(messages),
+            "version": version,
+            "updated_at": updated_at,
+        }))
+
+    def apply_parameters(self, session_id: str, version: int, parameters: NegotiationParameters, updated_at: str):
+        session = self._advance(session_id, version)
+        if session is None:
+            return
+        self._store(session.model_copy(update={
+            "parameters": NegotiationParameters.model_construct(**parameters.model_dump()),
+            "version": version,
+            "updated_at": updated_at,
+        }))
+
+    def apply_summary(self, session_id: str, summary: Dict, summarized_count: int):
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        self._record(session_id, entry[0].version, summarized_count)
+        if entry[0].summarized_count < summarized_count:
+            self._entries[session_id] = (entry[0].model_copy(update={"summary": summary, "summarized_count": summarized_count}), entry[1])
+
+    # ----------------------------------------
+    # Invalidation
+    # ----------------------------------------
+
+    def _record(self, session_id: str, version: Optional[int], summarized: int):
+        seq = next(self._seq)
+        self._last_seq = seq
+        self._invalidations[session_id] = (seq, version, summarized)
+        self._invalidations.move_to_end(session_id)
+        while len(self._invalidations) > 4 * self.max_sessions:
+            _, (dropped, _, _) = self._invalidations.popitem(last=False)
+            self._floor = max(self._floor, dropped)
+
+    def invalidate(self, session_id: str, version: Optional[int] = None, summarized: int = 0):
+        """Drop the entry unless it already reflects `version` / `summarized` (None: drop regardless)"""
+        self._record(session_id, version, summarized)
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        if version is None or (entry[0].version, entry[0].summarized_count) < (version, summarized):
+            del self._entries[session_id]
+
+    def clear(self):
+        self._entries.clear()
+        self._invalidations.clear()
+        self._floor = self._last_seq = next(self._seq)
+
+    def _handle(self, message: Dict):
+        channel = message["channel"].decode()
+        if self.mode == "keyspace":
+            session_id = session_id_from_key(channel.partition(":")[2])
+            if session_id:
+                self.invalidate(session_id)
+            return
+        key, _, stamp = message["data"].decode().partition(" ")
+        session_id = session_id_from_key(key)
+        if not session_id:
+            return
+        if stamp:
+            version, _, summarized = stamp.partition(" ")
+            self.invalidate(session_id, int(version), int(summarized or 0))
+        else:
+            self.invalidate(session_id)
+
+    # ----------------------------------------
+    # Listener
+    # ----------------------------------------
+
+    async def _listen(self, listener: int, redis_client: aioredis.Redis, retry_delay: float):
+        while True:
+            if isinstance(redis_client, RedisCluster):
+                try:
+                    # The cluster pubsub picks its node from the slot map, loaded on first command
+                    await redis_client.initialize()
+                except Exception as e:
+                    print(f"Session cache listener error, cache bypassed until it reconnects: {e}")
+                    await asyncio.sleep(retry_delay)
+                    continue
+            pubsub = redis_client.pubsub()
+            try:
+                if self.mode == "keyspace":
+                    await self._check_keyspace_events(redis_client)
+                    await pubsub.psubscribe(KEYSPACE_PATTERN)
+                else:
+                    await pubsub.subscribe(self.channel)
+                # Wait for the confirmation: only then are invalidations guaranteed to arrive
+                while await pubsub.get_message(timeout=1.0) is None:
+                    pass
+                self.clear()
+                self._subscribed.add(listener)
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self._handle(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Session cache listener error, cache bypassed until it reconnects: {e}")
+            finally:
+                self._subscribed.discard(listener)
+                self.clear()
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(retry_delay)
+
+    async def _check_keyspace_events(self, redis_client: aioredis.Redis):
+        try:
+            flags = (await redis_client.config_get("notify-keyspace-events")).get(b"notify-keyspace-events", b"").decode()
+        except Exception:
+            return  # CONFIG disabled (managed Redis): trust the operator
+        if "K" not in flags or not ({"h", "A"} & set(flags)):
+            print(f"Warning: notify-keyspace-events is '{flags}', the session cache won't see other workers' writes")
+
+    async def start(self, storage: Union[aioredis.Redis, StorageBackend], retry_delay: float = 1.0, timeout: float = 5.0):
+        """Start listening for invalidations on every node; waits (up to `timeout`) until subscribed"""
+        if not self._listeners:
+            nodes = as_backend(storage).subscribers(keyspace=self.mode == "keyspace")
+            self._listeners = [asyncio.create_task(self._listen(i, node, retry_delay)) for i, node in enumerate(nodes)]
+        deadline = time.monotonic() + timeout
+        while not self.connected and time.monotonic() < deadline and not any(task.done() for task in self._listeners):
+            await asyncio.sleep(0.01)
+
+    async def stop(self):
+        listeners, self._listeners = self._listeners, []
+        for task in listeners:
+            task.cancel()
+        for task in listeners:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._subscribed.clear()
@@ -0,0 +1,500 @@
+import asyncio
+import json
+from typing import Dict, List, Optional, Tuple, Union
+
+import redis.asyncio as aioredis
+from fastapi import Request
+from redis.asyncio.cluster import ClusterPipeline
+
+from app.db.backends import StorageBackend, as_backend
+from app.db.codecs import SessionCodec, JSONCodec, decode_value
+from app.db.session_cache import SessionCache, with_invalidation
+from app.models.models import NegotiationParameters, NegotiationSession
+
+# ==================================================
+# SESSION STORAGE LAYOUT
+# ==================================================
+#   negotiation:{<id>}:meta      hash  session_id, parameters (codec), created_at, updated_at, status, version,
+#                                      summary (codec), summarized
+#   negotiation:{<id>}:messages  list  one codec-encoded document per message, oldest first
+#   negotiation:{<id>}:analytics hash  emotion / entity counters (app.chatbot.analytics)
+#   negotiation:<id>             legacy single json blob, migrated on first access
+#
+# The {<id>} hash tag keeps every key of a session in the same cluster slot
+# (or shard, see app.db.backends); each call below talks to that one node.
+# With a SessionCache, reads are served from it when possible and writes are
+# applied to it and announced to the other workers (see app.db.session_cache).
+
+LEGACY_PREFIX = "negotiation:"
+
+
+# Every mutation runs server-side in one round-trip: existence check, optional
+# version check, write, version bump and TTL refresh happen atomically. The TTL
+# of the analytics counters (KEYS[3]) is refreshed with the session's, so they
+# don't expire under a session that is only written through the REST API.
+# Return codes: new version, -1 session missing, -2 version mismatch.
+APPEND_MESSAGES_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+if ARGV[3] ~= '' and tonumber(redis.call('HGET', KEYS[1], 'version') or '0') ~= tonumber(ARGV[3]) then return -2 end
+for i = 4, #ARGV do redis.call('RPUSH', KEYS[2], ARGV[i]) end
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('HSET', KEYS[1], 'updated_at', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+return version
+"""
+
+SET_PARAMETERS_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+if ARGV[3] ~= '' and tonumber(redis.call('HGET', KEYS[1], 'version') or '0') ~= tonumber(ARGV[3]) then return -2 end
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('HSET', KEYS[1], 'parameters', ARGV[4], 'updated_at', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+return version
+"""
+
+# Summaries only move forward: a writer that folded fewer messages than the
+# stored summary (a concurrent turn got there first) is ignored. Derived data,
+# so the session version is not bumped. Returns 1 if written.
+SET_SUMMARY_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+if tonumber(redis.call('HGET', KEYS[1], 'summarized') or '0') >= tonumber(ARGV[1]) then return 0 end
+redis.call('HSET', KEYS[1], 'summary', ARGV[2], 'summarized', ARGV[1])
+return 1
+"""
+
+MISSING = -1
+CONFLICT = -2
+
+
+class SessionNotFoundError(Exception):
+    pass
+
+
+class VersionConflictError(Exception):
+    pass
+
+
+def meta_key(session_id: str) -> str:
+    return f"negotiation:{{{session_id}}}:meta"
+
+
+def messages_key(session_id: str) -> str:
+    return f"negotiation:{{{session_id}}}:messages"
+
+
+def analytics_key(session_id: str) -> str:
+    """Per-session analytics counters (see app.chatbot.analytics), deleted with the session"""
+    return f"negotiation:{{{session_id}}}:analytics"
+
+
+def legacy_key(session_id: str) -> str:
+    return f"{LEGACY_PREFIX}{session_id}"
+
+
+def message_range(offset: int, limit: Optional[int]) -> Tuple[int, int]:
+    """Translate offset/limit (negative offset counts from the newest message) into LRANGE bounds"""
+    if limit is None:
+        return offset, -1
+    end = offset + limit - 1
+    if offset < 0 and end >= 0:
+        end = -1
+    return offset, end
+
+
+def page(messages: List[Dict], offset: int, limit: Optional[int]) -> List[Dict]:
+    """The slice of a whole message list that LRANGE would return for offset/limit"""
+    start, end = message_range(offset, limit)
+    count = len(messages)
+    start = start if start >= 0 else max(count + start, 0)
+    end = end if end >= 0 else count + end
+    return messages[start:end + 1] if end >= 0 else []
+
+
+class SessionStore:
+    def __init__(self, storage: Union[aioredis.Redis, StorageBackend], ttl: int, codec: Optional[SessionCodec] = None, max_patch_retries: int = 5, cache: Optional[SessionCache] = None):
+        # Clients must use decode_responses=False: values are codec bytes
+        self.backend = as_backend(storage)
+        self.ttl = ttl
+        self.codec = codec or JSONCodec()
+        self.max_patch_retries = max_patch_retries
+        self.cache = cache
+        self._publish = cache.channel if cache is not None and cache.mode == "pubsub" else None
+        # Scripts are run with client=<the session's node>, which loads them there on first use
+        registry = self.backend.nodes[0]
+        self._append_script = registry.register_script(self._script(APPEND_MESSAGES_LUA))
+        self._set_parameters_script = registry.register_script(self._script(SET_PARAMETERS_LUA))
+        self._set_summary_script = registry.register_script(self._script(SET_SUMMARY_LUA))
+
+    def _script(self, script: str) -> str:
+        return with_invalidation(script, self._publish) if self._publish else script
+
+    def _meta_mapping(self, session: NegotiationSession) -> Dict[str, object]:
+        mapping = {
+            "session_id": session.session_id,
+            "parameters": self.codec.encode(session.parameters.model_dump()),
+            "created_at": session.created_at,
+            "updated_at": session.updated_at,
+            "status": session.status,
+            "version": session.version,
+        }
+        if session.summary:
+            mapping["summary"] = self.codec.encode(session.summary)
+            mapping["summarized"] = session.summarized_count
+        return mapping
+
+    def _queue_create(self, pipe, session: NegotiationSession):
+        pipe.hset(meta_key(session.session_id), mapping=self._meta_mapping(session))
+        pipe.expire(meta_key(session.session_id), self.ttl)
+        if session.messages:
+            pipe.rpush(messages_key(session.session_id), *[self.codec.encode(m) for m in session.messages])
+            pipe.expire(messages_key(session.session_id), self.ttl)
+
+    async def create(self, session: NegotiationSession):
+        async with self.backend.node(session.session_id).pipeline(transaction=True) as pipe:
+            self._queue_create(pipe, session)
+            await pipe.execute()
+
+    async def _per_node(self, session_ids: List[str], queue, raise_on_error: bool = True) -> List[List]:
+        """One pipeline per node, all nodes concurrently.
+
+        `queue(pipe, position)` adds the commands for session_ids[position]; returns
+        the replies of each position's commands, in the order they were queued.
+        """
+        replies: List[List] = [[] for _ in session_ids]
+
+        async def run(index: int, positions: List[int]):
+            async with self.backend.nodes[index].pipeline(transaction=False) as pipe:
+                sizes = []
+                for position in positions:
+                    before = len(pipe)
+                    await queue(pipe, position)
+                    sizes.append(len(pipe) - before)
+                results = await pipe.execute(raise_on_error=raise_on_error)
+            offset = 0
+            for position, size in zip(positions, sizes):
+                replies[position] = results[offset:offset + size]
+                offset += size
+
+        await asyncio.gather(*(run(index, positions) for index, positions in self.backend.group(session_ids).items()))
+        return replies
+
+    async def create_many(self, sessions: List[NegotiationSession]):
+        """Write many new sessions, one pipelined round-trip per node"""
+        async def queue(pipe, position):
+            self._queue_create(pipe, sessions[position])
+
+        await self._per_node([session.session_id for session in sessions], queue)
+
+    def _queue_get(self, pipe, session_id: str, start: int, end: int):
+        pipe.hgetall(meta_key(session_id))
+        pipe.lrange(messages_key(session_id), start, end)
+        pipe.llen(messages_key(session_id))
+
+    def _decode(self, meta: Dict[bytes, bytes], messages: List[bytes], count: int) -> NegotiationSession:
+        # Everything here was written by this store, so skip pydantic validation
+        return NegotiationSession.model_construct(
+            session_id=meta[b"session_id"].decode(),
+            parameters=NegotiationParameters.model_construct(**decode_value(meta[b"parameters"])),
+            messages=[decode_value(m) for m in messages],
+            created_at=meta[b"created_at"].decode(),
+            updated_at=meta[b"updated_at"].decode(),
+            status=meta.get(b"status", b"active").decode(),
+            version=int(meta.get(b"version", 0)),
+            message_count=count,
+            summary=decode_value(meta[b"summary"]) if b"summary" in meta else None,
+            summarized_count=int(meta.get(b"summarized", 0)),
+        )
+
+    def _cached_page(self, session_id: str, offset: int, limit: Optional[int]) -> Optional[NegotiationSession]:
+        session = self.cache.get(session_id) if self.cache else None
+        if session is None:
+            return None
+        return session.model_copy(update={"messages": page(session.messages, offset, limit)})
+
+    def _fill(self, session: NegotiationSession, token: int):
+        """Offer a session read from Redis to the cache (it keeps it if the page read was all of it)"""
+        if self.cache:
+            self.cache.put(session, token)
+
+    async def get(self, session_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[NegotiationSession]:
+        """Load metadata plus one page of messages. Returns None if the session doesn't exist."""
+        cached = self._cached_page(session_id, offset, limit)
+        if cached is not None:
+            return cached
+
+        token = self.cache.token() if self.cache else 0
+        start, end = message_range(offset, limit)
+        async with self.backend.node(session_id).pipeline(transaction=False) as pipe:
+            self._queue_get(pipe, session_id, start, end)
+            meta, messages, count = await pipe.execute()
+
+        if not meta:
+            if not await self.migrate_legacy(session_id):
+                return None
+            return await self.get(session_id, offset, limit)
+
+        session = self._decode(meta, messages, count)
+        self._fill(session, token)
+        return session
+
+    async def get_many(self, session_ids: List[str], offset: int = 0, limit: Optional[int] = None) -> Dict[str, Optional[NegotiationSession]]:
+        """Fetch many sessions, one pipelined round-trip per node; missing ones map to None"""
+        sessions = {}
+        for session_id in session_ids:
+            cached = self._cached_page(session_id, offset, limit)
+            if cached is not None:
+                sessions[session_id] = cached
+        misses = [session_id for session_id in session_ids if session_id not in sessions]
+        if not misses:
+            return {session_id: sessions[session_id] for session_id in session_ids}
+
+        token = self.cache.token() if self.cache else 0
+        start, end = message_range(offset, limit)
+
+        async def queue(pipe, position):
+            self._queue_get(pipe, misses[position], start, end)
+
+        replies = await self._per_node(misses, queue)
+        for session_id, (meta, messages, count) in zip(misses, replies):
+            if meta:
+                sessions[session_id] = self._decode(meta, messages, count)
+                self._fill(sessions[session_id], token)
+            else:
+                # Rare path: legacy blob not migrated yet
+                sessions[session_id] = await self.get(session_id, offset, limit)
+        return {session_id: sessions[session_id] for session_id in session_ids}
+
+    async def _whole(self, session_id: str) -> Tuple[bool, Optional[NegotiationSession]]:
+        """With a cache: (True, session or None if missing) when small enough to cache, else (False, None).
+
+        Lets a point read (parameters, history) fill the cache in one round-trip.
+        """
+        if not self.cache or not self.cache.connected:
+            return False, None
+        session = await self.get(session_id, 0, self.cache.max_messages + 1)
+        if session is None:
+            return True, None
+        if session.message_count > self.cache.max_messages:
+            return False, None
+        return True, session
+
+    async def get_history(self, session_id: str) -> Optional[Tuple[Optional[Dict], int, List[Dict]]]:
+        """(summary, summarized_count, messages not yet summarized) for building a prompt, or None if missing"""
+        whole, session = await self._whole(session_id)
+        if whole:
+            if session is None:
+                return None
+            return session.summary, session.summarized_count, session.messages[session.summarized_count:]
+
+        node = self.backend.node(session_id)
+        summary, summarized = await node.hmget(meta_key(session_id), ["summary", "summarized"])
+        if summary is None and summarized is None and not await self.exists(session_id):
+            return None
+        summarized = int(summarized or 0)
+        messages = await node.lrange(messages_key(session_id), summarized, -1)
+        return (decode_value(summary) if summary else None), summarized, [decode_value(m) for m in messages]
+
+    async def save_summary(self, session_id: str, summary: Dict, summarized_count: int) -> bool:
+        """Store a running summary covering the first `summarized_count` messages. False if a newer one is stored."""
+        result = await self._set_summary_script(
+            keys=[meta_key(session_id)], args=[summarized_count, self.codec.encode(summary)], client=self.backend.node(session_id)
+        )
+        if result == MISSING:
+            raise SessionNotFoundError(session_id)
+        if result == 1 and self.cache:
+            self.cache.apply_summary(session_id, summary, summarized_count)
+        return result == 1
+
+    async def get_parameters(self, session_id: str) -> Optional[NegotiationParameters]:
+        """Just the parameters, without touching the message list"""
+        whole, session = await self._whole(session_id)
+        if whole:
+            return session.parameters if session else None
+
+        node = self.backend.node(session_id)
+        stored = await node.hget(meta_key(session_id), "parameters")
+        if stored is None:
+            if not await self.migrate_legacy(session_id):
+                return None
+            stored = await node.hget(meta_key(session_id), "parameters")
+        return NegotiationParameters.model_construct(**decode_value(stored))
+
+    async def exists(self, session_id: str) -> bool:
+        if self.cache and self.cache.get(session_id) is not None:
+            return True
+        if await self.backend.node(session_id).exists(meta_key(session_id)):
+            return True
+        return await self.migrate_legacy(session_id)
+
+    @staticmethod
+    def _check(result: int, session_id: str) -> int:
+        if result == MISSING:
+            raise SessionNotFoundError(session_id)
+        if result == CONFLICT:
+            raise VersionConflictError(session_id)
+        return result
+
+    @staticmethod
+    def _mutation_keys(session_id: str) -> List[str]:
+        return [meta_key(session_id), messages_key(session_id), analytics_key(session_id)]
+
+    async def _run_mutation(self, script, session_id: str, args: List) -> int:
+        keys = self._mutation_keys(session_id)
+        node = self.backend.node(session_id)
+        result = await script(keys=keys, args=args, client=node)
+        if result == MISSING and await self.migrate_legacy(session_id):
+            result = await script(keys=keys, args=args, client=node)
+        return self._check(result, session_id)
+
+    def _append_args(self, messages: List[Dict], updated_at: str, expected_version: Optional[int]) -> List:
+        args = [self.ttl, updated_at, "" if expected_version is None else expected_version]
+        args.extend(self.codec.encode(m) for m in messages)
+        return args
+
+    async def append_messages(self, session_id: str, messages: List[Dict], updated_at: str, expected_version: Optional[int] = None) -> int:
+        """Atomically append messages and refresh the TTL. Returns the new session version."""
+        version = await self._run_mutation(self._append_script, session_id, self._append_args(messages, updated_at, expected_version))
+        if self.cache:
+            self.cache.apply_append(session_id, version, messages, updated_at)
+        return version
+
+    async def append_many(self, items: List[Tuple[str, List[Dict], Optional[int]]], updated_at: str) -> List:
+        """Append to many sessions, one pipelined round-trip per node.
+
+        `items` are (session_id, messages, expected_version). Each result is the new
+        version, or the SessionNotFoundError / VersionConflictError for that item.
+        """
+        async def queue(pipe, position):
+            session_id, messages, expected_version = items[position]
+            keys = self._mutation_keys(session_id)
+            args = self._append_args(messages, updated_at, expected_version)
+            if isinstance(pipe, ClusterPipeline):
+                # ClusterPipeline blocks evalsha(); the raw command is still routed by its keys
+                pipe.execute_command("EVALSHA", self._append_script.sha, len(keys), *keys, *args)
+            else:
+                await self._append_script(keys=keys, args=args, client=pipe)
+
+        replies = await self._per_node([session_id for session_id, _, _ in items], queue, raise_on_error=False)
+
+        results = []
+        for (session_id, messages, expected_version), (reply,) in zip(items, replies):
+            if reply == MISSING or isinstance(reply, Exception):
+                # Rare paths, retried on their own: legacy blob not migrated yet, or the
+                # script isn't loaded on that node yet (cluster pipelines don't load it)
+                try:
+                    results.append(await self.append_messages(session_id, messages, updated_at, expected_version))
+                except (SessionNotFoundError, VersionConflictError) as e:
+                    results.append(e)
+                continue
+            try:
+                results.append(self._check(reply, session_id))
+                if self.cache:
+                    self.cache.apply_append(session_id, reply, messages, updated_at)
+            except (SessionNotFoundError, VersionConflictError) as e:
+                results.append(e)
+        return results
+
+    async def append_message(self, session_id: str, message: Dict, updated_at: str, expected_version: Optional[int] = None) -> int:
+        return await self.append_messages(session_id, [message], updated_at, expected_version)
+
+    async def update_parameters(self, session_id: str, parameters: NegotiationParameters, updated_at: str, expected_version: Optional[int] = None) -> int:
+        """Replace the parameters in one round-trip. Returns the new session version."""
+        args = [self.ttl, updated_at, "" if expected_version is None else expected_version, self.codec.encode(parameters.model_dump())]
+        version = await self._run_mutation(self._set_parameters_script, session_id, args)
+        if self.cache:
+            self.cache.apply_parameters(session_id, version, parameters, updated_at)
+        return version
+
+    async def patch_parameters(self, session_id: str, changes: Dict, updated_at: str, expected_version: Optional[int] = None) -> Tuple[NegotiationParameters, int]:
+        """Merge a partial update into the stored parameters.
+
+        Optimistic: read parameters + version, merge locally, then write only if the
+        version hasn't moved. On a concurrent write the merge is retried on fresh data,
+        unless the caller pinned `expected_version`, in which case it's a conflict.
+        """
+        for _ in range(self.max_patch_retries):
+            stored, version = await self.backend.node(session_id).hmget(meta_key(session_id), ["parameters", "version"])
+            if stored is None:
+                if not await self.migrate_legacy(session_id):
+                    raise SessionNotFoundError(session_id)
+                continue
+
+            version = int(version or 0)
+            if expected_version is not None and version != expected_version:
+                raise VersionConflictError(session_id)
+
+            merged = NegotiationParameters(**{**decode_value(stored), **changes})
+            try:
+                new_version = await self.update_parameters(session_id, merged, updated_at, expected_version=version)
+                return merged, new_version
+            except VersionConflictError:
+                if expected_version is not None:
+                    raise
+        raise VersionConflictError(session_id)
+
+    async def delete(self, session_id: str) -> bool:
+        keys = [meta_key(session_id), messages_key(session_id), analytics_key(session_id)]
+        if self.backend.legacy_keys:
+            keys.append(legacy_key(session_id))
+        node = self.backend.node(session_id)
+        deleted = await node.delete(*keys)
+        if self._publish:
+            await node.publish(self._publish, meta_key(session_id))
+        if self.cache:
+            self.cache.invalidate(session_id)
+        return deleted > 0
+
+    # ----------------------------------------
+    # Migration from the single-blob layout
+    # ----------------------------------------
+
+    async def migrate_legacy(self, session_id: str) -> bool:
+        """Move a legacy `negotiation:<id>` blob into the hash + list layout, keeping its remaining TTL"""
+        if not self.backend.legacy_keys:
+            return False
+        key = legacy_key(session_id)
+        node = self.backend.node(session_id)
+        async with node.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                blob = await pipe.get(key)
+                if not blob:
+                    return False
+                ttl = await pipe.ttl(key)
+
+                session = NegotiationSession(**json.loads(blob))
+                pipe.multi()
+                pipe.hset(meta_key(session_id), mapping=self._meta_mapping(session))
+                pipe.delete(messages_key(session_id))
+                if session.messages:
+                    pipe.rpush(messages_key(session_id), *[self.codec.encode(m) for m in session.messages])
+                for new_key in (meta_key(session_id), messages_key(session_id)):
+                    pipe.expire(new_key, ttl if ttl > 0 else self.ttl)
+                pipe.delete(key)
+                await pipe.execute()
+                return True
+            except aioredis.WatchError:
+                # Another worker migrated (or rewrote) it at the same time
+                return bool(await node.exists(meta_key(session_id)))
+
+    async def migrate_all(self, batch_size: int = 500) -> int:
+        """Migrate every legacy blob still in Redis. Safe to run while the API is serving."""
+        if not self.backend.legacy_keys:
+            return 0
+        migrated = 0
+        async for key in self.backend.nodes[0].scan_iter(match=f"{LEGACY_PREFIX}*", count=batch_size):
+            session_id = key.decode()[len(LEGACY_PREFIX):]
+            if "{" in session_id:
+                continue  # already new layout
+            if await self.migrate_legacy(session_id):
+                migrated += 1
+        return migrated
+
+
+async def get_session_store(request: Request) -> SessionStore:
+    """FastAPI dependency: store bound to the pooled client created in the app lifespan"""
+    return request.app.state.session_store
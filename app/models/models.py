@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List, Dict
 
 class NegotiationParameters(BaseModel):
@@ -10,6 +10,23 @@ class NegotiationParameters(BaseModel):
     negotiation_strategy: Optional[str] = "standard"
 
 
+class NegotiationParametersPatch(BaseModel):
+    max_price: Optional[float] = None
+    min_price: Optional[float] = None
+    target_price: Optional[float] = None
+    product_id: Optional[str] = None
+    flexibility: Optional[float] = None
+    negotiation_strategy: Optional[str] = None
+
+    @field_validator("max_price", "min_price", "target_price", "product_id")
+    @classmethod
+    def not_null(cls, value):
+        # Omit a field to leave it unchanged; these can't be cleared
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
+
 class NegotiationSession(BaseModel):
     session_id: str
     parameters: NegotiationParameters
@@ -17,3 +34,48 @@ class NegotiationSession(BaseModel):
     created_at: str
     updated_at: str
     status: str = "active"
+    version: int = 0  # bumped on every mutation, usable for conditional updates
+    message_count: int = 0  # total stored, `messages` may be a single page
+    summary: Optional[Dict] = None  # running summary of older turns (app.chatbot.history)
+    summarized_count: int = 0  # messages folded into `summary`
+
+
+class ChatTurn(BaseModel):
+    content: str
+
+
+class SessionSummary(BaseModel):
+    summary: Dict  # app.chatbot.history.HistorySummary.as_dict()
+    summarized_count: int = Field(..., ge=1)  # messages folded into `summary`
+
+
+class BulkFetchRequest(BaseModel):
+    session_ids: List[str]
+    offset: int = 0  # negative counts from the newest, as in GET /{session_id}
+    limit: Optional[int] = Field(None, ge=1)  # page size, all remaining messages if omitted
+
+
+class BulkMessagesItem(BaseModel):
+    session_id: str
+    messages: List[Dict] = Field(..., min_length=1)
+    expected_version: Optional[int] = None
+
+
+class BulkItemResult(BaseModel):
+    session_id: str
+    status: str  # "ok", "not_found" or "conflict"
+    version: Optional[int] = None
+    session: Optional[NegotiationSession] = None
+
+
+class EmotionStat(BaseModel):
+    count: int
+    mean_confidence: float
+
+
+class SessionAnalyticsSummary(BaseModel):
+    session_id: str
+    messages: int
+    emotions: Dict[str, EmotionStat]
+    entities: Dict[str, Dict[str, int]]
+    summary: str
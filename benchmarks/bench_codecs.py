@@ -0,0 +1,72 @@
+"""Compare session codecs on a long negotiation: encode/decode CPU time and bytes stored.
+
+    python -m benchmarks.bench_codecs --messages 500 --rounds 200
+"""
+import argparse
+import json
+import time
+
+from app.db.codecs import CODECS, decode_value
+from app.models.models import NegotiationParameters, NegotiationSession
+
+
+def make_session(n_messages: int) -> NegotiationSession:
+    messages = []
+    for i in range(n_messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"Turn {i}: could we settle around ${800 + i % 50} for the truck load?"})
+    return NegotiationSession(
+        session_id="bench",
+        parameters=NegotiationParameters(max_price=1000, min_price=700, target_price=850, product_id="bench"),
+        messages=messages,
+        created_at="2024-01-01T00:00:00",
+        updated_at="2024-01-01T00:00:00",
+    )
+
+
+def bench_legacy(session: NegotiationSession, rounds: int):
+    """The pre-codec path: one json blob, full pydantic validation on read"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        blob = json.dumps(session.model_dump())
+        NegotiationSession(**json.loads(blob))
+    return (time.perf_counter() - start) / rounds, len(blob.encode())
+
+
+def bench_codec(codec, session: NegotiationSession, rounds: int):
+    """The store path: one value per message plus parameters, trusted reads"""
+    params = session.parameters.model_dump()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encoded = [codec.encode(m) for m in session.messages]
+        encoded_params = codec.encode(params)
+        NegotiationSession.model_construct(
+            session_id=session.session_id,
+            parameters=NegotiationParameters.model_construct(**decode_value(encoded_params)),
+            messages=[decode_value(m) for m in encoded],
+            created_at=session.created_at,
+            updated_at=session.updated_at,
+        )
+    size = sum(len(m) for m in encoded) + len(encoded_params)
+    return (time.perf_counter() - start) / rounds, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    session = make_session(args.messages)
+    print(f"{'codec':<16}{'ms/roundtrip':>14}{'bytes':>10}")
+
+    seconds, size = bench_legacy(session, args.rounds)
+    print(f"{'legacy-blob':<16}{seconds * 1000:>14.3f}{size:>10}")
+
+    for name, codec in CODECS.items():
+        seconds, size = bench_codec(codec, session, args.rounds)
+        print(f"{name:<16}{seconds * 1000:>14.3f}{size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Compare inference engines for the emotion and finance models: latency, throughput, memory and output drift.
+
+    python -m benchmarks.bench_onnx --engines torch,onnx,onnx-int8 --runs 200
+
+Each engine runs in its own subprocess so the RSS numbers aren't polluted by
+the other engines' weights. Outputs are checked against the torch engine and
+the run exits 1 if any engine fails:
+    - every emotion score within --tolerance (1e-3), or --int8-tolerance (5e-2)
+      for quantized engines: int8 weights move probabilities by a few points
+    - the same top emotion label for every corpus message
+    - the same (entity group, word) set from NER for every corpus message
+"""
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CORPUS = [
+    "That price is way too high, I'm really disappointed.",
+    "Great, I'm happy we could agree on $850 per unit!",
+    "Honestly I'm worried about the delivery delays from Shanghai.",
+    "Could you do 10k for the whole shipment?",
+    "We made a 12% profit last quarter, so there's room to move.",
+    "This is frustrating. Your competitor offered $700.",
+    "I appreciate the flexibility, let's close at $780.",
+    "Revenue dropped by 5% in Germany, so our budget is tight.",
+]
+
+
+def rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_worker(engine: str, runs: int, batch: int) -> dict:
+    from app.chatbot.backend.emotion_agent import EmotionAnalyzer
+    from app.chatbot.backend.finance_agent import FinanceAnalyzer
+
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    emotion = EmotionAnalyzer(engine=engine)
+    finance = FinanceAnalyzer(engine=engine)
+    load_s = time.perf_counter() - start
+
+    emotion.analyze_batch(CORPUS, update_counts=False)  # warm up kernels and allocator
+
+    latencies = []
+    for i in range(runs):
+        text = CORPUS[i % len(CORPUS)]
+        start = time.perf_counter()
+        emotion.analyze_text(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    texts = (CORPUS * (batch // len(CORPUS) + 1))[:batch]
+    start = time.perf_counter()
+    for _ in range(max(1, runs // batch)):
+        emotion.analyze_batch(texts, update_counts=False)
+    throughput = max(1, runs // batch) * batch / (time.perf_counter() - start)
+
+    ner_latencies = []
+    entities = []
+    for text in CORPUS:
+        start = time.perf_counter()
+        found = finance.ner(text)
+        ner_latencies.append((time.perf_counter() - start) * 1000)
+        entities.append(sorted({(e["entity_group"], e["word"]) for e in found}))
+
+    return {
+        "engine": engine,
+        "load_s": round(load_s, 2),
+        "rss_mb": round(rss_mb() - base_rss, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "ner_p50_ms": round(statistics.median(ner_latencies), 2),
+        "texts_per_s": round(throughput, 1),
+        "scores": emotion.analyze_batch(CORPUS, update_counts=False).tolist(),
+        "entities": entities,
+    }
+
+
+def spawn(engine: str, runs: int, batch: int) -> dict:
+    with tempfile.NamedTemporaryFile(suffix=".json") as out:
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_onnx", "--worker", engine,
+             "--runs", str(runs), "--batch", str(batch), "--out", out.name],
+            check=True
+        )
+        with open(out.name) as f:
+            return json.load(f)
+
+
+def compare(baseline: dict, result: dict, tolerance: float):
+    """(max abs score diff, top-emotion agreement, NER agreement, reasons it fails)"""
+    if [len(row) for row in baseline["scores"]] != [len(row) for row in result["scores"]]:
+        return float("inf"), 0.0, 0.0, ["emotion labels differ from torch"]
+    max_diff = max(
+        abs(a - b)
+        for row_a, row_b in zip(baseline["scores"], result["scores"])
+        for a, b in zip(row_a, row_b)
+    )
+    top_agree = sum(
+        row_a.index(max(row_a)) == row_b.index(max(row_b))
+        for row_a, row_b in zip(baseline["scores"], result["scores"])
+    ) / len(baseline["scores"])
+    ner_agree = sum(a == b for a, b in zip(baseline["entities"], result["entities"])) / len(baseline["entities"])
+
+    failures = []
+    if max_diff > tolerance:
+        failures.append(f"emotion scores differ by {max_diff:.4f} > {tolerance}")
+    if top_agree < 1.0:
+        failures.append(f"top emotion differs on {1 - top_agree:.0%} of the corpus")
+    if ner_agree < 1.0:
+        failures.append(f"NER entities differ on {1 - ner_agree:.0%} of the corpus")
+    return max_diff, top_agree, ner_agree, failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", default="torch,onnx,onnx-int8")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="max emotion score difference from torch")
+    parser.add_argument("--int8-tolerance", type=float, default=5e-2, help="the same for int8 engines")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.out, "w") as f:
+            json.dump(run_worker(args.worker, args.runs, args.batch), f)
+        return
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    if "torch" not in engines:
+        engines.insert(0, "torch")  # the reference for the equivalence check
+    results = {engine: spawn(engine, args.runs, args.batch) for engine in engines}
+
+    print(f"{'engine':<12}{'load s':>8}{'RSS MB':>9}{'p50 ms':>9}{'p95 ms':>9}{'ner p50':>9}{'texts/s':>10}{'max diff':>10}{'top1':>7}{'ner':>7}")
+    failed = []
+    for engine, result in results.items():
+        tolerance = args.int8_tolerance if engine.endswith("int8") else args.tolerance
+        max_diff, top_agree, ner_agree, failures = compare(results["torch"], result, tolerance)
+        failed.extend(f"{engine}: {failure}" for failure in failures)
+        print(
+            f"{engine:<12}{result['load_s']:>8}{result['rss_mb']:>9}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+            f"{result['ner_p50_ms']:>9}{result['texts_per_s']:>10}{max_diff:>10.4f}{top_agree:>7.0%}{ner_agree:>7.0%}"
+            f"{'  FAIL' if failures else ''}"
+        )
+    for failure in failed:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Price extraction: accuracy on a labelled corpus and per-message cost, against the old first-number regex.
+
+    python -m benchmarks.bench_pricing --rounds 20000
+
+Exits 1 if the extractor gets any corpus message wrong, so it doubles as the
+regression check for app/chatbot/strategy/pricing.py.
+"""
+import argparse
+import re
+import sys
+import time
+
+from app.chatbot.strategy.pricing import extract_price
+from app.chatbot.strategy.strategy_engine import counter_offer
+
+PARAMS = {"max_price": 1000, "min_price": 700, "target_price": 850, "negotiation_strategy": "standard"}
+
+# (message, expected offer or None)
+CORPUS = [
+    ("How about 800?", 800),
+    ("I can offer $10,000 for the truck load, but only if you include a 6-month warranty.", 10000),
+    ("Include a 6-month warranty and we have a deal at 900", 900),
+    ("6-month warranty please", None),
+    ("10k for all of it", 10000),
+    ("I'd pay 1.5k tops", 1500),
+    ("$850.50 is my final offer", 850.5),
+    ("Can you do 2 trucks for 1,800 dollars?", 1800),
+    ("My budget is 900 EUR", 900),
+    ("We want 12% off, so 850", 850),
+    ("Give me 3 days to think, maybe 780", 780),
+    ("Order #12345, price 900", 900),
+    ("That's too expensive", None),
+    ("I need 500 units, what's your best price?", None),
+    ("Let's settle around 875", 875),
+    ("Would you take 2,500 for 3 pallets?", 2500),
+    ("We ordered 40 items last year, now we can pay $720", 720),
+    ("Deliver within 2 weeks and I'll pay 950", 950),
+    ("No more than £900", 900),
+    ("Counter: 810 dollars", 810),
+    ("I can pay 1,2345", None),  # malformed thousands group, not 1234
+    ("Ref 1,2345: we can do 900", 900),
+]
+
+
+def legacy_extract(text):
+    """The original inline logic: first number in the message"""
+    price_mentions = re.findall(r'\$?(\d+(?:\.\d+)?)', text)
+    return float(price_mentions[0]) if price_mentions else None
+
+
+def accuracy(extract):
+    misses = [(text, expected, extract(text)) for text, expected in CORPUS if extract(text) != expected]
+    return 1 - len(misses) / len(CORPUS), misses
+
+
+def per_call_us(fn, rounds):
+    texts = [text for text, _ in CORPUS]
+    start = time.perf_counter()
+    for i in range(rounds):
+        fn(texts[i % len(texts)])
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    extract = lambda text: extract_price(text, reference=PARAMS)
+    legacy_acc, _ = accuracy(legacy_extract)
+    new_acc, misses = accuracy(extract)
+
+    def full_turn(text):
+        price = extract(text)
+        return counter_offer(PARAMS, price) if price is not None else None
+
+    print(f"{'extractor':<22}{'accuracy':>10}{'us/msg':>10}")
+    print(f"{'legacy first-number':<22}{legacy_acc:>10.0%}{per_call_us(legacy_extract, args.rounds):>10.2f}")
+    print(f"{'ranked':<22}{new_acc:>10.0%}{per_call_us(extract, args.rounds):>10.2f}")
+    print(f"{'ranked + strategy':<22}{'':>10}{per_call_us(full_turn, args.rounds):>10.2f}")
+
+    for text, expected, got in misses:
+        print(f"MISS {text!r}: expected {expected}, got {got}")
+    sys.exit(1 if misses else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""LLM backend pool against local stub Ollama servers: slot limits, waiting for a slot, ejection.
+
+    python -m benchmarks.bench_router --backends 3 --max-concurrency 4 --streams 200
+
+Opens more concurrent chat streams through BackendPool.aopen_stream than the
+pool has slots, so most of them wait in aacquire() until release() hands a slot
+on. Reports how long the run took against back-to-back rounds of full slots,
+and checks that no backend exceeded its limit and that every slot came back.
+Then a backend that drops every stream after its first token is put behind a
+chat bot (chatbot_local.NegotiationBot.astream_reply): the bot must release those
+responses as failed, which ejects the backend. Exits 1 if a check fails.
+"""
+import argparse
+import asyncio
+import math
+import sys
+import time
+
+import httpx
+
+from app.chatbot.chatbot_local import NegotiationBot
+from app.chatbot.llm_router import BackendPool
+from app.chatbot.streaming import aiter_stream_tokens
+from benchmarks.stub_ollama import start_stub
+
+PAYLOAD = {"model": "stub", "stream": True, "messages": [{"role": "user", "content": "How about 800?"}]}
+PARAMS = {"max_price": 1000, "min_price": 700, "target_price": 850, "product_id": "bench", "negotiation_strategy": "standard"}
+ANALYSIS = {"sentiment": "neutral", "intent": "negotiate", "key_entities": [], "emotions": []}  # skips the models
+
+
+def url(server) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def consume(pool: BackendPool, client: httpx.AsyncClient, in_flight: dict, peaks: dict) -> bool:
+    """One chat stream straight through the pool; False if it broke off"""
+    response = await pool.aopen_stream(client, PAYLOAD)
+    if response is None:
+        return False
+    backend = response.backend
+    in_flight[backend.base_url] = in_flight.get(backend.base_url, 0) + 1
+    peaks[backend.base_url] = max(peaks.get(backend.base_url, 0), in_flight[backend.base_url])
+    success = True
+    try:
+        async for _ in aiter_stream_tokens(response.aiter_lines()):
+            pass
+    except httpx.HTTPError:
+        success = False
+    finally:
+        in_flight[backend.base_url] -= 1
+        await response.aclose()
+        pool.release_response(response, success)
+    return success
+
+
+async def check_limits(args) -> list:
+    servers = [start_stub(ttft_ms=args.ttft_ms, token_ms=args.token_ms, tokens=args.tokens) for _ in range(args.backends)]
+    pool = BackendPool([url(server) for server in servers], max_concurrency=args.max_concurrency, acquire_timeout=None)
+    slots = args.backends * args.max_concurrency
+    in_flight, peaks = {}, {}
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=slots, max_keepalive_connections=slots)) as client:
+        await asyncio.gather(*(consume(pool, client, in_flight, peaks) for _ in range(slots)))  # warm connections
+        start = time.perf_counter()
+        results = await asyncio.gather(*(consume(pool, client, in_flight, peaks) for _ in range(args.streams)))
+        elapsed = time.perf_counter() - start
+
+    stream_s = (args.ttft_ms + (args.tokens - 1) * args.token_ms) / 1000
+    ideal = math.ceil(args.streams / slots) * stream_s
+    print(f"{args.streams} streams over {slots} slots: {elapsed:.2f}s, back-to-back rounds {ideal:.2f}s ({elapsed / ideal - 1:+.1%})")
+    print("per backend: " + ", ".join(f"{b['total_requests']} requests (peak {peaks.get(b['url'], 0)})" for b in pool.stats()))
+
+    failures = []
+    if not all(results):
+        failures.append(f"{results.count(False)} streams failed")
+    if any(peak > args.max_concurrency for peak in peaks.values()):
+        failures.append(f"a backend exceeded max_concurrency {args.max_concurrency}: {peaks}")
+    if any(b["outstanding"] for b in pool.stats()):
+        failures.append(f"slots not returned: {pool.stats()}")
+    for server in servers:
+        server.shutdown()
+    return failures
+
+
+async def check_ejection(args) -> list:
+    good = start_stub(ttft_ms=args.ttft_ms, token_ms=args.token_ms, tokens=args.tokens)
+    broken = start_stub(ttft_ms=args.ttft_ms, token_ms=args.token_ms, tokens=args.tokens, fail_after=1)
+    threshold = 2
+    pool = BackendPool([url(good), url(broken)], max_concurrency=args.max_concurrency, failure_threshold=threshold, ejection_seconds=600)
+    bot = NegotiationBot(backend_pool=pool)
+    async with httpx.AsyncClient() as client:
+        for _ in range(4 * threshold):
+            try:
+                async for _ in bot.astream_reply("How about 800?", PARAMS, client=client, analysis=ANALYSIS):
+                    pass
+            except httpx.HTTPError:
+                pass  # the broken backend's streams
+
+    good_stats, broken_stats = pool.stats()
+    print(f"broken backend: {broken_stats['total_requests']} requests, {broken_stats['total_failures']} failures, healthy={broken_stats['healthy']}")
+    failures = []
+    if broken_stats["healthy"] or broken_stats["total_failures"] < threshold:
+        failures.append("streams that broke off were released as successes, the broken backend was not ejected")
+    elif broken_stats["total_requests"] > threshold:
+        failures.append(f"the broken backend got {broken_stats['total_requests']} requests, ejection after {threshold} failures")
+    good.shutdown()
+    broken.shutdown()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", type=int, default=3)
+    parser.add_argument("--max-concurrency", type=int, default=4, help="slots per backend")
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--ttft-ms", type=float, default=20)
+    parser.add_argument("--token-ms", type=float, default=2)
+    parser.add_argument("--tokens", type=int, default=16)
+    args = parser.parse_args()
+
+    failures = asyncio.run(check_limits(args)) + asyncio.run(check_ejection(args))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Scaling of the model worker pool: throughput and memory against the number of worker processes.
+
+    python -m benchmarks.bench_workers --workers 1,2,4,8 --requests 400
+    python -m benchmarks.bench_workers --engine torch        # private weights, for comparison
+
+For each pool size the emotion + entity tasks are driven with enough requests
+in flight to keep every worker busy. Memory is reported as RSS (counts shared
+weight pages once per process) and PSS (splits them between the processes
+sharing them), summed over the workers: with the torch-mmap engine PSS should
+grow by little more than activations per added worker.
+"""
+import argparse
+import json
+import time
+
+from app.chatbot.backend.workers import ModelWorkerPool, available_cores
+
+CORPUS = [
+    "That price is way too high, I'm really disappointed.",
+    "Great, I'm happy we could agree on $850 per unit!",
+    "Honestly I'm worried about the delivery delays from Shanghai.",
+    "Could you do 10k for the whole shipment?",
+    "We made a 12% profit last quarter, so there's room to move.",
+    "This is frustrating. Your competitor offered $700.",
+    "I appreciate the flexibility, let's close at $780.",
+    "Revenue dropped by 5% in Germany, so our budget is tight.",
+]
+
+
+def memory_mb(pid: int) -> dict:
+    """RSS and PSS of one process from /proc (Linux)"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                values[name.lower()] = int(rest.split()[0]) / 1024
+    return values
+
+
+def run(workers: int, engine: str, requests: int) -> dict:
+    pool = ModelWorkerPool(workers, engine=engine)
+    start = time.perf_counter()
+    pool.start()
+    load_s = time.perf_counter() - start
+
+    try:
+        # Warm each worker's kernels before timing
+        for future in [pool.submit("emotions", text) for text in CORPUS * workers]:
+            future.result()
+
+        start = time.perf_counter()
+        futures = []
+        for i in range(requests):
+            text = CORPUS[i % len(CORPUS)]
+            futures.append(pool.submit("emotions", text))
+            futures.append(pool.submit("entities", text))
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+
+        memory = [memory_mb(pid) for pid in pool.pids]
+    finally:
+        pool.close()
+
+    return {
+        "workers": workers,
+        "engine": engine,
+        "load_s": round(load_s, 2),
+        "messages_per_s": round(requests / elapsed, 1),
+        "rss_mb": round(sum(m["rss"] for m in memory), 1),
+        "pss_mb": round(sum(m["pss"] for m in memory), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default=None, help="comma-separated pool sizes (default 1,2,4.. up to the core count)")
+    parser.add_argument("--engine", default="torch-mmap")
+    parser.add_argument("--requests", type=int, default=400, help="messages per run (each is an emotion + an entity request)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.workers:
+        sizes = [int(n) for n in args.workers.split(",")]
+    else:
+        sizes = [n for n in (1, 2, 4, 8, 16, 32) if n <= available_cores()]
+
+    results = [run(n, args.engine, args.requests) for n in sizes]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    base = results[0]
+    print(f"{'workers':>8}{'msg/s':>10}{'speedup':>9}{'RSS MB':>10}{'PSS MB':>10}{'PSS/worker':>12}")
+    for r in results:
+        print(
+            f"{r['workers']:>8}{r['messages_per_s']:>10.1f}{r['messages_per_s'] / base['messages_per_s']:>9.2f}"
+            f"{r['rss_mb']:>10.1f}{r['pss_mb']:>10.1f}{r['pss_mb'] / r['workers']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
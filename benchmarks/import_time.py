@@ -0,0 +1,65 @@
+"""Import-time budget check for the API and chatbot entry points (exits 1 when over budget).
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --runs 5 --top 10
+
+Each module is imported in a fresh interpreter under `python -X importtime`;
+the best of --runs cumulative times is compared with its budget. Heavy ML
+libraries must not be imported at all until a model is first used.
+"""
+import argparse
+import subprocess
+import sys
+
+BUDGETS_MS = {
+    "app.api.main": 1500,
+    "app.chatbot.chatbot_local": 1000,
+    "app.chatbot.chatbot_remote": 1000,
+}
+
+FORBIDDEN = ("transformers", "torch", "numpy", "onnxruntime", "optimum")
+
+
+def measure(module: str):
+    """(cumulative ms for `module`, {imported module: cumulative ms}) from one fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1000  # us -> ms
+    return times[module], times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5, help="show the slowest top-level imports of each module")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<30}{'ms':>9}{'budget':>9}")
+    for module, budget in BUDGETS_MS.items():
+        runs = [measure(module) for _ in range(args.runs)]
+        best, times = min(runs, key=lambda run: run[0])
+        heavy = sorted({name.split(".")[0] for name in times} & set(FORBIDDEN))
+
+        over = best > budget
+        failed = failed or over or bool(heavy)
+        print(f"{module:<30}{best:>9.1f}{budget:>9}{'  OVER BUDGET' if over else ''}")
+        if heavy:
+            print(f"    eagerly imports: {', '.join(heavy)}")
+        top_level = {name: ms for name, ms in times.items() if "." not in name and name != module}
+        for name, ms in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"    {name:<26}{ms:>9.1f}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
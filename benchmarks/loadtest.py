@@ -0,0 +1,533 @@
+"""Load test for the API and the chat bots against a stub Ollama, with fakeredis or a local Redis.
+
+    python -m benchmarks.loadtest                                   # every scenario, concurrency 1,8,32
+    python -m benchmarks.loadtest --scenarios stream --concurrency 64 --requests 2000
+    python -m benchmarks.loadtest --redis local --ttft-ms 300 --token-ms 25
+    python -m benchmarks.loadtest --redis local --shards 3           # 3 redis-server processes, REDIS_BACKEND=sharded
+    python -m benchmarks.loadtest --redis local --shards 3 --cluster # the same nodes as a Redis Cluster
+    python -m benchmarks.loadtest --compare benchmarks/results/loadtest-<commit>.json --max-regression 0.2
+
+Scenarios:
+    rest         create / add message / patch parameters / get, each timed separately
+    bulk         POST /bulk, /bulk/messages, /bulk/fetch with BULK_SIZE sessions each
+    stream       POST /{id}/chat/stream (SSE), time-to-first-token and full turn
+    bot-local    chatbot_local.NegotiationBot.stream_message, one bot per worker
+    bot-remote   chatbot_remote.NegotiationBot.send_message, persisting through the API
+
+The app is served by uvicorn in a background thread of this process. Model
+analysis is replaced by a fixed result unless --analysis real is given, so the
+numbers measure the service itself (benchmarks.bench_onnx covers inference).
+With --shards N the sessions are spread over N Redis nodes (in-process
+fakeredis servers, or redis-server processes on free ports with --redis
+local; --cluster joins those into a Redis Cluster). Results, tagged with the
+git commit, are written as JSON for comparison across commits; --compare exits
+1 when any p95 regresses past --max-regression.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import httpx
+
+from benchmarks.stub_ollama import start_stub
+
+SCENARIOS = ("rest", "bulk", "stream", "bot-local", "bot-remote")
+BULK_SIZE = 20  # sessions per bulk request
+PARAMS = {"max_price": 1000, "min_price": 700, "target_price": 850, "product_id": "bench", "negotiation_strategy": "standard"}
+MESSAGES = [
+    "How about 800?",
+    "That's too expensive, I can pay $780 at most.",
+    "Could you include a 6-month warranty if I go to 820?",
+    "Let's settle around 840.",
+]
+FIXED_ANALYSIS = {"sentiment": "neutral", "intent": "negotiate", "key_entities": [], "emotions": []}
+
+
+# ==================================================
+# STATS
+# ==================================================
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(samples_ms):
+    if not samples_ms:
+        return None
+    return {
+        "p50": round(percentile(samples_ms, 50), 2),
+        "p95": round(percentile(samples_ms, 95), 2),
+        "p99": round(percentile(samples_ms, 99), 2),
+        "mean": round(sum(samples_ms) / len(samples_ms), 2),
+        "max": round(max(samples_ms), 2),
+    }
+
+
+class Recorder:
+    """Latency / TTFT samples per operation, safe to share between threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.ttft = {}
+        self.errors = {}
+
+    def add(self, op, latency_ms, ttft_ms=None):
+        with self.lock:
+            self.latency.setdefault(op, []).append(latency_ms)
+            if ttft_ms is not None:
+                self.ttft.setdefault(op, []).append(ttft_ms)
+
+    def error(self, op):
+        with self.lock:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+    def results(self, scenario, concurrency, duration):
+        rows = []
+        for op in sorted(set(self.latency) | set(self.errors)):
+            samples = self.latency.get(op, [])
+            rows.append({
+                "scenario": scenario,
+                "concurrency": concurrency,
+                "op": op,
+                "count": len(samples),
+                "errors": self.errors.get(op, 0),
+                "duration_s": round(duration, 3),
+                "throughput_rps": round(len(samples) / duration, 2) if duration else 0.0,
+                "latency_ms": summarize(samples),
+                "ttft_ms": summarize(self.ttft.get(op, [])),
+            })
+        return rows
+
+
+# ==================================================
+# SERVER UNDER TEST
+# ==================================================
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def free_cluster_port():
+    """A free port whose cluster bus port (+10000) is free too; redis-server caps it at 55535"""
+    while True:
+        port = free_port()
+        if port > 55535:
+            continue
+        try:
+            with socket.socket() as sock:
+                sock.bind(("127.0.0.1", port + 10000))
+            return port
+        except OSError:
+            continue
+
+
+def strip_prefix(asgi_app, prefix):
+    """chatbot_remote calls {api_url}/negotiations/..., the app serves from the root (a proxy strips it in production)"""
+    async def wrapped(scope, receive, send):
+        if scope["type"] in ("http", "websocket") and scope["path"].startswith(prefix):
+            scope = dict(scope, path=scope["path"][len(prefix):] or "/")
+        await asgi_app(scope, receive, send)
+    return wrapped
+
+
+def configure_app(args, stub_port):
+    """Point the app at the stub and pick the Redis backend, before its lifespan runs"""
+    import app.api.main as api
+    from app.core.config import settings
+
+    settings.ollama_host = "127.0.0.1"
+    settings.ollama_port = stub_port
+    settings.ollama_hosts = ""
+    settings.warmup_on_startup = False
+    settings.prompt_history_messages = args.history_messages
+
+    if args.shards:
+        ports = [(free_cluster_port if args.cluster else free_port)() for _ in range(args.shards)]
+        settings.redis_backend = "cluster" if args.cluster else "sharded"
+        settings.redis_nodes = ",".join(f"127.0.0.1:{port}" for port in ports)
+        if args.redis == "local":
+            start_redis_servers(ports, cluster=args.cluster)
+
+    if args.redis == "fake":
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit("--redis fake needs fakeredis (pip install fakeredis), or use --redis local")
+        from app.db import redis_connection
+
+        servers = {}  # one fake server per node address
+
+        async def close_fake(client):
+            await client.aclose()
+
+        def create_fake(_settings, host=None, port=None):
+            server = servers.setdefault((host, port), fakeredis.FakeServer())
+            return fakeredis.aioredis.FakeRedis(server=server, decode_responses=False)
+        redis_connection.create_async_redis = create_fake
+        redis_connection.close_async_redis = close_fake
+
+    if args.analysis == "stub":
+        from app.chatbot import chatbot_local, chatbot_remote
+        for bot_class in (chatbot_local.NegotiationBot, chatbot_remote.NegotiationBot):
+            bot_class.enrich_with_analysis = lambda self, user_input: FIXED_ANALYSIS
+    return api.app
+
+
+def start_redis_servers(ports, cluster=False):
+    """redis-server per port, without persistence; stopped when this process exits.
+
+    With `cluster` the nodes are started in cluster mode and the slots spread over
+    them (redis-cli --cluster create, no replicas).
+    """
+    import atexit
+    import shutil
+    import tempfile
+
+    if shutil.which("redis-server") is None or (cluster and shutil.which("redis-cli") is None):
+        sys.exit("--redis local --shards needs redis-server (and redis-cli for --cluster) on the PATH")
+    workdir = tempfile.mkdtemp(prefix="loadtest-redis-")
+    processes = []
+    for port in ports:
+        command = ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no", "--dir", workdir]
+        if cluster:
+            command += ["--cluster-enabled", "yes", "--cluster-config-file", f"nodes-{port}.conf"]
+        processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+    def stop():
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+    atexit.register(stop)
+
+    for port in ports:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    sys.exit(f"redis-server on port {port} did not start")
+                time.sleep(0.05)
+
+    if cluster:
+        subprocess.run(
+            ["redis-cli", "--cluster", "create", *[f"127.0.0.1:{port}" for port in ports], "--cluster-replicas", "0", "--cluster-yes"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + 30
+        for port in ports:
+            while b"cluster_state:ok" not in subprocess.run(["redis-cli", "-p", str(port), "cluster", "info"], capture_output=True).stdout:
+                if time.monotonic() > deadline:
+                    sys.exit("Redis Cluster did not reach cluster_state:ok")
+                time.sleep(0.1)
+    return processes
+
+
+def start_server(asgi_app, port):
+    import uvicorn
+
+    config = uvicorn.Config(strip_prefix(asgi_app, "/negotiations"), host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            sys.exit("uvicorn did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+# ==================================================
+# SCENARIOS
+# ==================================================
+
+async def run_async(worker, concurrency, requests):
+    """`requests` calls of worker(client, i) spread over `concurrency` tasks"""
+    counter = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        async def loop():
+            for i in counter:
+                await worker(client, i)
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+
+
+def run_threads(worker, concurrency, requests):
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def loop(slot):
+        state = {}
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            worker(state, slot, i)
+        bot = state.get("bot")
+        if hasattr(bot, "close"):
+            bot.close()  # flush the remote bot's queued writes while the server is up
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(loop, range(concurrency)))
+
+
+async def timed(recorder, op, request):
+    start = time.perf_counter()
+    try:
+        response = await request
+        response.raise_for_status()
+    except httpx.HTTPError:
+        recorder.error(op)
+        return None
+    recorder.add(op, (time.perf_counter() - start) * 1000)
+    return response
+
+
+def rest_scenario(base, recorder, concurrency, requests):
+    async def worker(client, i):
+        created = await timed(recorder, "create", client.post(f"{base}/", json=PARAMS))
+        if created is None:
+            return
+        session_id = created.json()["session_id"]
+        message = {"role": "user", "content": MESSAGES[i % len(MESSAGES)]}
+        await timed(recorder, "add_message", client.post(f"{base}/{session_id}/messages", json=message))
+        await timed(recorder, "patch_parameters", client.patch(f"{base}/{session_id}/parameters", json={"target_price": 860}))
+        await timed(recorder, "get", client.get(f"{base}/{session_id}"))
+    asyncio.run(run_async(worker, concurrency, requests))
+
+
+def bulk_scenario(base, recorder, concurrency, requests):
+    async def worker(client, i):
+        created = await timed(recorder, "bulk_create", client.post(f"{base}/bulk", json=[PARAMS] * BULK_SIZE))
+        if created is None:
+            return
+        session_ids = [session["session_id"] for session in created.json()]
+        message = {"role": "user", "content": MESSAGES[i % len(MESSAGES)]}
+        items = [{"session_id": session_id, "messages": [message]} for session_id in session_ids]
+        await timed(recorder, "bulk_messages", client.post(f"{base}/bulk/messages", json=items))
+        await timed(recorder, "bulk_fetch", client.post(f"{base}/bulk/fetch", json={"session_ids": session_ids}))
+    asyncio.run(run_async(worker, concurrency, requests))
+
+
+def stream_scenario(base, recorder, concurrency, requests):
+    sessions = []
+
+    async def setup(client, i):
+        sessions.append((await client.post(f"{base}/", json=PARAMS)).json()["session_id"])
+
+    async def worker(client, i):
+        session_id = sessions[i % len(sessions)]
+        start = time.perf_counter()
+        first_token = None
+        try:
+            async with client.stream("POST", f"{base}/{session_id}/chat/stream", json={"content": MESSAGES[i % len(MESSAGES)]}) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if first_token is None and line == "event: token":
+                        first_token = time.perf_counter()
+                    elif line == "event: error":
+                        raise httpx.HTTPError("error event")
+        except httpx.HTTPError:
+            recorder.error("chat_stream")
+            return
+        end = time.perf_counter()
+        recorder.add("chat_stream", (end - start) * 1000, (first_token - start) * 1000 if first_token else None)
+
+    # About one session per concurrent stream, as in real use
+    asyncio.run(run_async(setup, concurrency, concurrency))
+    asyncio.run(run_async(worker, concurrency, requests))
+
+
+def bot_local_scenario(stub_port, recorder, concurrency, requests):
+    from app.chatbot.chatbot_local import NegotiationBot
+
+    def worker(state, slot, i):
+        if "bot" not in state:
+            state["bot"] = NegotiationBot(model_host="127.0.0.1", model_port=stub_port)
+            state["bot"].create_session(**PARAMS)
+        bot = state["bot"]
+        start = time.perf_counter()
+        tokens = list(bot.stream_message(MESSAGES[i % len(MESSAGES)]))
+        metrics = bot.last_turn_metrics or {}
+        if not tokens or metrics.get("prompt_tokens") is None:
+            recorder.error("stream_message")
+            return
+        recorder.add("stream_message", (time.perf_counter() - start) * 1000, metrics.get("ttft_ms"))
+    run_threads(worker, concurrency, requests)
+
+
+def bot_remote_scenario(base, stub_port, recorder, concurrency, requests):
+    from app.chatbot.chatbot_remote import FALLBACK_REPLY, NegotiationBot
+
+    def worker(state, slot, i):
+        if "bot" not in state:
+            state["bot"] = NegotiationBot(api_url=base, model_host="127.0.0.1", model_port=stub_port)
+            state["bot"].create_session(**PARAMS)
+        bot = state["bot"]
+        start = time.perf_counter()
+        try:
+            reply = bot.send_message(MESSAGES[i % len(MESSAGES)])
+        except Exception:
+            reply = None
+        if not reply or reply == FALLBACK_REPLY:
+            recorder.error("send_message")
+            return
+        recorder.add("send_message", (time.perf_counter() - start) * 1000, (bot.last_turn_metrics or {}).get("ttft_ms"))
+    run_threads(worker, concurrency, requests)
+
+
+def run_scenario(name, base, stub_port, concurrency, requests):
+    recorder = Recorder()
+    start = time.perf_counter()
+    if name == "rest":
+        rest_scenario(base, recorder, concurrency, requests)
+    elif name == "bulk":
+        bulk_scenario(base, recorder, concurrency, requests)
+    elif name == "stream":
+        stream_scenario(base, recorder, concurrency, requests)
+    elif name == "bot-local":
+        bot_local_scenario(stub_port, recorder, concurrency, requests)
+    elif name == "bot-remote":
+        bot_remote_scenario(base, stub_port, recorder, concurrency, requests)
+    return recorder.results(name, concurrency, time.perf_counter() - start)
+
+
+# ==================================================
+# REPORTING
+# ==================================================
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_header():
+    print(f"{'scenario':<12}{'conc':>6} {'op':<18}{'ok':>7}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'ttft50':>9}{'ttft95':>9}")
+
+
+def print_rows(rows):
+    for row in rows:
+        latency = row["latency_ms"] or {}
+        ttft = row["ttft_ms"] or {}
+        print(
+            f"{row['scenario']:<12}{row['concurrency']:>6} {row['op']:<18}{row['count']:>7}{row['errors']:>5}{row['throughput_rps']:>9.1f}"
+            f"{latency.get('p50', float('nan')):>9.1f}{latency.get('p95', float('nan')):>9.1f}{latency.get('p99', float('nan')):>9.1f}"
+            f"{ttft.get('p50', float('nan')):>9.1f}{ttft.get('p95', float('nan')):>9.1f}"
+        )
+
+
+def compare(rows, baseline_path, max_regression):
+    """Print p95 / throughput changes against a saved run; True if any p95 regressed past the threshold"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["scenario"], r["concurrency"], r["op"]): r for r in baseline["results"]}
+    print(f"\nagainst {baseline_path} (commit {baseline['meta']['commit']})")
+    regressed = False
+    for row in rows:
+        old = previous.get((row["scenario"], row["concurrency"], row["op"]))
+        if not old or not old["latency_ms"] or not row["latency_ms"]:
+            continue
+        p95_change = row["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1
+        rps_change = row["throughput_rps"] / old["throughput_rps"] - 1 if old["throughput_rps"] else 0.0
+        flag = ""
+        if p95_change > max_regression:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{row['scenario']:<12}{row['concurrency']:>6} {row['op']:<18} p95 {p95_change:+7.1%}  rps {rps_change:+7.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated levels, each run separately")
+    parser.add_argument("--requests", type=int, default=200, help="operations per scenario and level")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed operations before each scenario")
+    parser.add_argument("--redis", choices=("fake", "local"), default="fake", help="local uses REDIS_HOST / REDIS_PORT (REDIS_BACKEND / REDIS_NODES)")
+    parser.add_argument("--shards", type=int, default=0, help="spread sessions over this many Redis nodes (started here)")
+    parser.add_argument("--cluster", action="store_true", help="with --redis local --shards N (N >= 3): run the nodes as a Redis Cluster")
+    parser.add_argument("--analysis", choices=("stub", "real"), default="stub", help="real loads the emotion / NER / sentiment models")
+    parser.add_argument("--history-messages", type=int, default=0, help="PROMPT_HISTORY_MESSAGES for the run")
+    parser.add_argument("--ttft-ms", type=float, default=150)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--tokens", type=int, default=24)
+    parser.add_argument("--output", help="default: benchmarks/results/loadtest-<commit>-<time>.json")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 increase with --compare (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    if args.cluster and (args.redis != "local" or args.shards < 3):
+        parser.error("--cluster needs --redis local and --shards 3 or more")
+
+    stub = start_stub(ttft_ms=args.ttft_ms, token_ms=args.token_ms, tokens=args.tokens)
+    port = free_port()
+    server, thread = start_server(configure_app(args, stub.server_address[1]), port)
+    base = f"http://127.0.0.1:{port}"
+
+    rows = []
+    print_header()
+    try:
+        # The bots and the API print per turn; keep the report readable
+        with open(os.devnull, "w") as devnull:
+            for scenario in scenarios:
+                for concurrency in levels:
+                    with contextlib.redirect_stdout(devnull):
+                        if args.warmup:
+                            run_scenario(scenario, base, stub.server_address[1], min(concurrency, args.warmup), args.warmup)
+                        results = run_scenario(scenario, base, stub.server_address[1], concurrency, args.requests)
+                    rows.extend(results)
+                    print_rows(results)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        stub.shutdown()
+
+    commit = git_commit()
+    output = args.output or os.path.join("benchmarks", "results", f"loadtest-{commit}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "meta": {
+                "commit": commit,
+                "timestamp": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": vars(args),
+            },
+            "results": rows,
+        }, f, indent=2)
+    print(f"\nresults written to {output}")
+
+    if args.compare and compare(rows, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Stand-in for Ollama's /api/chat: streams a fixed reply as NDJSON with configurable latency.
+
+    python -m benchmarks.stub_ollama --port 11435 --ttft-ms 150 --token-ms 20 --tokens 24
+
+Used by benchmarks.loadtest so the service can be measured without a GPU.
+The final chunk carries prompt_eval_count / eval_count like the real server.
+With --fail-after N the connection is dropped after N tokens, mid-stream.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+REPLY_WORDS = "I can do $900 for the full order if we sign this week, which is already a fair price".split()
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+
+    def log_message(self, *args):
+        pass
+
+    def _write_chunk(self, document):
+        line = (json.dumps(document) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def do_GET(self):
+        # /api/tags, used by the backend pool's health checks
+        body = b'{"models": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(server.ttft)
+        for i in range(server.tokens):
+            if i:
+                time.sleep(server.token_delay)
+            word = REPLY_WORDS[i % len(REPLY_WORDS)]
+            self._write_chunk({"model": request.get("model"), "message": {"role": "assistant", "content": word + " "}, "done": False})
+            if server.fail_after is not None and i + 1 >= server.fail_after:
+                self.close_connection = True  # no terminating chunk: the client sees a broken stream
+                return
+
+        prompt_chars = sum(len(m.get("content", "")) for m in request.get("messages", []))
+        self._write_chunk({
+            "model": request.get("model"),
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "prompt_eval_count": prompt_chars // 4,
+            "eval_count": server.tokens,
+        })
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return  # a client dropped a kept-alive connection
+        super().handle_error(request, client_address)
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, ttft_ms: float = 150, token_ms: float = 20, tokens: int = 24, fail_after: Optional[int] = None) -> ThreadingHTTPServer:
+    """Serve in a daemon thread; the bound port is server.server_address[1]"""
+    server = StubOllamaServer((host, port), StubOllamaHandler)
+    server.daemon_threads = True
+    server.ttft = ttft_ms / 1000
+    server.token_delay = token_ms / 1000
+    server.tokens = tokens
+    server.fail_after = fail_after
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft-ms", type=float, default=150, help="delay before the first token (prefill)")
+    parser.add_argument("--token-ms", type=float, default=20, help="delay between tokens (decode)")
+    parser.add_argument("--tokens", type=int, default=24)
+    parser.add_argument("--fail-after", type=int, default=None, help="drop the connection after this many tokens")
+    args = parser.parse_args()
+
+    server = start_stub(args.host, args.port, args.ttft_ms, args.token_ms, args.tokens, args.fail_after)
+    print(f"stub ollama on http://{args.host}:{server.server_address[1]}/api/chat")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()